@@ -0,0 +1,32 @@
+""" 
+Revision ID: 16da6da3f4d4
+Revises: a8ea4fe4183a
+Create Date: 2025-08-06 18:22:07.240915
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '16da6da3f4d4'
+down_revision = 'a8ea4fe4183a'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('giveaways', sa.Column('draw_seed', sa.String(), nullable=True))
+    op.add_column('giveaways', sa.Column('finished_at', sa.DateTime(), nullable=True))
+    op.create_table('giveaway_winners',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('giveaway_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['giveaway_id'], ['giveaways.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+def downgrade():
+    op.drop_table('giveaway_winners')
+    op.drop_column('giveaways', 'finished_at')
+    op.drop_column('giveaways', 'draw_seed')
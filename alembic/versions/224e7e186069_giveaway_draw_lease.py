@@ -0,0 +1,20 @@
+""" 
+Revision ID: 224e7e186069
+Revises: 67d66554bc59
+Create Date: 2025-08-22 10:18:47.602913
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '224e7e186069'
+down_revision = '67d66554bc59'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('giveaways', sa.Column('draw_started_at', sa.DateTime(), nullable=True))
+
+def downgrade():
+    op.drop_column('giveaways', 'draw_started_at')
@@ -0,0 +1,25 @@
+""" 
+Revision ID: 39cd4d0152ca
+Revises: b50e2aa5dbce
+Create Date: 2025-08-16 10:21:37.284915
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '39cd4d0152ca'
+down_revision = 'b50e2aa5dbce'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('bot_offsets',
+    sa.Column('bot_id', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('last_update_id', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('bot_id')
+    )
+
+def downgrade():
+    op.drop_table('bot_offsets')
@@ -0,0 +1,42 @@
+""" 
+Revision ID: 67d66554bc59
+Revises: a0ffa76cba05
+Create Date: 2025-08-21 16:42:18.305719
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '67d66554bc59'
+down_revision = 'a0ffa76cba05'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Существующие записи остаются с bot_id NULL, их закрепляет за собой основной бот при запуске (tenants.py)
+    op.add_column('giveaways', sa.Column('bot_id', sa.BigInteger(), nullable=True))
+    op.add_column('channels', sa.Column('bot_id', sa.BigInteger(), nullable=True))
+    op.add_column('support_requests', sa.Column('bot_id', sa.BigInteger(), nullable=True))
+    op.drop_constraint('channels_telegram_id_key', 'channels', type_='unique')
+    op.create_unique_constraint('uq_channels_bot_telegram', 'channels', ['bot_id', 'telegram_id'])
+
+    # Незавершенные диалоги получают bot_id 0 и удаляются по истечении STATE_TTL
+    op.add_column('conversation_states', sa.Column('bot_id', sa.BigInteger(), autoincrement=False, nullable=False, server_default='0'))
+    op.alter_column('conversation_states', 'bot_id', server_default=None)
+    op.drop_constraint('conversation_states_pkey', 'conversation_states', type_='primary')
+    op.create_primary_key('conversation_states_pkey', 'conversation_states', ['bot_id', 'chat_id'])
+
+def downgrade():
+    op.drop_constraint('conversation_states_pkey', 'conversation_states', type_='primary')
+    # Первичный ключ по chat_id: остаются диалоги только одного бота
+    op.execute('DELETE FROM conversation_states WHERE bot_id <> (SELECT min(bot_id) FROM conversation_states)')
+    op.drop_column('conversation_states', 'bot_id')
+    op.create_primary_key('conversation_states_pkey', 'conversation_states', ['chat_id'])
+
+    # Не выполнится, если один канал добавлен в нескольких ботах
+    op.drop_constraint('uq_channels_bot_telegram', 'channels', type_='unique')
+    op.create_unique_constraint('channels_telegram_id_key', 'channels', ['telegram_id'])
+    op.drop_column('support_requests', 'bot_id')
+    op.drop_column('channels', 'bot_id')
+    op.drop_column('giveaways', 'bot_id')
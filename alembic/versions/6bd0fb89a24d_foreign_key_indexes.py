@@ -0,0 +1,33 @@
+""" 
+Revision ID: 6bd0fb89a24d
+Revises: d704abeb213a
+Create Date: 2025-08-13 11:42:17.208514
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '6bd0fb89a24d'
+down_revision = 'd704abeb213a'
+branch_labels = None
+depends_on = None
+
+# giveaway_participants.giveaway_id уже покрыт уникальным ограничением (giveaway_id, user_id)
+INDEXES = [
+    ('ix_giveaways_creator_id_id', 'giveaways', ['creator_id', 'id']),
+    ('ix_channels_owner_id_id', 'channels', ['owner_id', 'id']),
+    ('ix_giveaway_channels_giveaway_id', 'giveaway_channels', ['giveaway_id']),
+    ('ix_giveaway_channels_channel_id', 'giveaway_channels', ['channel_id']),
+    ('ix_giveaway_participants_user_id', 'giveaway_participants', ['user_id']),
+]
+
+def upgrade():
+    # CONCURRENTLY не блокирует запись в таблицы, но выполняется вне транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,28 @@
+""" 
+Revision ID: 74ef38910419
+Revises: 16da6da3f4d4
+Create Date: 2025-08-09 11:47:53.618204
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '74ef38910419'
+down_revision = '16da6da3f4d4'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('conversation_states',
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('step', sa.String(), nullable=False),
+    sa.Column('data', sa.Text(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('chat_id')
+    )
+    op.create_index(op.f('ix_conversation_states_updated_at'), 'conversation_states', ['updated_at'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_conversation_states_updated_at'), table_name='conversation_states')
+    op.drop_table('conversation_states')
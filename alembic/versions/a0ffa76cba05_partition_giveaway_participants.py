@@ -0,0 +1,90 @@
+""" 
+Revision ID: a0ffa76cba05
+Revises: 39cd4d0152ca
+Create Date: 2025-08-19 14:06:52.731408
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a0ffa76cba05'
+down_revision = '39cd4d0152ca'
+branch_labels = None
+depends_on = None
+
+# Должно совпадать с models.PARTICIPANT_PARTITIONS
+PARTITIONS = 16
+
+def upgrade():
+    # Запись участников блокируется на время копирования, чтение продолжается
+    op.execute('LOCK TABLE giveaway_participants IN EXCLUSIVE MODE')
+    op.execute("""
+        CREATE TABLE giveaway_participants_new (
+            giveaway_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            joined_at TIMESTAMP WITHOUT TIME ZONE
+        ) PARTITION BY HASH (giveaway_id)
+    """)
+    for remainder in range(PARTITIONS):
+        op.execute(
+            f'CREATE TABLE giveaway_participants_p{remainder} PARTITION OF giveaway_participants_new '
+            f'FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})'
+        )
+    op.execute("""
+        INSERT INTO giveaway_participants_new (giveaway_id, user_id, joined_at)
+        SELECT giveaway_id, user_id, joined_at FROM giveaway_participants
+        WHERE giveaway_id IS NOT NULL AND user_id IS NOT NULL
+    """)
+    op.drop_table('giveaway_participants')
+    op.rename_table('giveaway_participants_new', 'giveaway_participants')
+    # Ограничения и индексы создаются после загрузки: так быстрее, чем поддерживать их при вставке
+    op.create_primary_key('giveaway_participants_pkey', 'giveaway_participants', ['giveaway_id', 'user_id'])
+    op.create_foreign_key(None, 'giveaway_participants', 'giveaways', ['giveaway_id'], ['id'])
+    op.create_foreign_key(None, 'giveaway_participants', 'users', ['user_id'], ['id'])
+    op.create_index('ix_giveaway_participants_user_id', 'giveaway_participants', ['user_id'], unique=False)
+
+    op.create_table('giveaway_participant_archives',
+    sa.Column('giveaway_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('participants', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['giveaway_id'], ['giveaways.id'], ),
+    sa.PrimaryKeyConstraint('giveaway_id')
+    )
+
+def downgrade():
+    # Архив хранится только в сжатом виде: перед откатом участников нужно вернуть в таблицу
+    op.execute("""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM giveaway_participant_archives) THEN
+                RAISE EXCEPTION 'giveaway_participant_archives не пуста: откат потеряет участников завершенных розыгрышей';
+            END IF;
+        END $$
+    """)
+    op.drop_table('giveaway_participant_archives')
+
+    op.execute('LOCK TABLE giveaway_participants IN EXCLUSIVE MODE')
+    op.create_table('giveaway_participants_old',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('giveaway_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('joined_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id', name='giveaway_participants_old_pkey')
+    )
+    op.execute("""
+        INSERT INTO giveaway_participants_old (id, giveaway_id, user_id, joined_at)
+        SELECT row_number() OVER (ORDER BY joined_at, giveaway_id, user_id), giveaway_id, user_id, joined_at
+        FROM giveaway_participants
+    """)
+    op.drop_table('giveaway_participants')
+    op.rename_table('giveaway_participants_old', 'giveaway_participants')
+    op.execute('ALTER TABLE giveaway_participants RENAME CONSTRAINT giveaway_participants_old_pkey TO giveaway_participants_pkey')
+    op.execute('CREATE SEQUENCE giveaway_participants_id_seq OWNED BY giveaway_participants.id')
+    op.execute("SELECT setval('giveaway_participants_id_seq', COALESCE((SELECT MAX(id) FROM giveaway_participants), 0) + 1, false)")
+    op.execute("ALTER TABLE giveaway_participants ALTER COLUMN id SET DEFAULT nextval('giveaway_participants_id_seq')")
+    op.create_foreign_key(None, 'giveaway_participants', 'giveaways', ['giveaway_id'], ['id'])
+    op.create_foreign_key(None, 'giveaway_participants', 'users', ['user_id'], ['id'])
+    op.create_unique_constraint('uq_giveaway_participants_giveaway_user', 'giveaway_participants', ['giveaway_id', 'user_id'])
+    op.create_index('ix_giveaway_participants_user_id', 'giveaway_participants', ['user_id'], unique=False)
@@ -0,0 +1,31 @@
+""" 
+Revision ID: a8ea4fe4183a
+Revises: c0826f6d5582
+Create Date: 2025-08-04 12:10:41.512337
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8ea4fe4183a'
+down_revision = 'c0826f6d5582'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Удаляем дубликаты участия, оставляя самую раннюю запись
+    op.execute("""
+        DELETE FROM giveaway_participants p
+        USING giveaway_participants d
+        WHERE p.giveaway_id = d.giveaway_id
+          AND p.user_id = d.user_id
+          AND p.id > d.id
+    """)
+    op.create_unique_constraint(
+        'uq_giveaway_participants_giveaway_user',
+        'giveaway_participants',
+        ['giveaway_id', 'user_id']
+    )
+
+def downgrade():
+    op.drop_constraint('uq_giveaway_participants_giveaway_user', 'giveaway_participants', type_='unique')
@@ -0,0 +1,39 @@
+""" 
+Revision ID: b50e2aa5dbce
+Revises: 6bd0fb89a24d
+Create Date: 2025-08-14 15:08:51.630127
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b50e2aa5dbce'
+down_revision = '6bd0fb89a24d'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('giveaways', sa.Column('participants_count', sa.Integer(), server_default='0', nullable=False))
+    # Однократный подсчет существующих участников; дальше счетчик ведет бот
+    op.execute(
+        'UPDATE giveaways SET participants_count = counts.total '
+        'FROM (SELECT giveaway_id, COUNT(*) AS total FROM giveaway_participants GROUP BY giveaway_id) AS counts '
+        'WHERE giveaways.id = counts.giveaway_id'
+    )
+    op.create_table('giveaway_posts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('giveaway_id', sa.Integer(), nullable=False),
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('message_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['giveaway_id'], ['giveaways.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('chat_id', 'message_id', name='uq_giveaway_posts_chat_message')
+    )
+    op.create_index('ix_giveaway_posts_giveaway_id', 'giveaway_posts', ['giveaway_id'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_giveaway_posts_giveaway_id', table_name='giveaway_posts')
+    op.drop_table('giveaway_posts')
+    op.drop_column('giveaways', 'participants_count')
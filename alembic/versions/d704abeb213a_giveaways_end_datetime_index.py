@@ -0,0 +1,24 @@
+""" 
+Revision ID: d704abeb213a
+Revises: 74ef38910419
+Create Date: 2025-08-12 16:05:29.771930
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd704abeb213a'
+down_revision = '74ef38910419'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Частичный индекс: планировщик читает только незавершенные розыгрыши одним упорядоченным сканированием
+    op.create_index(
+        'ix_giveaways_end_datetime_active', 'giveaways', ['end_datetime'],
+        unique=False, postgresql_where=sa.text('finished_at IS NULL')
+    )
+
+def downgrade():
+    op.drop_index('ix_giveaways_end_datetime_active', table_name='giveaways')
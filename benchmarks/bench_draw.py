@@ -0,0 +1,51 @@
+"""Бенчмарк выбора победителей на 1M и 10M участников.
+
+Запуск: python benchmarks/bench_draw.py [--sizes 1000000 10000000] [--winners 10 1000]
+
+Поток ID имитирует чтение из базы (yield_per); измеряются время сбора ID в
+массив, время выбора победителей и пиковая память (tracemalloc).
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'bot')))
+from draw import collect_ids, pick_winners, new_seed
+
+
+def participant_stream(size):
+    """Имитация потока user_id из базы"""
+    return iter(range(1, size + 1))
+
+
+def bench(size, winners_counts):
+    tracemalloc.start()
+    started = time.perf_counter()
+    ids = collect_ids(participant_stream(size))
+    collect_time = time.perf_counter() - started
+    print(f"{size:>10} участников: сбор ID {collect_time:.2f} с, массив {ids.itemsize * len(ids) / 2**20:.1f} МиБ")
+    for count in winners_counts:
+        seed = new_seed()
+        started = time.perf_counter()
+        winners = pick_winners(ids, count, seed)
+        draw_time = time.perf_counter() - started
+        assert winners == pick_winners(ids, count, seed)  # воспроизводимость по seed
+        print(f"{'':>10} {count:>6} победителей: {draw_time * 1000:.2f} мс")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{'':>10} пиковая память: {peak / 2**20:.1f} МиБ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--winners', type=int, nargs='+', default=[10, 1000])
+    args = parser.parse_args()
+    for size in args.sizes:
+        bench(size, args.winners)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""Нагрузочный тест обработчиков бота на локальной заглушке Bot API.
+
+Запуск: python benchmarks/bench_load.py [--updates 20000] [--rate 0] [--mix wizard=1,join=8,list=1]
+                                        [--database-url postgresql://.../bench] [--api-latency 0]
+
+Бот (TeleBot с обработчиками из bot/handlers.py, буфером участников, очередью отправки,
+планировщиком) получает синтетические апдейты через getUpdates от FakeBotApi. По умолчанию
+используется временная база SQLite; для PostgreSQL передайте URL пустой базы — таблицы будут
+созданы и удалены. Выводятся апдейты в секунду, p50/p99 времени обработчиков и число
+SQL-запросов на апдейт (в обработчиках и в фоновых потоках).
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'bot'))
+sys.path.insert(0, BENCH_DIR)
+from fake_bot_api import FakeBotApi
+
+WIZARD_FLOW = ['/new_giveaway', None, 'Приз: подписка на год', 'нет', '1', '50', 'по умолчанию']
+
+
+class Traffic:
+    """Генератор синтетических апдейтов: диалоги создания розыгрыша, участие, просмотр списков"""
+
+    def __init__(self, giveaway_ids, seed=0):
+        self.giveaway_ids = giveaway_ids
+        self.random = random.Random(seed)
+        self._update_id = 0
+        self._message_id = 0
+        self._user_id = 10**6
+
+    def _next_user(self):
+        self._user_id += 1
+        return self._user_id
+
+    def _update(self, **payload):
+        self._update_id += 1
+        return {'update_id': self._update_id, **payload}
+
+    def message(self, user_id, text=None):
+        self._message_id += 1
+        message = {
+            'message_id': self._message_id, 'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'u', 'username': f'user{user_id}'},
+        }
+        if text is None:
+            message['photo'] = [{'file_id': 'photo-small', 'file_unique_id': 's', 'width': 90, 'height': 90},
+                                {'file_id': 'photo-large', 'file_unique_id': 'l', 'width': 1280, 'height': 1280}]
+        else:
+            message['text'] = text
+            if text.startswith('/'):
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        return self._update(message=message)
+
+    def wizard(self):
+        user_id = self._next_user()
+        return [self.message(user_id, text) for text in WIZARD_FLOW]
+
+    def join(self):
+        user_id = self._next_user()
+        self._message_id += 1
+        return [self._update(callback_query={
+            'id': str(self._update_id), 'chat_instance': '1',
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'u', 'username': f'user{user_id}'},
+            'data': f'join:{self.random.choice(self.giveaway_ids)}',
+        })]
+
+    def list(self):
+        return [self.message(self._next_user(), self.random.choice(['/my_giveaways', '/my_channels']))]
+
+    def generate(self, total, mix):
+        scenarios = list(mix)
+        weights = [mix[name] for name in scenarios]
+        updates = []
+        while len(updates) < total:
+            updates.extend(getattr(self, self.random.choices(scenarios, weights)[0])())
+        return updates[:total]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('wizard', 'join', 'list'):
+            raise argparse.ArgumentTypeError(f'неизвестный сценарий: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--rate', type=float, default=0, help='апдейтов в секунду, 0 — без ограничения')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('wizard=1,join=8,list=1'))
+    parser.add_argument('--giveaways', type=int, default=10, help='розыгрышей для участия')
+    parser.add_argument('--database-url', help='URL пустой базы; по умолчанию временная SQLite')
+    parser.add_argument('--api-latency', type=float, default=0, help='задержка ответов Bot API в мс')
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='bench-load-')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+    # Модули бота читают DATABASE_URL при импорте
+    from sqlalchemy import event, func, select
+    from telebot import TeleBot, apihelper
+    import db
+    from handlers import register_handlers
+    from join import JoinBuffer
+    from membership import MembershipChecker
+    from models import Base, Giveaway, GiveawayParticipant
+    from outbox import Outbox
+    from posts import start_post_updater
+    from scheduler import start_scheduler
+    from state import create_state_store
+
+    Base.metadata.create_all(db.get_engine())
+    with db.session_scope('bench') as session:
+        giveaways = [Giveaway(bot_id=1, description=f'Бенчмарк {i}', winners_count=1) for i in range(args.giveaways)]
+        session.add_all(giveaways)
+        session.flush()
+        giveaway_ids = [giveaway.id for giveaway in giveaways]
+
+    # SQL-запросы: в потоке обработчика и в фоновых потоках
+    in_handler = threading.local()
+    statements = defaultdict(int)
+
+    @event.listens_for(db.get_engine(), 'before_cursor_execute')
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements['handler' if getattr(in_handler, 'active', False) else 'background'] += 1
+
+    fake = FakeBotApi(latency=args.api_latency / 1000).start()
+    apihelper.API_URL = fake.api_url
+    logger = logging.getLogger('bench')
+    logger.addHandler(logging.NullHandler())
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    bot = TeleBot('1:bench', threaded=False)
+    bot.logger = logger
+    bot.bot_id = 1
+    bot.join_buffer = JoinBuffer(logger).start()
+    # Лимиты Telegram не моделируются: измеряется сам бот
+    bot.outbox = Outbox(bot, logger, global_rate=1e6, chat_rate=1e6, group_rate=1e6).start()
+    bot.membership = MembershipChecker(bot, logger)
+    bot.scheduler = start_scheduler({bot.bot_id: bot}, logger, bot.join_buffer)
+    bot.post_updater = start_post_updater({bot.bot_id: bot}, logger, bot.join_buffer)
+    bot.state_store = create_state_store().scoped(bot.bot_id)
+    register_handlers(bot)
+
+    latencies = defaultdict(list)
+    processed = [0]
+
+    def timed(name, function):
+        def wrapper(*a, **kw):
+            in_handler.active = True
+            started = time.perf_counter()
+            try:
+                return function(*a, **kw)
+            finally:
+                latencies[name].append(time.perf_counter() - started)
+                in_handler.active = False
+                processed[0] += 1
+        return wrapper
+
+    for handler in bot.message_handlers + bot.callback_query_handlers:
+        handler['function'] = timed(handler['function'].__name__, handler['function'])
+
+    updates = Traffic(giveaway_ids).generate(args.updates, args.mix)
+
+    def feed():
+        if not args.rate:
+            fake.push_updates(updates)
+            return
+        started = time.monotonic()
+        for i in range(0, len(updates), 100):
+            delay = started + i / args.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            fake.push_updates(updates[i:i + 100])
+
+    poller = threading.Thread(
+        target=bot.polling, kwargs={'non_stop': True, 'interval': 0, 'timeout': 1, 'long_polling_timeout': 1}, daemon=True,
+    )
+    started = time.perf_counter()
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    poller.start()
+    while processed[0] < len(updates):
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    bot.stop_polling()
+    bot.join_buffer.stop()
+    bot.post_updater.stop()
+    bot.scheduler.stop()
+    bot.outbox.stop(timeout=30)
+    fake.stop()
+
+    with db.session_scope('bench') as session:
+        participants = session.scalar(select(func.count()).select_from(GiveawayParticipant))
+
+    print(f"Апдейтов: {len(updates)} за {elapsed:.2f} с — {len(updates) / elapsed:.0f} апдейтов/с")
+    every = [value for values in latencies.values() for value in values]
+    print(f"Обработчики: p50 {percentile(every, 0.5) * 1000:.2f} мс, p99 {percentile(every, 0.99) * 1000:.2f} мс")
+    for name, values in sorted(latencies.items()):
+        print(f"  {name:<28} {len(values):>7}  p50 {percentile(values, 0.5) * 1000:7.2f} мс  p99 {percentile(values, 0.99) * 1000:7.2f} мс")
+    print(f"SQL-запросов на апдейт: в обработчиках {statements['handler'] / len(updates):.2f}, "
+          f"в фоне {statements['background'] / len(updates):.2f}")
+    print(f"Участников записано: {participants}")
+    print("Вызовы Bot API: " + ', '.join(f'{method} {count}' for method, count in sorted(fake.calls.items())))
+
+    if tmpdir:
+        db.get_engine().dispose()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    else:
+        Base.metadata.drop_all(db.get_engine())
+
+
+if __name__ == '__main__':
+    main()
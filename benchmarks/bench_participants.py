@@ -0,0 +1,183 @@
+"""Бенчмарк таблицы участников по мере роста числа строк.
+
+Запуск: python benchmarks/bench_participants.py [--rows 2000000] [--steps 4] [--database-url postgresql://...]
+
+Схемы: plain — прежняя таблица (id, уникальный индекс (giveaway_id, user_id), индекс user_id);
+partitioned — секционирование по хешу giveaway_id (только PostgreSQL); archived — участники
+завершенных розыгрышей перенесены в сжатый архив (archive.py). На каждом шаге таблица
+пополняется завершенными розыгрышами по --giveaway-size участников, затем измеряются
+медианы вставки пачки заявок (ON CONFLICT DO NOTHING, как в join.py) в идущий розыгрыш
+и COUNT(*) его участников. Без --database-url используется временная база SQLite.
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'bot')))
+from sqlalchemy import (Column, DateTime, Index, Integer, LargeBinary, MetaData, PrimaryKeyConstraint, Table,
+                        UniqueConstraint, create_engine, delete, func, select, text)
+from archive import pack_participants
+from db import dialect_insert
+from models import PARTICIPANT_PARTITIONS
+
+LOAD_CHUNK = 10000
+ACTIVE_GIVEAWAY = 0
+
+
+def plain_table(metadata):
+    return Table(
+        'bench_participants_plain', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('giveaway_id', Integer),
+        Column('user_id', Integer, index=True),
+        Column('joined_at', DateTime),
+        UniqueConstraint('giveaway_id', 'user_id'),
+    )
+
+
+def keyed_table(metadata, name, **kwargs):
+    return Table(
+        name, metadata,
+        Column('giveaway_id', Integer, nullable=False),
+        Column('user_id', Integer, nullable=False),
+        Column('joined_at', DateTime),
+        PrimaryKeyConstraint('giveaway_id', 'user_id'),
+        Index(f'ix_{name}_user_id', 'user_id'),
+        **kwargs,
+    )
+
+
+def create_layouts(engine):
+    """{схема: (таблица участников, таблица архива или None)}"""
+    metadata = MetaData()
+    layouts = {'plain': (plain_table(metadata), None)}
+    if engine.dialect.name == 'postgresql':
+        layouts['partitioned'] = (keyed_table(metadata, 'bench_participants_partitioned', postgresql_partition_by='HASH (giveaway_id)'), None)
+    archive = Table(
+        'bench_participant_archives', metadata,
+        Column('giveaway_id', Integer, primary_key=True, autoincrement=False),
+        Column('participants', Integer, nullable=False),
+        Column('data', LargeBinary, nullable=False),
+    )
+    layouts['archived'] = (keyed_table(metadata, 'bench_participants_archived'), archive)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    if 'partitioned' in layouts:
+        with engine.begin() as conn:
+            for remainder in range(PARTICIPANT_PARTITIONS):
+                conn.execute(text(
+                    f'CREATE TABLE bench_participants_partitioned_p{remainder} PARTITION OF bench_participants_partitioned '
+                    f'FOR VALUES WITH (MODULUS {PARTICIPANT_PARTITIONS}, REMAINDER {remainder})'
+                ))
+    return metadata, layouts
+
+
+def giveaway_rows(giveaway_id, size, users, started):
+    """Участники одного розыгрыша: случайные пользователи, время заявки по возрастанию"""
+    for offset, user_id in enumerate(sorted(random.sample(range(1, users + 1), size))):
+        yield {'giveaway_id': giveaway_id, 'user_id': user_id, 'joined_at': started + timedelta(seconds=offset)}
+
+
+def load_finished(engine, table, archive, giveaway_ids, size, users):
+    """Заполнение завершенных розыгрышей; для archived — сразу перенос в архив. Возвращает время переноса"""
+    archive_time = 0.0
+    started = datetime(2025, 1, 1)
+    for giveaway_id in giveaway_ids:
+        rows = list(giveaway_rows(giveaway_id, size, users, started))
+        with engine.begin() as conn:
+            for i in range(0, len(rows), LOAD_CHUNK):
+                conn.execute(table.insert(), rows[i:i + LOAD_CHUNK])
+        if archive is not None:
+            moved = time.perf_counter()
+            with engine.begin() as conn:
+                result = conn.execute(
+                    select(table.c.user_id, table.c.joined_at)
+                    .where(table.c.giveaway_id == giveaway_id)
+                    .order_by(table.c.user_id)
+                )
+                count, data = pack_participants(result)
+                conn.execute(archive.insert().values(giveaway_id=giveaway_id, participants=count, data=data))
+                conn.execute(delete(table).where(table.c.giveaway_id == giveaway_id))
+            archive_time += time.perf_counter() - moved
+    return archive_time
+
+
+def measure_active(engine, table, batch, batches, next_user):
+    """Медианы вставки пачки заявок в идущий розыгрыш и подсчета его участников, мс"""
+    insert_times, count_times = [], []
+    for _ in range(batches):
+        # Половина пачки — повторные нажатия, как при реальных заявках
+        user_ids = list(range(next_user, next_user + batch // 2)) + list(range(next_user - batch // 2, next_user))
+        next_user += batch // 2
+        values = [{'giveaway_id': ACTIVE_GIVEAWAY, 'user_id': user_id, 'joined_at': datetime.utcnow()} for user_id in user_ids]
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(
+                dialect_insert(table, engine).values(values)
+                .on_conflict_do_nothing(index_elements=['giveaway_id', 'user_id'])
+            )
+        insert_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            conn.scalar(select(func.count()).select_from(table).where(table.c.giveaway_id == ACTIVE_GIVEAWAY))
+        count_times.append(time.perf_counter() - started)
+    return statistics.median(insert_times) * 1000, statistics.median(count_times) * 1000, next_user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2_000_000, help='итоговое число участников завершенных розыгрышей')
+    parser.add_argument('--steps', type=int, default=4)
+    parser.add_argument('--giveaway-size', type=int, default=50_000)
+    parser.add_argument('--users', type=int, default=1_000_000, help='число разных пользователей')
+    parser.add_argument('--batch', type=int, default=1000, help='размер пачки заявок')
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--database-url', help='PostgreSQL для сравнения с секционированием; по умолчанию SQLite')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    tmpdir = None
+    url = args.database_url
+    if url is None:
+        tmpdir = tempfile.mkdtemp(prefix='bench-participants-')
+        url = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    engine = create_engine(url)
+    metadata, layouts = create_layouts(engine)
+    print(f"База {engine.dialect.name}, схемы: {', '.join(layouts)}")
+
+    per_step = max(1, args.rows // args.steps // args.giveaway_size)
+    next_giveaway = 1
+    next_user = {name: args.users + 1 for name in layouts}
+    try:
+        for step in range(1, args.steps + 1):
+            giveaway_ids = list(range(next_giveaway, next_giveaway + per_step))
+            next_giveaway += per_step
+            total = (next_giveaway - 1) * args.giveaway_size
+            print(f"Шаг {step}: завершенных розыгрышей {next_giveaway - 1}, участников {total}")
+            for name, (table, archive) in layouts.items():
+                archive_time = load_finished(engine, table, archive, giveaway_ids, args.giveaway_size, args.users)
+                insert_ms, count_ms, next_user[name] = measure_active(engine, table, args.batch, args.batches, next_user[name])
+                line = f"  {name:<12} вставка пачки {insert_ms:7.2f} мс, COUNT(*) розыгрыша {count_ms:7.2f} мс"
+                if archive is not None:
+                    line += f", перенос в архив {archive_time / len(giveaway_ids) * 1000:.0f} мс на розыгрыш"
+                print(line)
+        _, archive = layouts['archived']
+        with engine.connect() as conn:
+            size = conn.scalar(select(func.sum(func.length(archive.c.data))))
+        print(f"Размер архива: {size / 2**20:.1f} МиБ, {size / ((next_giveaway - 1) * args.giveaway_size):.2f} байт на участника")
+    finally:
+        metadata.drop_all(engine)
+        engine.dispose()
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
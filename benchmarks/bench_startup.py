@@ -0,0 +1,128 @@
+"""Время запуска бота на локальной заглушке Bot API.
+
+Запуск: python benchmarks/bench_startup.py [--runs 5] [--mode polling|async] [--getme-latency 0]
+
+Каждый прогон запускает bot/main.py в отдельном процессе (временная база SQLite с готовыми
+таблицами, FakeBotApi вместо api.telegram.org) и измеряет время от запуска процесса до первого
+getUpdates и до ответа 200 на /readyz, а также время остановки по SIGTERM. --getme-latency
+задерживает ответ getMe: прием апдейтов не должен его ждать. Выводятся медиана и минимум.
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BOT_MAIN = os.path.join(BENCH_DIR, '..', 'bot', 'main.py')
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'bot'))
+sys.path.insert(0, BENCH_DIR)
+from fake_bot_api import FakeBotApi
+
+# Подмена адреса Bot API в дочернем процессе и запуск bot/main.py как скрипта
+BOOTSTRAP = """
+import os, runpy, sys
+from telebot import apihelper
+apihelper.API_URL = sys.argv[1]
+try:
+    from telebot import asyncio_helper
+    asyncio_helper.API_URL = sys.argv[1]
+except ImportError:
+    pass
+sys.argv = sys.argv[2:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until(condition, timeout, interval=0.002):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return time.monotonic()
+        time.sleep(interval)
+    raise TimeoutError('бот не запустился')
+
+
+def ready(port):
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/readyz', timeout=1) as response:
+            return response.status == 200
+    except (OSError, urllib.error.HTTPError):
+        return False
+
+
+def run_once(env, getme_latency, timeout):
+    fake = FakeBotApi().start()
+    fake.delays['getme'] = getme_latency
+    fake.httpd.handle_error = lambda request, client_address: None  # бот останавливается посреди getUpdates
+    port = free_port()
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, '-c', BOOTSTRAP, fake.api_url, os.path.abspath(BOT_MAIN)],
+        env={**env, 'METRICS_PORT': str(port)}, cwd=env['BENCH_TMPDIR'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until(lambda: 'getupdates' in fake.first_calls, timeout)
+        polling_at = fake.first_calls['getupdates']
+        ready_at = wait_until(lambda: ready(port), timeout)
+        stop_started = time.monotonic()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout)
+        stopped = time.monotonic() - stop_started
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        fake.stop()
+    return polling_at - started, ready_at - started, stopped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--mode', choices=['polling', 'async'], default='polling')
+    parser.add_argument('--getme-latency', type=float, default=0, help='задержка ответа getMe в мс')
+    parser.add_argument('--timeout', type=float, default=30, help='ожидание запуска и остановки, с')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench-startup-')
+    env = {
+        **os.environ,
+        'BENCH_TMPDIR': tmpdir,
+        'DATABASE_URL': f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+        'TELEGRAM_TOKEN': '1:bench',
+        'BOT_MODE': args.mode,
+        'POLLING_TIMEOUT': '1',
+    }
+    os.environ['DATABASE_URL'] = env['DATABASE_URL']
+    import db
+    from models import Base
+    Base.metadata.create_all(db.get_engine())
+    db.get_engine().dispose()
+
+    results = [run_once(env, args.getme_latency / 1000, args.timeout) for _ in range(args.runs)]
+    print(f"Режим {args.mode}, прогонов: {args.runs}, задержка getMe {args.getme_latency:.0f} мс")
+    for index, name in enumerate(('до первого getUpdates', 'до /readyz 200', 'остановка по SIGTERM')):
+        values = [result[index] for result in results]
+        print(f"{name}: медиана {statistics.median(values) * 1000:.0f} мс, минимум {min(values) * 1000:.0f} мс")
+
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Локальная заглушка Telegram Bot API для бенчмарков.
+
+Отвечает на getMe, getUpdates, sendMessage, editMessage*, answerCallbackQuery,
+getChatMember, getChat и методы webhook. Апдейты для getUpdates добавляются через
+push_updates; ответы на остальные методы синтетические. Для подключения бота:
+
+    telebot.apihelper.API_URL = server.api_url
+"""
+import itertools
+import json
+from email import policy
+from email.parser import BytesParser
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+ADMIN_RIGHTS = dict.fromkeys((
+    'can_be_edited', 'is_anonymous', 'can_manage_chat', 'can_delete_messages', 'can_manage_video_chats',
+    'can_restrict_members', 'can_promote_members', 'can_change_info', 'can_invite_users',
+    'can_post_stories', 'can_edit_stories', 'can_delete_stories', 'can_post_messages',
+), True)
+SEND_METHODS = {'sendmessage', 'sendphoto', 'sendvideo', 'sendanimation', 'senddocument'}
+
+
+class FakeBotApi:
+    """HTTP-сервер с ответами Bot API; latency — задержка ответа на исходящие методы в секундах"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.latency = latency
+        self.delays = {}  # метод -> задержка ответа в секундах (например, медленный getMe)
+        self.calls = Counter()  # метод -> число вызовов
+        self.first_calls = {}  # метод -> time.monotonic() первого вызова
+        self.files = []  # (метод, имя файла, содержимое) загруженных файлов
+        self._updates = deque()
+        self._delivered = 0
+        self._cond = threading.Condition()
+        self._message_ids = itertools.count(1)
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/bot{{0}}/{{1}}'
+
+    @property
+    def delivered(self):
+        """Сколько апдейтов отдано через getUpdates"""
+        return self._delivered
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-bot-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def push_updates(self, updates):
+        with self._cond:
+            self._updates.extend(updates)
+            self._cond.notify_all()
+
+    def pending_updates(self):
+        with self._cond:
+            return len(self._updates)
+
+    def get_updates(self, offset=0, limit=100, timeout=0):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._updates and self._updates[0]['update_id'] < offset:
+                self._updates.popleft()
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+            batch = list(itertools.islice(self._updates, limit))
+            self._delivered += len(batch)
+            # Отданные апдейты удаляются сразу: бот подтвердит их следующим offset
+            for _ in batch:
+                self._updates.popleft()
+            return batch
+
+    def answer(self, method, params):
+        self.calls[method] += 1
+        self.first_calls.setdefault(method, time.monotonic())
+        if method in self.delays:
+            time.sleep(self.delays[method])
+        if method in SEND_METHODS or method.startswith('edit') or method == 'answercallbackquery':
+            if self.latency:
+                time.sleep(self.latency)
+        if method == 'getme':
+            return BOT_USER
+        if method == 'getupdates':
+            return self.get_updates(
+                int(params.get('offset') or 0), int(params.get('limit') or 100), float(params.get('timeout') or 0),
+            )
+        if method in SEND_METHODS or method.startswith('edit'):
+            chat_id = int(params.get('chat_id') or 0)
+            return {
+                'message_id': next(self._message_ids), 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'channel' if chat_id < 0 else 'private'},
+                'text': params.get('text', ''),
+            }
+        if method == 'getchatmember':
+            user_id = int(params.get('user_id') or 0)
+            return {'status': 'member', 'user': {'id': user_id, 'is_bot': False, 'first_name': 'u'}}
+        if method == 'getchat':
+            chat_id = params.get('chat_id', '')
+            numeric = int(chat_id) if chat_id.lstrip('-').isdigit() else -(1000000000000 + abs(hash(chat_id)) % 10**9)
+            return {'id': numeric, 'type': 'channel', 'title': chat_id, 'username': chat_id.lstrip('@')}
+        if method == 'getchatadministrators':
+            return [{'status': 'administrator', 'user': BOT_USER, **ADMIN_RIGHTS}]
+        return True
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # иначе keep-alive ответы задерживаются на ~40 мс
+
+            def log_message(self, format, *args):
+                pass
+
+            def _params(self):
+                url = urlsplit(self.path)
+                params = dict(parse_qsl(url.query))
+                method = url.path.rsplit('/', 1)[-1].lower()
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    body = self.rfile.read(length)
+                    content_type = self.headers.get('Content-Type', '')
+                    if content_type.startswith('multipart/form-data'):
+                        form = BytesParser(policy=policy.default).parsebytes(
+                            f'Content-Type: {content_type}\r\n\r\n'.encode() + body
+                        )
+                        for part in form.iter_parts():
+                            if part.get_filename():
+                                api.files.append((method, part.get_filename(), part.get_payload(decode=True)))
+                            else:
+                                params[part.get_param('name', header='content-disposition')] = part.get_content()
+                    elif content_type.startswith('application/json'):
+                        params.update({key: str(value) for key, value in json.loads(body).items()})
+                    else:
+                        params.update(parse_qsl(body.decode()))
+                return method, params
+
+            def _serve(self):
+                method, params = self._params()
+                body = json.dumps({'ok': True, 'result': api.answer(method, params)}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _serve
+            do_POST = _serve
+
+        return Handler
@@ -0,0 +1,149 @@
+import os
+import sys
+import threading
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from db import session_scope
+from draw import STREAM_CHUNK_SIZE
+from metrics import counter
+from models import Giveaway, GiveawayParticipant, GiveawayParticipantArchive
+from utils import log_error, log_info
+
+# Формат архива: байт версии, затем zlib-поток пар int64 little-endian
+# (разность user_id с предыдущим, joined_at в микросекундах от эпохи или -1).
+# Участники упорядочены по user_id, как при выборе победителей.
+ARCHIVE_VERSION = b'\x01'
+EPOCH = datetime(1970, 1, 1)
+NO_TIME = -1
+RECORD_SIZE = 16
+
+participants_archived_total = counter('giveaway_participants_archived_total', 'Участники, перенесенные в архив')
+
+
+def pack_participants(rows):
+    """Сжатие потока (user_id, joined_at), упорядоченного по user_id: (число участников, архив)"""
+    compressor = zlib.compressobj(6)
+    parts = [ARCHIVE_VERSION]
+    previous = 0
+    count = 0
+    chunk = array('q')
+    for user_id, joined_at in rows:
+        chunk.append(user_id - previous)
+        chunk.append((joined_at - EPOCH) // timedelta(microseconds=1) if joined_at else NO_TIME)
+        previous = user_id
+        count += 1
+        if len(chunk) >= 2 * STREAM_CHUNK_SIZE:
+            parts.append(compressor.compress(_to_bytes(chunk)))
+            chunk = array('q')
+    parts.append(compressor.compress(_to_bytes(chunk)))
+    parts.append(compressor.flush())
+    return count, b''.join(parts)
+
+
+def unpack_participants(data, chunk_size=STREAM_CHUNK_SIZE):
+    """Чтение архива пачками [(user_id, joined_at)] без распаковки целиком"""
+    if data[:1] != ARCHIVE_VERSION:
+        raise ValueError(f"неизвестный формат архива участников: {data[:1]!r}")
+    decompressor = zlib.decompressobj()
+    pending = data[1:]
+    buffer = b''
+    previous = 0
+    while not decompressor.eof:
+        output = decompressor.decompress(pending, chunk_size * RECORD_SIZE)
+        pending = decompressor.unconsumed_tail
+        if not output and not pending:
+            raise ValueError("архив участников обрезан")
+        buffer += output
+        usable = len(buffer) - len(buffer) % RECORD_SIZE
+        if not usable:
+            continue
+        values = array('q')
+        values.frombytes(buffer[:usable])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        buffer = buffer[usable:]
+        rows = []
+        for i in range(0, len(values), 2):
+            previous += values[i]
+            micros = values[i + 1]
+            rows.append((previous, EPOCH + timedelta(microseconds=micros) if micros != NO_TIME else None))
+        yield rows
+
+
+def _to_bytes(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def archive_giveaway(session, giveaway_id):
+    """Перенос участников розыгрыша в архив одной транзакцией; возвращает их число"""
+    result = session.execute(
+        select(GiveawayParticipant.user_id, GiveawayParticipant.joined_at)
+        .where(GiveawayParticipant.giveaway_id == giveaway_id)
+        .order_by(GiveawayParticipant.user_id)
+        .execution_options(yield_per=STREAM_CHUNK_SIZE)
+    )
+    count, data = pack_participants(row for partition in result.partitions() for row in partition)
+    session.add(GiveawayParticipantArchive(giveaway_id=giveaway_id, participants=count, data=data))
+    session.execute(delete(GiveawayParticipant).where(GiveawayParticipant.giveaway_id == giveaway_id))
+    return count
+
+
+class ParticipantArchiver:
+    """Архивация участников завершенных розыгрышей.
+
+    Через after после завершения участники розыгрыша переносятся из giveaway_participants в одну сжатую
+    запись giveaway_participant_archives (около 2–6 байт на участника вместо строки с индексами),
+    и в рабочей таблице остаются только идущие и недавно завершенные розыгрыши.
+    """
+
+    def __init__(self, logger, after=None, batch=None):
+        self.logger = logger
+        self.after = after or timedelta(days=float(os.getenv('ARCHIVE_AFTER_DAYS', '7')))
+        self.batch = batch or int(os.getenv('ARCHIVE_BATCH', '10'))
+
+    def pending(self, session):
+        """Завершенные до порога розыгрыши без архива, по времени завершения"""
+        archived = select(GiveawayParticipantArchive.giveaway_id).where(GiveawayParticipantArchive.giveaway_id == Giveaway.id)
+        return session.scalars(
+            select(Giveaway.id)
+            .where(Giveaway.finished_at < datetime.utcnow() - self.after, ~archived.exists())
+            .order_by(Giveaway.finished_at)
+            .limit(self.batch)
+        ).all()
+
+    def run_once(self):
+        """Архивация очередной пачки розыгрышей; возвращает число розыгрышей в ней"""
+        with session_scope('archive_pending') as session:
+            giveaway_ids = self.pending(session)
+        total = 0
+        for giveaway_id in giveaway_ids:
+            with session_scope('archive_giveaway') as session:
+                count = archive_giveaway(session, giveaway_id)
+            participants_archived_total.inc(count)
+            total += count
+        if giveaway_ids:
+            log_info(self.logger, f"В архив перенесено участников: {total} ({len(giveaway_ids)} розыгрышей)")
+        return len(giveaway_ids)
+
+
+def start_archiver(logger, interval=None):
+    """Фоновая архивация участников завершенных розыгрышей"""
+    interval = interval or float(os.getenv('ARCHIVE_INTERVAL', '3600'))
+    archiver = ParticipantArchiver(logger)
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval):
+            try:
+                # Пачки подряд, пока есть что архивировать
+                while not stopped.is_set() and archiver.run_once():
+                    pass
+            except Exception as e:
+                log_error(logger, e, "архивация участников розыгрышей")
+
+    threading.Thread(target=run, name='participant-archiver', daemon=True).start()
+    return stopped
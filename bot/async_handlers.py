@@ -0,0 +1,123 @@
+import asyncio
+from db import run_db
+from export import EXPORT_USAGE_TEXT, parse_export_command
+from join import parse_join_callback
+from outbox import log_dropped
+from services import (
+    HELP_TEXT, START_TEXT, LIST_PAGES, join_reply,
+    list_giveaways_page, list_channels_page, parse_page_callback,
+)
+from utils import log_command, log_error
+from wizard import STEP_CONTENT_TYPES, begin, load_state, advance
+
+
+def register_async_handlers(bot):
+    """Регистрация обработчиков для AsyncTeleBot (бизнес-логика общая с handlers.py)"""
+
+    # Хранилище состояний синхронное: обращения к нему выполняются вне event loop
+    async def has_state(message):
+        return await asyncio.to_thread(load_state, bot.state_store, message)
+
+    @bot.message_handler(commands=['start'])
+    async def start_handler(message):
+        try:
+            log_command(bot.logger, message.from_user.id, message.from_user.username, 'start')
+            if not bot.outbox.send_message(message.chat.id, START_TEXT):
+                log_dropped(bot.logger, message.chat.id, 'start')
+        except Exception as e:
+            log_error(bot.logger, e, f"обработка команды /start от пользователя {message.from_user.id}")
+
+    @bot.message_handler(commands=['help'])
+    async def help_handler(message):
+        try:
+            log_command(bot.logger, message.from_user.id, message.from_user.username, 'help')
+            if not bot.outbox.send_message(message.chat.id, HELP_TEXT):
+                log_dropped(bot.logger, message.chat.id, 'help')
+        except Exception as e:
+            log_error(bot.logger, e, f"обработка команды /help от пользователя {message.from_user.id}")
+
+    # === Создание розыгрыша, добавление канала, поддержка (диалоги, см. wizard.py) ===
+    @bot.message_handler(commands=['new_giveaway', 'add_channel', 'support'])
+    async def wizard_command_handler(message):
+        command = message.text.split()[0].split('@')[0].lstrip('/')
+        try:
+            log_command(bot.logger, message.from_user.id, message.from_user.username, command)
+            prompt = await asyncio.to_thread(begin, bot.state_store, message.chat.id, command)
+            if not bot.outbox.send_message(message.chat.id, prompt):
+                log_dropped(bot.logger, message.chat.id, 'command')
+        except Exception as e:
+            log_error(bot.logger, e, f"обработка команды /{command} от пользователя {message.from_user.id}")
+
+    # === Просмотр розыгрышей ===
+    @bot.message_handler(commands=['my_giveaways'])
+    async def my_giveaways_handler(message):
+        try:
+            log_command(bot.logger, message.from_user.id, message.from_user.username, 'my_giveaways')
+            text, markup = await run_db(list_giveaways_page, bot.bot_id, message.from_user)
+            if not bot.outbox.send_message(message.chat.id, text, reply_markup=markup):
+                log_dropped(bot.logger, message.chat.id, 'my_giveaways')
+        except Exception as e:
+            log_error(bot.logger, e, f"просмотр розыгрышей пользователем {message.from_user.id}")
+
+    # === Выгрузка участников ===
+    @bot.message_handler(commands=['export'])
+    async def export_handler(message):
+        try:
+            log_command(bot.logger, message.from_user.id, message.from_user.username, 'export')
+            command = parse_export_command(message.text)
+            if command is None:
+                if not bot.outbox.send_message(message.chat.id, EXPORT_USAGE_TEXT):
+                    log_dropped(bot.logger, message.chat.id, 'export')
+            else:
+                bot.exporter.submit(message.chat.id, message.from_user, *command)
+        except Exception as e:
+            log_error(bot.logger, e, f"выгрузка участников пользователем {message.from_user.id}")
+
+    # === Просмотр каналов ===
+    @bot.message_handler(commands=['my_channels'])
+    async def my_channels_handler(message):
+        try:
+            log_command(bot.logger, message.from_user.id, message.from_user.username, 'my_channels')
+            text, markup = await run_db(list_channels_page, bot.bot_id, message.from_user)
+            if not bot.outbox.send_message(message.chat.id, text, reply_markup=markup):
+                log_dropped(bot.logger, message.chat.id, 'my_channels')
+        except Exception as e:
+            log_error(bot.logger, e, f"просмотр каналов пользователем {message.from_user.id}")
+
+    # === Переход между страницами списков ===
+    @bot.callback_query_handler(func=lambda call: parse_page_callback(call.data) is not None)
+    async def page_callback(call):
+        try:
+            kind, direction, cursor = parse_page_callback(call.data)
+            text, markup = await run_db(LIST_PAGES[kind], bot.bot_id, call.from_user, direction, cursor)
+            if not bot.outbox.edit_message_text(call.message.chat.id, call.message.message_id, text, reply_markup=markup):
+                log_dropped(bot.logger, call.message.chat.id, 'page')
+            await bot.answer_callback_query(call.id)
+        except Exception as e:
+            log_error(bot.logger, e, f"переход по списку пользователем {call.from_user.id}")
+
+    # === Участие в розыгрыше ===
+    @bot.callback_query_handler(func=lambda call: parse_join_callback(call.data) is not None)
+    async def join_giveaway_callback(call):
+        try:
+            joined = bot.join_buffer.add(parse_join_callback(call.data), call.from_user, bot.bot_id)
+            await bot.answer_callback_query(call.id, join_reply(joined))
+        except Exception as e:
+            log_error(bot.logger, e, f"участие в розыгрыше пользователя {call.from_user.id}")
+
+    # === Шаги диалогов (регистрируется последним: команды важнее незавершенного диалога) ===
+    @bot.message_handler(func=has_state, content_types=STEP_CONTENT_TYPES)
+    async def wizard_step_handler(message):
+        step = message.wizard_state[0]
+        try:
+            step, transition, data = await asyncio.to_thread(advance, bot.state_store, message)
+            reply = transition.reply
+            if transition.prepare:
+                await asyncio.to_thread(transition.prepare, message.from_user, data, bot)
+            if transition.action:
+                reply = await run_db(transition.action, message.from_user, data, bot)
+            if reply:
+                if not bot.outbox.send_message(message.chat.id, reply):
+                    log_dropped(bot.logger, message.chat.id, 'wizard')
+        except Exception as e:
+            log_error(bot.logger, e, f"шаг диалога {step} пользователя {message.from_user.id}")
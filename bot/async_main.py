@@ -0,0 +1,149 @@
+import asyncio
+import os
+from types import SimpleNamespace
+from telebot import TeleBot
+from telebot.async_telebot import AsyncTeleBot
+from archive import start_archiver
+from async_handlers import register_async_handlers
+from dispatcher import ChatDispatcher, update_chat_key
+from instrumentation import instrument_api, instrument_handlers
+from channels import ChannelResolver
+from export import Exporter
+from fraud import create_fraud_screen
+from join import JoinBuffer
+from lifecycle import Lifecycle, background_steps, load_offset, save_offset
+from membership import MembershipChecker
+from monitoring import health, run_startup_checks, start_monitoring
+from outbox import BotOutbox, Outbox
+from posts import start_post_updater
+from scheduler import start_scheduler
+from state import create_state_store, start_state_purger
+from tenants import bot_id, claim_legacy_rows
+from utils import log_bot_stop, log_error, log_info
+
+
+class OrderedAsyncTeleBot(AsyncTeleBot):
+    """AsyncTeleBot с упорядоченной по чатам и ограниченной по объему обработкой апдейтов.
+
+    Диспетчер может быть общим для нескольких ботов: порядок соблюдается в пределах чата одного бота,
+    ограничения параллельности и очереди — общие.
+    """
+
+    def __init__(self, token, logger, dispatcher, **kwargs):
+        super().__init__(token, **kwargs)
+        self.logger = logger
+        self.bot_id = bot_id(token)
+        self.dispatcher = dispatcher
+
+    async def get_me(self):
+        # AsyncTeleBot запрашивает getMe перед первым getUpdates; ответ уже получен или получается
+        # в фоне синхронным клиентом (run_startup_checks), до него — заглушка
+        if self.api._user is not None:
+            return self.api._user
+        return await super().get_me()
+
+    async def get_updates(self, *args, **kwargs):
+        # Новые апдейты не запрашиваются, пока очереди обработки переполнены
+        await self.dispatcher.wait_for_capacity()
+        return await super().get_updates(*args, **kwargs)
+
+    async def process_new_updates(self, updates):
+        for update in updates:
+            self.dispatcher.submit(
+                (self.bot_id, update_chat_key(update)),
+                lambda update=update: AsyncTeleBot.process_new_updates(self, [update]),
+            )
+
+
+async def run_async_bots(tokens, logger):
+    """Запуск ботов в асинхронном режиме: все токены в одном event loop с общими компонентами.
+
+    Общие: пул соединений с базой, диспетчер апдейтов, очередь отправки, буфер заявок, планировщик,
+    обновление постов, пулы потоков проверки подписки, каналов и выгрузок. У каждого бота свои клиент
+    Bot API, лимиты частоты, offset getUpdates и данные (bot_id). Первый токен — основной бот.
+    """
+    dispatcher = ChatDispatcher(
+        logger,
+        max_concurrency=int(os.getenv('ASYNC_MAX_CONCURRENCY', '100')),
+        max_pending=int(os.getenv('ASYNC_MAX_PENDING', '10000')),
+    )
+    bots = {}
+    for token in tokens:
+        bot = OrderedAsyncTeleBot(token, logger, dispatcher)
+        # Фоновые задачи (отправка сообщений, проверка подписки, завершение розыгрышей) работают в потоках через синхронный клиент
+        bot.api = TeleBot(token, threaded=False)
+        bots[bot.bot_id] = bot
+    monitoring = start_monitoring(logger)
+    # Bot API и база проверяются в фоновых потоках, результат — в /readyz
+    run_startup_checks([bot.api for bot in bots.values()], logger)
+    health.expect('updates')
+
+    join_buffer = JoinBuffer(logger, screen=create_fraud_screen(logger)).start()
+    outbox = Outbox(None, logger).start()
+    state_store = create_state_store()
+    first = None
+    for bot in bots.values():
+        bot.join_buffer = join_buffer
+        bot.outbox = BotOutbox(outbox, bot.api)
+        bot.membership = MembershipChecker(bot.api, logger, shared=first and first.membership)
+        bot.channel_resolver = ChannelResolver(bot.api, logger, shared=first and first.channel_resolver)
+        bot.exporter = Exporter(bot.outbox, logger, shared=first and first.exporter)
+        bot.state_store = state_store.scoped(bot.bot_id)
+        first = first or bot
+    try:
+        await asyncio.to_thread(claim_legacy_rows, first.bot_id, logger)
+    except Exception as e:
+        log_error(logger, e, "закрепление записей за ботом")
+    scheduler = start_scheduler(bots, logger, join_buffer)
+    post_updater = start_post_updater(bots, logger, join_buffer)
+    for bot in bots.values():
+        bot.scheduler = scheduler
+        bot.post_updater = post_updater
+        register_async_handlers(bot)
+        instrument_handlers(bot)
+    start_state_purger(state_store, logger)
+    start_archiver(logger)
+    instrument_api()
+    for bot in bots.values():
+        try:
+            last_update_id = await asyncio.to_thread(load_offset, bot.token)
+        except Exception as e:
+            log_error(logger, e, f"загрузка offset getUpdates бота {bot.bot_id}")
+            last_update_id = None
+        if last_update_id:
+            bot.offset = last_update_id + 1
+            log_info(logger, f"Бот {bot.bot_id}: продолжение с апдейта {bot.offset}")
+
+    log_info(logger, f"Запуск в асинхронном режиме, ботов: {len(bots)}")
+    timeout = int(os.getenv('POLLING_TIMEOUT', '10'))
+    polling = [asyncio.create_task(bot.infinity_polling(timeout=timeout)) for bot in bots.values()]
+
+    def stop_intake():
+        # Отмена прерывает и текущие getUpdates: неполученные апдейты останутся неподтвержденными в Telegram
+        for task in polling:
+            task.cancel()
+
+    lifecycle = Lifecycle(logger).install_async(asyncio.get_running_loop(), stop_intake)
+    health.set('updates', True)
+    try:
+        await asyncio.gather(*polling, return_exceptions=True)
+    finally:
+        health.set('updates', False)
+        await asyncio.sleep(0)  # передача в диспетчер апдейтов последнего getUpdates
+        try:
+            await asyncio.wait_for(dispatcher.join(), lifecycle.remaining())
+        except asyncio.TimeoutError:
+            log_error(logger, "не все принятые апдейты обработаны, offset не сохранен", "остановка")
+        else:
+            for bot in bots.values():
+                if bot.offset:
+                    try:
+                        await asyncio.to_thread(save_offset, bot.token, bot.offset - 1)
+                    except Exception as e:
+                        log_error(logger, e, f"сохранение offset getUpdates бота {bot.bot_id}")
+        services = SimpleNamespace(
+            exporter=first.exporter, join_buffer=join_buffer, post_updater=post_updater,
+            scheduler=scheduler, outbox=outbox, monitoring=monitoring,
+        )
+        lifecycle.drain(background_steps(services))
+        log_bot_stop(logger)
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from metrics import counter
+
+_MISSING = object()
+
+cache_requests_total = counter('cache_requests_total', 'Обращения к кэшам (result: hit, miss)')
+cache_evictions_total = counter('cache_evictions_total', 'Удаления из кэшей (reason: size, ttl)')
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с ограничением размера и временем жизни записей.
+
+    Если задано имя, обращения и вытеснения учитываются в метриках с меткой cache=name.
+    """
+
+    def __init__(self, maxsize, ttl=None, name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # вытеснены по размеру
+        self.expirations = 0  # удалены по истечении ttl
+        self._data = OrderedDict()  # ключ -> (значение, момент истечения)
+        self._lock = threading.Lock()
+
+    def _record(self, metric, amount=1, **labels):
+        if self.name:
+            metric.inc(amount, cache=self.name, **labels)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    self._record(cache_requests_total, result='hit')
+                    return value
+                del self._data[key]
+                self.expirations += 1
+                self._record(cache_evictions_total, reason='ttl')
+            self.misses += 1
+            self._record(cache_requests_total, result='miss')
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+                self._record(cache_evictions_total, reason='size')
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+            return default if item is _MISSING else item[0]
+
+    def purge_expired(self):
+        """Удаление просроченных записей; возвращает их количество"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]
+            for key in expired:
+                del self._data[key]
+            self.expirations += len(expired)
+            if expired:
+                self._record(cache_evictions_total, len(expired), reason='ttl')
+            return len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,127 @@
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from telebot.apihelper import ApiTelegramException
+from metrics import counter
+from ratelimit import TokenBucket, retry_after
+from tenants import bot_id
+from utils import log_error
+
+CHAT_TYPES = ('channel', 'supergroup', 'group')
+USERNAME_RE = re.compile(r'^[A-Za-z][A-Za-z0-9_]{3,31}$')
+LINK_RE = re.compile(r'^(?:https?://)?(?:www\.)?(?:t\.me|telegram\.me)/(.+)$', re.IGNORECASE)
+# Ссылки-приглашения (t.me/joinchat/<hash>, t.me/+<hash>, tg://join?invite=<hash>): по ним бот не может узнать чат
+INVITE_RE = re.compile(r'^(?:(?:https?://)?(?:www\.)?(?:t\.me|telegram\.me)/(?:joinchat/|\+)|tg://join\?invite=)', re.IGNORECASE)
+
+INVALID_REF_TEXT = "не похоже на ссылку на канал"
+INVITE_LINK_TEXT = "ссылка-приглашение не подходит, пришлите @username, числовой id канала или ссылку на пост в нем"
+
+# source — строка из сообщения; chat_id и title заполнены у проверенного канала, error — причина отказа
+ResolvedChannel = namedtuple('ResolvedChannel', 'source chat_id title error', defaults=(None, None, None))
+
+channel_checks_total = counter('channel_checks_total', 'Проверки добавляемых каналов (result: ok, rejected, error)')
+
+
+def parse_channel_ref(text):
+    """Ссылка t.me, @username или числовой id -> '@username' или int; None, если не распознано
+    или это ссылка-приглашение"""
+    text = text.strip().rstrip('/')
+    if INVITE_RE.match(text):
+        return None
+    match = LINK_RE.match(text)
+    if match:
+        path = match.group(1).split('?')[0].split('/')
+        if path[0] == 'c' and len(path) > 1 and path[1].isdigit():  # ссылка на сообщение приватного канала
+            return int('-100' + path[1])
+        text = path[0]
+    if re.fullmatch(r'-?\d+', text):
+        return int(text)
+    username = text[1:] if text.startswith('@') else text
+    if USERNAME_RE.match(username):
+        return '@' + username
+    return None
+
+
+def parse_channel_links(text):
+    """Разбор списка каналов (через пробел, запятую или с новой строки):
+    (ссылки без повторов, [(нераспознанная строка, причина)])"""
+    refs, invalid = {}, []
+    for part in re.split(r'[\s,]+', text or ''):
+        if not part:
+            continue
+        ref = parse_channel_ref(part)
+        if ref is None:
+            invalid.append((part, INVITE_LINK_TEXT if INVITE_RE.match(part) else INVALID_REF_TEXT))
+        else:
+            refs.setdefault(ref.lower() if isinstance(ref, str) else ref, (part, ref))
+    return list(refs.values()), invalid
+
+
+class ChannelResolver:
+    """Проверка добавляемых каналов через Bot API.
+
+    Для каждой ссылки get_chat дает числовой id и название, get_chat_administrators — права бота
+    и пользователя. Каналы проверяются пулом потоков с общим ограничением частоты запросов;
+    боты одного процесса разделяют пул (shared).
+    """
+
+    def __init__(self, api, logger, workers=None, rate=None, retries=3, shared=None):
+        self.api = api  # синхронный TeleBot
+        self.logger = logger
+        self.retries = retries
+        self.bucket = TokenBucket(rate or float(os.getenv('CHANNEL_RESOLVE_RATE', '20')))
+        self.executor = shared.executor if shared is not None else ThreadPoolExecutor(
+            max_workers=workers or int(os.getenv('CHANNEL_RESOLVE_WORKERS', '8')),
+            thread_name_prefix='channel-resolver',
+        )
+
+    @property
+    def bot_id(self):
+        return bot_id(self.api.token)
+
+    def resolve(self, refs, user_id):
+        """Параллельная проверка [(источник, ссылка)] для пользователя: список ResolvedChannel в том же порядке"""
+        return list(self.executor.map(lambda item: self.resolve_one(item[0], item[1], user_id), refs))
+
+    def resolve_one(self, source, ref, user_id):
+        try:
+            chat = self._call(self.api.get_chat, ref)
+            if chat.type not in CHAT_TYPES:
+                result = ResolvedChannel(source, error='это не канал и не группа')
+            else:
+                admins = {member.user.id for member in self._call(self.api.get_chat_administrators, chat.id)}
+                if self.bot_id not in admins:
+                    result = ResolvedChannel(source, error='бот не администратор')
+                elif user_id not in admins:
+                    result = ResolvedChannel(source, error='вы не администратор')
+                else:
+                    result = ResolvedChannel(source, chat.id, chat.title or chat.username or str(chat.id))
+        except ApiTelegramException as e:
+            if e.error_code not in (400, 403):
+                return self._failed(source, ref, e)
+            result = ResolvedChannel(source, error='не найден или бот не добавлен')
+        except Exception as e:
+            return self._failed(source, ref, e)
+        channel_checks_total.inc(result='ok' if result.chat_id is not None else 'rejected')
+        return result
+
+    def _failed(self, source, ref, error):
+        log_error(self.logger, error, f"проверка канала {ref}")
+        channel_checks_total.inc(result='error')
+        return ResolvedChannel(source, error='ошибка проверки, попробуйте позже')
+
+    def _call(self, method, *args):
+        """Запрос к Bot API с ограничением частоты и повтором после 429"""
+        for attempt in range(self.retries):
+            self.bucket.acquire()
+            try:
+                return method(*args)
+            except ApiTelegramException as e:
+                delay = retry_after(e)
+                if delay is None or attempt == self.retries - 1:
+                    raise
+                self.bucket.pause(delay)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
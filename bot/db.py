@@ -1,20 +1,122 @@
+import logging
 import os
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 from dotenv import load_dotenv
-from utils import log_database_connection
+from metrics import gauge, histogram
+from utils import log_database_connection, log_slow_query
 
 load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL')
+SLOW_QUERY_SECONDS = float(os.getenv('DB_SLOW_QUERY_MS', '500')) / 1000
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+db_statement_seconds = histogram('db_statement_seconds', 'Время выполнения SQL-запросов (handler, operation)')
+db_session_seconds = histogram('db_session_seconds', 'Время жизни сессий базы данных (handler)')
+db_connections_in_use = gauge('db_connections_in_use', 'Соединения, выданные из пула')
+db_sessions_active = gauge('db_sessions_active', 'Открытые сессии базы данных')
+
+def engine_options(url):
+    """Параметры пула и соединений из переменных окружения"""
+    options = {'pool_pre_ping': True}
+    if (url or '').startswith('sqlite'):
+        return options
+    options.update(
+        pool_size=int(os.getenv('DB_POOL_SIZE', '10')),
+        max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '20')),
+        pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        pool_recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+    )
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))
+    if statement_timeout:
+        if '+asyncpg' in url:
+            options['connect_args'] = {'server_settings': {'statement_timeout': str(statement_timeout)}}
+        else:
+            options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+def instrument_engine(engine, logger=None):
+    """Учет времени запросов, медленных запросов и занятых соединений пула"""
+    logger = logger or logging.getLogger('RandomLuckBot')
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        handler = conn.info.get('handler', 'other')
+        operation = statement.split(None, 1)[0].upper() if statement.strip() else ''
+        db_statement_seconds.observe(elapsed, handler=handler, operation=operation)
+        if elapsed >= SLOW_QUERY_SECONDS:
+            log_slow_query(logger, elapsed, statement, handler)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get('query_started'):
+            context.connection.info['query_started'].pop()
+
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        db_connections_in_use.inc()
+
+    @event.listens_for(engine, 'checkin')
+    def checkin(dbapi_connection, connection_record):
+        db_connections_in_use.dec()
+        connection_record.info.pop('handler', None)
+
+    return engine
+
+@event.listens_for(Session, 'after_begin')
+def _tag_connection(session, transaction, connection):
+    # Запросы учитываются с меткой обработчика, открывшего сессию
+    connection.info['handler'] = session.info.get('handler', 'other')
+
+_engine = None
+_sessionmaker = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Синхронный движок (создается при первом обращении: драйвер базы не загружается при импорте)"""
+    global _engine, _sessionmaker
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = instrument_engine(create_engine(DATABASE_URL, **engine_options(DATABASE_URL)))
+                _sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                _engine = engine
+    return _engine
+
+def SessionLocal(**kwargs):
+    """Новая синхронная сессия"""
+    get_engine()
+    return _sessionmaker(**kwargs)
+
+@contextmanager
+def session_scope(handler):
+    """Сессия для обработчика: фиксация при успехе, откат при ошибке, закрытие в любом случае"""
+    session = SessionLocal(info={'handler': handler})
+    started = time.perf_counter()
+    db_sessions_active.inc()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+        db_sessions_active.dec()
+        db_session_seconds.observe(time.perf_counter() - started, handler=handler)
 
 def test_database_connection(logger):
     """Проверка подключения к базе данных"""
     try:
-        with engine.connect() as connection:
+        with get_engine().connect() as connection:
             result = connection.execute(text("SELECT 1"))
             result.fetchone()
             log_database_connection(logger, success=True)
@@ -26,6 +128,47 @@ def test_database_connection(logger):
         log_database_connection(logger, success=False, error=f"Неожиданная ошибка: {str(e)}")
         return False
 
+def dialect_insert(table, bind=None):
+    """INSERT с поддержкой ON CONFLICT для диалекта базы (PostgreSQL или SQLite)"""
+    if (bind or get_engine()).dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(table)
+
+def _async_database_url(url):
+    """URL базы данных с асинхронным драйвером"""
+    if url.startswith('postgresql://') or url.startswith('postgresql+psycopg2://'):
+        return 'postgresql+asyncpg://' + url.split('://', 1)[1]
+    if url.startswith('sqlite://'):
+        return 'sqlite+aiosqlite://' + url.split('://', 1)[1]
+    return url
+
+_async_sessionmaker = None
+
+def get_async_sessionmaker():
+    """Фабрика асинхронных сессий (создается при первом обращении, только для async-режима)"""
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        url = _async_database_url(DATABASE_URL)
+        async_engine = create_async_engine(url, **engine_options(url))
+        instrument_engine(async_engine.sync_engine)
+        _async_sessionmaker = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker
+
+async def run_db(fn, *args, **kwargs):
+    """Выполнение синхронной функции бизнес-логики в асинхронной сессии"""
+    handler = fn.__name__
+    started = time.perf_counter()
+    db_sessions_active.inc()
+    try:
+        async with get_async_sessionmaker()(info={'handler': handler}) as session:
+            return await session.run_sync(fn, *args, **kwargs)
+    finally:
+        db_sessions_active.dec()
+        db_session_seconds.observe(time.perf_counter() - started, handler=handler)
+
 def get_db():
     """Получение сессии базы данных"""
     db = SessionLocal()
@@ -0,0 +1,84 @@
+import asyncio
+from collections import deque
+from utils import log_error
+
+
+def update_chat_key(update):
+    """Ключ упорядочивания апдейта: чат сообщения или пользователь"""
+    message = update.message or update.edited_message or update.channel_post or update.edited_channel_post
+    if message is not None:
+        return message.chat.id
+    callback = update.callback_query
+    if callback is not None:
+        if callback.message is not None:
+            return callback.message.chat.id
+        return callback.from_user.id
+    for name in ('inline_query', 'chosen_inline_result', 'my_chat_member', 'chat_member', 'chat_join_request'):
+        event = getattr(update, name, None)
+        if event is not None and getattr(event, 'from_user', None) is not None:
+            return event.from_user.id
+    return update.update_id
+
+
+class ChatDispatcher:
+    """Параллельная обработка апдейтов разных чатов с сохранением порядка внутри чата.
+
+    Одновременно выполняется не больше max_concurrency обработчиков,
+    в очередях ожидает не больше max_pending апдейтов.
+    """
+
+    def __init__(self, logger, max_concurrency=100, max_pending=10000):
+        self.logger = logger
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._queues = {}
+        self._tasks = set()
+        self._pending = 0
+        self._capacity = asyncio.Condition()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    async def wait_for_capacity(self):
+        """Ожидание, пока в очередях не освободится место"""
+        async with self._capacity:
+            await self._capacity.wait_for(lambda: self._pending < self.max_pending)
+
+    def submit(self, key, coro_factory):
+        """Постановка обработчика в очередь чата key"""
+        queue = self._queues.get(key)
+        self._pending += 1
+        if queue is None:
+            queue = self._queues[key] = deque([coro_factory])
+            task = asyncio.create_task(self._drain(key, queue))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            queue.append(coro_factory)
+
+    async def _drain(self, key, queue):
+        try:
+            while queue:
+                coro_factory = queue[0]
+                try:
+                    async with self._semaphore:
+                        await coro_factory()
+                except Exception as e:
+                    log_error(self.logger, e, f"обработка апдейта чата {key}")
+                finally:
+                    queue.popleft()
+                    await self._release()
+        finally:
+            if self._queues.get(key) is queue:
+                del self._queues[key]
+
+    async def _release(self):
+        async with self._capacity:
+            self._pending -= 1
+            self._capacity.notify_all()
+
+    async def join(self):
+        """Ожидание обработки всех поставленных апдейтов"""
+        async with self._capacity:
+            await self._capacity.wait_for(lambda: self._pending == 0)
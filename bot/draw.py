@@ -0,0 +1,95 @@
+import random
+import secrets
+from array import array
+from itertools import islice
+from sqlalchemy import select, delete
+from models import GiveawayParticipant, GiveawayWinner
+
+# Выбор победителей без загрузки ORM-объектов участников.
+#
+# ID участников потоково читаются из базы (yield_per, серверный курсор) в компактный
+# array('q') — 8 байт на участника. Порядок участников фиксирован (ORDER BY user_id),
+# поэтому по сохраненному seed результат розыгрыша воспроизводится.
+
+STREAM_CHUNK_SIZE = 10000
+
+
+def new_seed():
+    """Криптографически случайный seed розыгрыша"""
+    return secrets.token_hex(16)
+
+
+def stream_participant_ids(session, giveaway_id, chunk_size=STREAM_CHUNK_SIZE):
+    """Потоковое чтение user_id участников розыгрыша в порядке возрастания"""
+    result = session.execute(
+        select(GiveawayParticipant.user_id)
+        .where(GiveawayParticipant.giveaway_id == giveaway_id)
+        .order_by(GiveawayParticipant.user_id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for partition in result.scalars().partitions():
+        yield from partition
+
+
+def collect_ids(ids):
+    """Сбор итерируемых ID в компактный массив"""
+    result = array('q')
+    iterator = iter(ids)
+    while True:
+        chunk = list(islice(iterator, STREAM_CHUNK_SIZE))
+        if not chunk:
+            return result
+        result.extend(chunk)
+
+
+def load_participant_ids(session, giveaway_id):
+    """Массив user_id всех участников розыгрыша"""
+    return collect_ids(stream_participant_ids(session, giveaway_id))
+
+
+def iter_shuffled(ids, seed):
+    """Участники в случайном порядке, определяемом seed.
+
+    Ленивая перестановка Фишера–Йетса: выбор очередного победителя стоит O(1),
+    дополнительная память — O(выбранных), а не O(участников). Префикс
+    последовательности не зависит от того, сколько элементов будет взято,
+    поэтому перевыбор при дисквалификации продолжает тот же порядок.
+    """
+    rng = random.Random(seed)
+    swaps = {}
+    n = len(ids)
+    for i in range(n):
+        j = rng.randrange(i, n)
+        picked = swaps.get(j, j)
+        swaps[j] = swaps.pop(i, i)
+        yield ids[picked]
+
+
+def pick_winners(ids, count, seed):
+    """Первые count победителей для seed"""
+    return list(islice(iter_shuffled(ids, seed), count))
+
+
+def choose_winners(ids, needed, seed, verify=None):
+    """Выбор победителей в порядке seed.
+
+    verify(user_ids) -> список прошедших проверку (например, подписку) кандидатов.
+    Проверяются только выбранные кандидаты; выбывших заменяют следующие по порядку seed.
+    """
+    order = iter_shuffled(ids, seed)
+    winner_ids = []
+    while len(winner_ids) < needed:
+        candidates = list(islice(order, needed - len(winner_ids)))
+        if not candidates:
+            break
+        winner_ids.extend(verify(candidates) if verify else candidates)
+    return winner_ids
+
+
+def save_winners(session, giveaway_id, winner_ids):
+    """Запись победителей розыгрыша (без фиксации транзакции)"""
+    session.execute(delete(GiveawayWinner).where(GiveawayWinner.giveaway_id == giveaway_id))
+    session.add_all([
+        GiveawayWinner(giveaway_id=giveaway_id, user_id=user_id, position=position)
+        for position, user_id in enumerate(winner_ids, start=1)
+    ])
@@ -0,0 +1,192 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select
+from telebot.apihelper import ApiTelegramException
+from telebot.types import InputFile
+from archive import unpack_participants
+from db import session_scope
+from draw import STREAM_CHUNK_SIZE
+from metrics import counter, histogram
+from models import Giveaway, GiveawayParticipant, GiveawayParticipantArchive, GiveawayWinner, User
+from outbox import log_dropped
+from ratelimit import retry_after
+from tenants import bot_id
+from users import find_user_id
+from utils import log_error, log_info
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_COLUMNS = ('user_id', 'telegram_id', 'username', 'joined_at', 'winner_position')
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024  # ограничение Bot API на отправку файлов
+EXPORT_USAGE_TEXT = 'Использование: /export <номер розыгрыша> [csv|jsonl]\nНомера розыгрышей — в /my_giveaways'
+EXPORT_STARTED_TEXT = 'Готовлю выгрузку участников, пришлю файлом.'
+EXPORT_NOT_FOUND_TEXT = 'Розыгрыш не найден среди ваших.'
+EXPORT_FAILED_TEXT = 'Не удалось подготовить выгрузку, попробуйте позже.'
+
+exports_total = counter('giveaway_exports_total', 'Выгрузки участников (format; result: sent, not_found, too_large, failed)')
+export_seconds = histogram('giveaway_export_seconds', 'Время подготовки и отправки выгрузки')
+
+
+def parse_export_command(text):
+    """'/export 12 jsonl' -> (12, 'jsonl'); формат по умолчанию csv; None, если не распознано"""
+    parts = (text or '').split()[1:]
+    if not parts or len(parts) > 2 or not parts[0].isdigit():
+        return None
+    fmt = parts[1].lower() if len(parts) > 1 else 'csv'
+    if fmt not in EXPORT_FORMATS:
+        return None
+    return int(parts[0]), fmt
+
+
+def stream_export_rows(session, giveaway_id, chunk_size=STREAM_CHUNK_SIZE):
+    """Участники с данными пользователей пачками (серверный курсор) в порядке user_id, как при выборе победителей"""
+    archive = session.get(GiveawayParticipantArchive, giveaway_id)
+    if archive is not None:
+        yield from stream_archived_rows(session, archive, chunk_size)
+        return
+    result = session.execute(
+        select(GiveawayParticipant.user_id, User.telegram_id, User.username, GiveawayParticipant.joined_at)
+        .join(User, User.id == GiveawayParticipant.user_id)
+        .where(GiveawayParticipant.giveaway_id == giveaway_id)
+        .order_by(GiveawayParticipant.user_id)
+        .execution_options(yield_per=chunk_size)
+    )
+    yield from result.partitions()
+
+
+def stream_archived_rows(session, archive, chunk_size=STREAM_CHUNK_SIZE):
+    """Участники из архива завершенного розыгрыша: данные пользователей — одним запросом на пачку"""
+    for chunk in unpack_participants(archive.data, chunk_size):
+        users = {
+            user_id: (telegram_id, username)
+            for user_id, telegram_id, username in session.execute(
+                select(User.id, User.telegram_id, User.username).where(User.id.in_([user_id for user_id, _ in chunk]))
+            )
+        }
+        yield [(user_id, *users[user_id], joined_at) for user_id, joined_at in chunk if user_id in users]
+
+
+def export_header(giveaway, winners):
+    """Сведения о розыгрыше для воспроизведения выбора победителей.
+
+    Победители — первые в draw.iter_shuffled(user_id участников по возрастанию, draw_seed)
+    без выбывших при проверке подписки.
+    """
+    return {
+        'giveaway_id': giveaway.id,
+        'prize': giveaway.prize,
+        'winners_count': giveaway.winners_count,
+        'participants_count': giveaway.participants_count,
+        'finished_at': giveaway.finished_at.isoformat() if giveaway.finished_at else None,
+        'draw_seed': giveaway.draw_seed,
+        'winners': [user_id for user_id, _ in sorted(winners.items(), key=lambda item: item[1])],
+    }
+
+
+def write_export(session, giveaway, fileobj, fmt):
+    """Запись выгрузки розыгрыша в fileobj (gzip) пачками; возвращает число участников.
+
+    CSV начинается строкой-комментарием '# {сведения о розыгрыше}', JSONL — объектом {"giveaway": {...}}.
+    """
+    winners = dict(session.execute(
+        select(GiveawayWinner.user_id, GiveawayWinner.position).where(GiveawayWinner.giveaway_id == giveaway.id)
+    ).all())
+    header = export_header(giveaway, winners)
+    count = 0
+    with gzip.GzipFile(fileobj=fileobj, mode='wb') as compressed, io.TextIOWrapper(compressed, encoding='utf-8', newline='') as out:
+        if fmt == 'csv':
+            out.write(f"# {json.dumps(header, ensure_ascii=False)}\n")
+            writer = csv.writer(out)
+            writer.writerow(EXPORT_COLUMNS)
+        else:
+            out.write(json.dumps({'giveaway': header}, ensure_ascii=False) + '\n')
+        for partition in stream_export_rows(session, giveaway.id):
+            rows = [
+                (user_id, telegram_id, username, joined_at.isoformat() if joined_at else None, winners.get(user_id))
+                for user_id, telegram_id, username, joined_at in partition
+            ]
+            if fmt == 'csv':
+                writer.writerows(rows)
+            else:
+                out.write(''.join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + '\n' for row in rows))
+            count += len(rows)
+    return count
+
+
+class Exporter:
+    """Выгрузка участников розыгрыша его создателю.
+
+    Файл собирается в фоновом потоке во временный файл на диске, поэтому память не зависит
+    от числа участников, и отправляется документом напрямую через Bot API (очередь отправки
+    не подходит для повторной загрузки файла). Текстовые ответы идут через очередь.
+    Выгружаются только розыгрыши бота outbox.api; боты одного процесса разделяют пул (shared).
+    """
+
+    def __init__(self, outbox, logger, workers=None, retries=3, shared=None):
+        self.outbox = outbox
+        self.logger = logger
+        self.retries = retries
+        self.bot_id = bot_id(outbox.api.token)
+        self.executor = shared.executor if shared is not None else ThreadPoolExecutor(
+            max_workers=workers or int(os.getenv('EXPORT_WORKERS', '2')),
+            thread_name_prefix='giveaway-export',
+        )
+
+    def submit(self, chat_id, tg_user, giveaway_id, fmt):
+        if not self.outbox.send_message(chat_id, EXPORT_STARTED_TEXT):
+            log_dropped(self.logger, chat_id, 'export')
+        return self.executor.submit(self.export, chat_id, tg_user, giveaway_id, fmt)
+
+    def export(self, chat_id, tg_user, giveaway_id, fmt):
+        started = time.perf_counter()
+        result = 'failed'
+        try:
+            with tempfile.TemporaryFile(prefix='export-') as fileobj:
+                with session_scope('export_giveaway') as session:
+                    giveaway = session.get(Giveaway, giveaway_id)
+                    if (giveaway is None or giveaway.bot_id != self.bot_id or giveaway.creator_id is None
+                            or giveaway.creator_id != find_user_id(session, tg_user)):
+                        result = 'not_found'
+                        if not self.outbox.send_message(chat_id, EXPORT_NOT_FOUND_TEXT):
+                            log_dropped(self.logger, chat_id, 'export')
+                        return
+                    count = write_export(session, giveaway, fileobj, fmt)
+                    seed = giveaway.draw_seed
+                size = fileobj.tell()
+                if size > MAX_DOCUMENT_SIZE:
+                    result = 'too_large'
+                    text = f"Выгрузка слишком большая ({size // 2**20} МБ), Telegram принимает файлы до 50 МБ."
+                    if not self.outbox.send_message(chat_id, text):
+                        log_dropped(self.logger, chat_id, 'export')
+                    return
+                caption = f"Розыгрыш {giveaway_id}: участников {count}, seed {seed or 'еще не выбран'}"
+                self._send_document(chat_id, fileobj, f'giveaway_{giveaway_id}.{fmt}.gz', caption)
+                result = 'sent'
+                log_info(self.logger, f"Выгрузка розыгрыша {giveaway_id} ({fmt}): {count} участников, {size} байт")
+        except Exception as e:
+            log_error(self.logger, e, f"выгрузка участников розыгрыша {giveaway_id}")
+            if not self.outbox.send_message(chat_id, EXPORT_FAILED_TEXT):
+                log_dropped(self.logger, chat_id, 'export')
+        finally:
+            exports_total.inc(format=fmt, result=result)
+            export_seconds.observe(time.perf_counter() - started)
+
+    def _send_document(self, chat_id, fileobj, file_name, caption):
+        """Отправка файла с повтором после 429"""
+        for attempt in range(self.retries):
+            fileobj.seek(0)
+            try:
+                return self.outbox.api.send_document(chat_id, InputFile(fileobj, file_name=file_name), caption=caption)
+            except ApiTelegramException as e:
+                delay = retry_after(e)
+                if delay is None or attempt == self.retries - 1:
+                    raise
+                time.sleep(delay)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
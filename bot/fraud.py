@@ -0,0 +1,295 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from array import array
+from collections import Counter
+from cache import TTLCache
+from metrics import counter
+from utils import log_info
+
+joins_screened_total = counter('giveaway_joins_screened_total', 'Проверка заявок на накрутку (result: ok, flagged, rejected; reason)')
+
+
+def _hash64(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+
+def _hash_pair(key):
+    """Два независимых 64-битных хеша ключа (для двойного хеширования)"""
+    digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class BloomFilter:
+    """Фильтр Блума: проверка «ключ уже встречался» с ложноположительными ответами с вероятностью error_rate"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, hashes):
+        h1, h2 = hashes
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % self.size
+            yield bit >> 3, 1 << (bit & 7)
+
+    def contains(self, hashes):
+        return all(self._bits[byte] & mask for byte, mask in self._positions(hashes))
+
+    def insert(self, hashes):
+        """Добавление ключа по его хешам (_hash_pair); True, если его точно не было"""
+        new = False
+        for byte, mask in self._positions(hashes):
+            if not self._bits[byte] & mask:
+                self._bits[byte] |= mask
+                new = True
+        return new
+
+    def add(self, key):
+        """Добавление ключа; True, если его точно не было"""
+        return self.insert(_hash_pair(key))
+
+
+class ScalableBloomFilter:
+    """Фильтр Блума, растущий с числом ключей: заполненный фильтр дополняется новым вдвое большей емкости
+    с вдвое меньшей вероятностью ошибки, поэтому суммарная вероятность остается ниже error_rate,
+    а память — пропорциональна числу ключей (около 1.2 байта на ключ)"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate / 2
+        self.filters = [BloomFilter(self.capacity, self.error_rate)]
+        self._count = 0  # ключей в последнем фильтре
+
+    def add(self, key):
+        """Добавление ключа; True, если его точно не было"""
+        hashes = _hash_pair(key)
+        if any(f.contains(hashes) for f in self.filters[:-1]) or not self.filters[-1].insert(hashes):
+            return False
+        self._count += 1
+        if self._count >= self.capacity:
+            self.capacity *= 2
+            self.error_rate /= 2
+            self.filters.append(BloomFilter(self.capacity, self.error_rate))
+            self._count = 0
+        return True
+
+
+class HyperLogLog:
+    """Оценка числа уникальных ключей в 2**precision байт; относительная ошибка около 1.04 / sqrt(2**precision)"""
+
+    def __init__(self, precision=10):
+        self.precision = precision
+        self._registers = bytearray(1 << precision)
+
+    def add(self, key):
+        value = _hash64(key)
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def count(self):
+        m = len(self._registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -register for register in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))  # малые значения: linear counting
+        return round(estimate)
+
+
+class _SlidingWindow:
+    """Окно window секунд из slots интервалов; интервалы старше окна обнуляются"""
+
+    def __init__(self, window, slots):
+        self.slot_seconds = window / slots
+        self._slots = [self._empty() for _ in range(slots)]
+        self._current = int(time.monotonic() / self.slot_seconds)
+
+    def _advance(self, now):
+        current = int(now / self.slot_seconds)
+        for tick in range(self._current + 1, min(current, self._current + len(self._slots)) + 1):
+            self._slots[tick % len(self._slots)] = self._empty()
+        self._current = max(self._current, current)
+
+
+class SlidingCountMin(_SlidingWindow):
+    """Счетчики событий по ключам за последние window секунд в фиксированной памяти.
+
+    Для каждого интервала окна — count-min sketch depth x width с консервативным обновлением
+    (увеличиваются только счетчики, которые иначе оказались бы ниже новой оценки).
+    Оценка никогда не занижает число событий и может завышать его при коллизиях, поэтому служит
+    только фильтром: решения принимаются по точным счетчикам.
+    """
+
+    def __init__(self, window, slots=6, width=4096, depth=4):
+        self.width = width
+        self.depth = depth
+        super().__init__(window, slots)
+
+    def _empty(self):
+        return array('I', bytes(4 * self.width * self.depth))
+
+    def _cells(self, key):
+        h1, h2 = _hash_pair(key)
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, key, now=None):
+        """Учет события; возвращает оценку числа событий ключа в окне"""
+        self._advance(time.monotonic() if now is None else now)
+        cells = self._cells(key)
+        table = self._slots[self._current % len(self._slots)]
+        totals = [sum(slot[cell] for slot in self._slots) for cell in cells]
+        estimate = min(totals) + 1
+        for cell, total in zip(cells, totals):
+            if total < estimate:
+                table[cell] += estimate - total
+        return estimate
+
+    def estimate(self, key, now=None):
+        self._advance(time.monotonic() if now is None else now)
+        return min(sum(table[cell] for table in self._slots) for cell in self._cells(key))
+
+
+class SlidingCounter(_SlidingWindow):
+    """Точные счетчики событий по ключам за последние window секунд; память — по числу ключей в окне"""
+
+    def __init__(self, window, slots=6):
+        super().__init__(window, slots)
+
+    def _empty(self):
+        return Counter()
+
+    def add(self, key, now=None):
+        """Учет события; возвращает число событий ключа в окне"""
+        self._advance(time.monotonic() if now is None else now)
+        self._slots[self._current % len(self._slots)][key] += 1
+        return sum(slot[key] for slot in self._slots)
+
+    def count(self, key, now=None):
+        self._advance(time.monotonic() if now is None else now)
+        return sum(slot.get(key, 0) for slot in self._slots)
+
+
+class GiveawayStats:
+    """Состояние проверки одного розыгрыша: около 1.2 байта на нажимавшего пользователя и несколько КБ"""
+
+    def __init__(self, bloom_capacity, window):
+        self.seen = ScalableBloomFilter(bloom_capacity)  # кто уже нажимал кнопку
+        self.buckets = SlidingCounter(window)  # заявки за окно: всего ('*') и по возрастным диапазонам id
+        self.unique = HyperLogLog()
+        self.attempts = 0
+        self.flagged = 0
+        self.rejected = 0
+
+
+class FraudScreen:
+    """Проверка заявок на участие на накрутку без обращений к базе, O(1) на заявку.
+
+    Признаки: аккаунт-бот (is_bot); слишком много заявок одного пользователя во все розыгрыши за окно;
+    всплеск заявок в розыгрыш от аккаунтов из одного «возрастного» диапазона id. Telegram выдает id
+    по возрастанию, поэтому близкие id — аккаунты, созданные примерно в одно время, как у фермы ботов.
+    Повторные нажатия одного пользователя (фильтр Блума розыгрыша) в счетчиках не учитываются.
+
+    Заявки пользователей во все розыгрыши считает общий count-min sketch, рассчитанный на expected_joins
+    заявок за окно. Его оценка только завышает, поэтому по ней пользователь лишь попадает под точный
+    подсчет (когда оценка превышает половину лимита), а отклоняется по точному счетчику. Диапазоны id
+    считаются точно по каждому розыгрышу: их немного. Ошибки оценок ведут к лишнему подсчету, а не к отказу.
+    Фильтр Блума растет вместе с числом участников, а статистика хранится не более чем для max_giveaways
+    розыгрышей (LRU).
+    """
+
+    def __init__(self, logger, action=None, window=None, user_limit=None, age_bucket=None,
+                 burst_min=None, burst_share=None, bloom_capacity=None, expected_joins=None, max_giveaways=None):
+        self.logger = logger
+        self.action = action or os.getenv('FRAUD_ACTION', 'reject').lower()  # reject | flag
+        self.user_limit = user_limit or int(os.getenv('FRAUD_USER_LIMIT', '10'))
+        self.age_bucket = age_bucket or int(os.getenv('FRAUD_AGE_BUCKET', '10000000'))
+        self.burst_min = burst_min or int(os.getenv('FRAUD_BURST_MIN', '200'))
+        self.burst_share = burst_share or float(os.getenv('FRAUD_BURST_SHARE', '0.8'))
+        self.bloom_capacity = bloom_capacity or int(os.getenv('FRAUD_BLOOM_CAPACITY', '10000'))
+        self.window = window or float(os.getenv('FRAUD_WINDOW', '60'))
+        expected_joins = expected_joins or int(os.getenv('FRAUD_EXPECTED_JOINS', '100000'))
+        # Ширина sketch: ожидаемое завышение при expected_joins заявках в окне — не больше половины лимита
+        width = max(1024, math.ceil(2 * math.e * expected_joins / self.user_limit))
+        self._users = SlidingCountMin(self.window, width=width)  # оценка заявок пользователя во все розыгрыши
+        self._watched = SlidingCounter(self.window)  # точные заявки пользователей с высокой оценкой
+        # giveaway_id -> GiveawayStats; проверяются только идущие розыгрыши (JoinBuffer.open), давно не
+        # получавшие заявок вытесняются при превышении max_giveaways
+        self._giveaways = TTLCache(max_giveaways or int(os.getenv('FRAUD_MAX_GIVEAWAYS', '1000')), name='fraud_giveaways')
+        self._lock = threading.Lock()
+
+    def reason(self, giveaway_id, tg_user):
+        """Причина подозрения ('bot', 'user_rate', 'age_burst') или None"""
+        if tg_user.is_bot:
+            return 'bot'
+        user_key = str(tg_user.id)
+        bucket = tg_user.id // self.age_bucket
+        with self._lock:
+            stats = self._giveaways.get(giveaway_id)
+            if stats is None:
+                stats = GiveawayStats(self.bloom_capacity, self.window)
+                self._giveaways.set(giveaway_id, stats)
+            stats.attempts += 1
+            if stats.seen.add(user_key):
+                stats.unique.add(user_key)
+                estimate = self._users.add(user_key)
+                if estimate > self.user_limit // 2 or self._watched.count(user_key):
+                    user_joins = self._watched.add(user_key)
+                else:
+                    user_joins = 0
+                bucket_joins = stats.buckets.add(bucket)
+                total_joins = stats.buckets.add('*')
+            else:
+                user_joins = self._watched.count(user_key)
+                bucket_joins = stats.buckets.count(bucket)
+                total_joins = stats.buckets.count('*')
+        if user_joins > self.user_limit:
+            return 'user_rate'
+        if total_joins >= self.burst_min and bucket_joins >= self.burst_share * total_joins:
+            return 'age_burst'
+        return None
+
+    def check(self, giveaway_id, tg_user):
+        """True, если заявку можно принять (в режиме flag подозрительные заявки только учитываются)"""
+        reason = self.reason(giveaway_id, tg_user)
+        if reason is None:
+            joins_screened_total.inc(result='ok')
+            return True
+        rejected = self.action == 'reject'
+        with self._lock:
+            stats = self._giveaways.get(giveaway_id)
+            if stats is not None:
+                if rejected:
+                    stats.rejected += 1
+                else:
+                    stats.flagged += 1
+        joins_screened_total.inc(result='rejected' if rejected else 'flagged', reason=reason)
+        return not rejected
+
+    def unique_joiners(self, giveaway_id):
+        """Оценка числа разных пользователей, нажимавших кнопку участия"""
+        with self._lock:
+            stats = self._giveaways.get(giveaway_id)
+            return stats.unique.count() if stats else 0
+
+    def close(self, giveaway_id):
+        """Освобождение памяти завершенного розыгрыша с записью итогов в лог"""
+        with self._lock:
+            stats = self._giveaways.pop(giveaway_id, None)
+        if stats is not None:
+            log_info(self.logger, (
+                f"Розыгрыш {giveaway_id}: нажатий {stats.attempts}, пользователей ~{stats.unique.count()}, "
+                f"подозрительных {stats.flagged}, отклонено {stats.rejected}"
+            ))
+
+
+def create_fraud_screen(logger):
+    """Проверка заявок на накрутку; None, если отключена (FRAUD_SCREEN=0)"""
+    if os.getenv('FRAUD_SCREEN', '1') == '0':
+        return None
+    return FraudScreen(logger)
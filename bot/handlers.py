@@ -1,10 +1,15 @@
 import telebot
 from telebot import types
-from models import  User, Channel, Giveaway, GiveawayChannel, GiveawayParticipant, SupportRequest
-from db import SessionLocal
-from utils import log_command, log_error, log_info
-
-user_states = {}  # Для хранения промежуточных данных по chat_id
+from db import session_scope
+from export import EXPORT_USAGE_TEXT, parse_export_command
+from join import parse_join_callback
+from outbox import log_dropped
+from services import (
+    HELP_TEXT, LIST_PAGES, join_reply,
+    list_giveaways_page, list_channels_page, parse_page_callback,
+)
+from utils import log_command, log_error
+from wizard import STEP_CONTENT_TYPES, begin, load_state, advance
 
 
 def register_handlers(bot):
@@ -12,199 +17,97 @@ def register_handlers(bot):
     def help_handler(message):
         try:
             log_command(bot.logger, message.from_user.id, message.from_user.username, 'help')
-            bot.send_message(
-                message.chat.id,
-                'Доступные команды:\n'
-                '/new_giveaway — создать розыгрыш\n'
-                '/my_giveaways — мои розыгрыши\n'
-                '/add_channel — добавить канал\n'
-                '/my_channels — мои каналы\n'
-                '/support — написать в поддержку'
-            )
+            if not bot.outbox.send_message(message.chat.id, HELP_TEXT):
+                log_dropped(bot.logger, message.chat.id, 'help')
         except Exception as e:
             log_error(bot.logger, e, f"обработка команды /help от пользователя {message.from_user.id}")
 
-    # === Создание розыгрыша ===
-    @bot.message_handler(commands=['new_giveaway'])
-    def new_giveaway_handler(message):
-        try:
-            log_command(bot.logger, message.from_user.id, message.from_user.username, 'new_giveaway')
-            user_states[message.chat.id] = {}
-            msg = bot.send_message(message.chat.id, "Пришлите медиа для розыгрыша (фото, видео или GIF)")
-            bot.register_next_step_handler(msg, process_giveaway_media)
-        except Exception as e:
-            log_error(bot.logger, e, f"обработка команды /new_giveaway от пользователя {message.from_user.id}")
-
-    def process_giveaway_media(message):
-        try:
-            user_states[message.chat.id]['media'] = getattr(message, 'photo', None) or getattr(message, 'video', None) or getattr(message, 'document', None)
-            msg = bot.send_message(message.chat.id, "Введите описание розыгрыша и приз")
-            bot.register_next_step_handler(msg, process_giveaway_description)
-        except Exception as e:
-            log_error(bot.logger, e, f"обработка медиа для розыгрыша от пользователя {message.from_user.id}")
-
-    def process_giveaway_description(message):
-        try:
-            user_states[message.chat.id]['description'] = message.text
-            msg = bot.send_message(message.chat.id, "Укажите обязательные подписки (через запятую ссылки на каналы/группы) или напишите 'нет'")
-            bot.register_next_step_handler(msg, process_giveaway_channels)
-        except Exception as e:
-            log_error(bot.logger, e, f"обработка описания розыгрыша от пользователя {message.from_user.id}")
-
-    def process_giveaway_channels(message):
-        try:
-            user_states[message.chat.id]['channels'] = message.text
-            msg = bot.send_message(message.chat.id, "Сколько будет победителей?")
-            bot.register_next_step_handler(msg, process_giveaway_winners)
-        except Exception as e:
-            log_error(bot.logger, e, f"обработка каналов розыгрыша от пользователя {message.from_user.id}")
-
-    def process_giveaway_winners(message):
-        try:
-            if not message.text.isdigit():
-                msg = bot.send_message(message.chat.id, "Введите число победителей:")
-                bot.register_next_step_handler(msg, process_giveaway_winners)
-                return
-            user_states[message.chat.id]['winners_count'] = int(message.text)
-            msg = bot.send_message(message.chat.id, "Укажите дату и время окончания (например, 2024-08-01 18:00)")
-            bot.register_next_step_handler(msg, process_giveaway_endtime)
-        except Exception as e:
-            log_error(bot.logger, e, f"обработка количества победителей от пользователя {message.from_user.id}")
-
-    def process_giveaway_endtime(message):
+    # === Создание розыгрыша, добавление канала, поддержка (диалоги, см. wizard.py) ===
+    @bot.message_handler(commands=['new_giveaway', 'add_channel', 'support'])
+    def wizard_command_handler(message):
+        command = message.text.split()[0].split('@')[0].lstrip('/')
         try:
-            user_states[message.chat.id]['end_datetime'] = message.text  # Здесь можно добавить парсинг и валидацию
-            msg = bot.send_message(message.chat.id, "Введите текст кнопки участия (по умолчанию 'Участвовать') или напишите 'по умолчанию'")
-            bot.register_next_step_handler(msg, process_giveaway_button)
+            log_command(bot.logger, message.from_user.id, message.from_user.username, command)
+            if not bot.outbox.send_message(message.chat.id, begin(bot.state_store, message.chat.id, command)):
+                log_dropped(bot.logger, message.chat.id, 'command')
         except Exception as e:
-            log_error(bot.logger, e, f"обработка времени окончания розыгрыша от пользователя {message.from_user.id}")
-
-    def process_giveaway_button(message):
-        try:
-            button_text = message.text if message.text.lower() != 'по умолчанию' else 'Участвовать'
-            user_states[message.chat.id]['button_text'] = button_text
-            session = SessionLocal()
-            user = session.query(User).filter_by(telegram_id=str(message.from_user.id)).first()
-            if not user:
-                user = User(telegram_id=str(message.from_user.id), username=message.from_user.username)
-                session.add(user)
-                session.commit()
-                log_info(bot.logger, f"Создан новый пользователь: {message.from_user.username} (ID: {message.from_user.id})")
-            
-            giveaway = Giveaway(
-                creator_id=user.id,
-                description=user_states[message.chat.id]['description'],
-                prize=user_states[message.chat.id]['description'],
-                winners_count=user_states[message.chat.id]['winners_count'],
-                end_datetime=user_states[message.chat.id]['end_datetime'],
-                join_button_text=user_states[message.chat.id]['button_text']
-            )
-            session.add(giveaway)
-            session.commit()
-            session.close()
-            log_info(bot.logger, f"Создан новый розыгрыш пользователем {message.from_user.username} (ID: {message.from_user.id})")
-            bot.send_message(message.chat.id, "Розыгрыш успешно создан!")
-            user_states.pop(message.chat.id, None)
-        except Exception as e:
-            log_error(bot.logger, e, f"создание розыгрыша пользователем {message.from_user.id}")
+            log_error(bot.logger, e, f"обработка команды /{command} от пользователя {message.from_user.id}")
 
     # === Просмотр розыгрышей ===
     @bot.message_handler(commands=['my_giveaways'])
     def my_giveaways_handler(message):
         try:
             log_command(bot.logger, message.from_user.id, message.from_user.username, 'my_giveaways')
-            session = SessionLocal()
-            user = session.query(User).filter_by(telegram_id=str(message.from_user.id)).first()
-            if not user:
-                bot.send_message(message.chat.id, 'У вас нет созданных розыгрышей.')
-                session.close()
-                return
-            giveaways = session.query(Giveaway).filter_by(creator_id=user.id).all()
-            if not giveaways:
-                bot.send_message(message.chat.id, 'У вас нет созданных розыгрышей.')
-            else:
-                text = '\n'.join([f"{g.id}: {g.description or 'Без описания'}" for g in giveaways])
-                bot.send_message(message.chat.id, f'Ваши розыгрыши:\n{text}')
-            session.close()
+            with session_scope('list_giveaways_page') as session:
+                text, markup = list_giveaways_page(session, bot.bot_id, message.from_user)
+            if not bot.outbox.send_message(message.chat.id, text, reply_markup=markup):
+                log_dropped(bot.logger, message.chat.id, 'my_giveaways')
         except Exception as e:
             log_error(bot.logger, e, f"просмотр розыгрышей пользователем {message.from_user.id}")
 
-    # === Добавление канала ===
-    @bot.message_handler(commands=['add_channel'])
-    def add_channel_handler(message):
-        try:
-            log_command(bot.logger, message.from_user.id, message.from_user.username, 'add_channel')
-            msg = bot.send_message(message.chat.id, "Пришлите ссылку на канал или группу, где вы администратор:")
-            bot.register_next_step_handler(msg, process_add_channel)
-        except Exception as e:
-            log_error(bot.logger, e, f"обработка команды /add_channel от пользователя {message.from_user.id}")
-
-    def process_add_channel(message):
+    # === Выгрузка участников ===
+    @bot.message_handler(commands=['export'])
+    def export_handler(message):
         try:
-            link = message.text
-            session = SessionLocal()
-            user = session.query(User).filter_by(telegram_id=str(message.from_user.id)).first()
-            if not user:
-                user = User(telegram_id=str(message.from_user.id), username=message.from_user.username)
-                session.add(user)
-                session.commit()
-                log_info(bot.logger, f"Создан новый пользователь: {message.from_user.username} (ID: {message.from_user.id})")
-            
-            channel = Channel(telegram_id=link, title=link, owner_id=user.id)
-            session.add(channel)
-            session.commit()
-            session.close()
-            log_info(bot.logger, f"Добавлен новый канал пользователем {message.from_user.username} (ID: {message.from_user.id}): {link}")
-            bot.send_message(message.chat.id, "Канал успешно добавлен!")
+            log_command(bot.logger, message.from_user.id, message.from_user.username, 'export')
+            command = parse_export_command(message.text)
+            if command is None:
+                if not bot.outbox.send_message(message.chat.id, EXPORT_USAGE_TEXT):
+                    log_dropped(bot.logger, message.chat.id, 'export')
+            else:
+                bot.exporter.submit(message.chat.id, message.from_user, *command)
         except Exception as e:
-            log_error(bot.logger, e, f"добавление канала пользователем {message.from_user.id}")
+            log_error(bot.logger, e, f"выгрузка участников пользователем {message.from_user.id}")
 
     # === Просмотр каналов ===
     @bot.message_handler(commands=['my_channels'])
     def my_channels_handler(message):
         try:
             log_command(bot.logger, message.from_user.id, message.from_user.username, 'my_channels')
-            session = SessionLocal()
-            user = session.query(User).filter_by(telegram_id=str(message.from_user.id)).first()
-            if not user:
-                bot.send_message(message.chat.id, 'У вас нет добавленных каналов.')
-                session.close()
-                return
-            channels = session.query(Channel).filter_by(owner_id=user.id).all()
-            if not channels:
-                bot.send_message(message.chat.id, 'У вас нет добавленных каналов.')
-            else:
-                text = '\n'.join([f"{c.id}: {c.title or c.telegram_id}" for c in channels])
-                bot.send_message(message.chat.id, f'Ваши каналы:\n{text}')
-            session.close()
+            with session_scope('list_channels_page') as session:
+                text, markup = list_channels_page(session, bot.bot_id, message.from_user)
+            if not bot.outbox.send_message(message.chat.id, text, reply_markup=markup):
+                log_dropped(bot.logger, message.chat.id, 'my_channels')
         except Exception as e:
             log_error(bot.logger, e, f"просмотр каналов пользователем {message.from_user.id}")
 
-    # === Поддержка ===
-    @bot.message_handler(commands=['support'])
-    def support_handler(message):
+    # === Переход между страницами списков ===
+    @bot.callback_query_handler(func=lambda call: parse_page_callback(call.data) is not None)
+    def page_callback(call):
+        try:
+            kind, direction, cursor = parse_page_callback(call.data)
+            page = LIST_PAGES[kind]
+            with session_scope(page.__name__) as session:
+                text, markup = page(session, bot.bot_id, call.from_user, direction, cursor)
+            if not bot.outbox.edit_message_text(call.message.chat.id, call.message.message_id, text, reply_markup=markup):
+                log_dropped(bot.logger, call.message.chat.id, 'page')
+            bot.answer_callback_query(call.id)
+        except Exception as e:
+            log_error(bot.logger, e, f"переход по списку пользователем {call.from_user.id}")
+
+    # === Участие в розыгрыше ===
+    @bot.callback_query_handler(func=lambda call: parse_join_callback(call.data) is not None)
+    def join_giveaway_callback(call):
         try:
-            log_command(bot.logger, message.from_user.id, message.from_user.username, 'support')
-            msg = bot.send_message(message.chat.id, "Опишите вашу проблему или вопрос:")
-            bot.register_next_step_handler(msg, process_support_message)
+            joined = bot.join_buffer.add(parse_join_callback(call.data), call.from_user, bot.bot_id)
+            bot.answer_callback_query(call.id, join_reply(joined))
         except Exception as e:
-            log_error(bot.logger, e, f"обработка команды /support от пользователя {message.from_user.id}")
+            log_error(bot.logger, e, f"участие в розыгрыше пользователя {call.from_user.id}")
 
-    def process_support_message(message):
+    # === Шаги диалогов (регистрируется последним: команды важнее незавершенного диалога) ===
+    @bot.message_handler(func=lambda message: load_state(bot.state_store, message), content_types=STEP_CONTENT_TYPES)
+    def wizard_step_handler(message):
+        step = message.wizard_state[0]
         try:
-            session = SessionLocal()
-            user = session.query(User).filter_by(telegram_id=str(message.from_user.id)).first()
-            if not user:
-                user = User(telegram_id=str(message.from_user.id), username=message.from_user.username)
-                session.add(user)
-                session.commit()
-                log_info(bot.logger, f"Создан новый пользователь: {message.from_user.username} (ID: {message.from_user.id})")
-            
-            support = SupportRequest(user_id=user.id, message=message.text)
-            session.add(support)
-            session.commit()
-            session.close()
-            log_info(bot.logger, f"Отправлено сообщение в поддержку от пользователя {message.from_user.username} (ID: {message.from_user.id})")
-            bot.send_message(message.chat.id, "Ваше сообщение отправлено в поддержку!")
+            step, transition, data = advance(bot.state_store, message)
+            reply = transition.reply
+            if transition.prepare:
+                transition.prepare(message.from_user, data, bot)
+            if transition.action:
+                with session_scope(transition.action.__name__) as session:
+                    reply = transition.action(session, message.from_user, data, bot)
+            if reply:
+                if not bot.outbox.send_message(message.chat.id, reply):
+                    log_dropped(bot.logger, message.chat.id, 'wizard')
         except Exception as e:
-            log_error(bot.logger, e, f"отправка сообщения в поддержку пользователем {message.from_user.id}") 
\ No newline at end of file
+            log_error(bot.logger, e, f"шаг диалога {step} пользователя {message.from_user.id}")
@@ -0,0 +1,124 @@
+import functools
+import inspect
+import time
+from telebot import apihelper, util
+from telebot.types import CallbackQuery
+from metrics import counter, histogram
+from utils import current_handler
+
+HANDLER_LISTS = (
+    'message_handlers', 'edited_message_handlers', 'channel_post_handlers', 'edited_channel_post_handlers',
+    'callback_query_handlers', 'inline_handlers', 'chosen_inline_handlers', 'my_chat_member_handlers',
+    'chat_member_handlers', 'chat_join_request_handlers',
+)
+
+handler_calls_total = counter('handler_calls_total', 'Вызовы обработчиков (handler: /команда, step:шаг, callback:префикс)')
+handler_exceptions_total = counter('handler_exceptions_total', 'Необработанные исключения обработчиков (handler)')
+handler_seconds = histogram('handler_seconds', 'Время выполнения обработчиков (handler)')
+telegram_api_seconds = histogram('telegram_api_seconds', 'Время запросов к Bot API (method)')
+telegram_api_errors_total = counter('telegram_api_errors_total', 'Неудачные запросы к Bot API (method)')
+
+
+def handler_label(name, update):
+    """Метка метрик обработчика: команда, шаг диалога или префикс callback data"""
+    if isinstance(update, CallbackQuery):
+        return 'callback:' + (update.data or '').split(':', 1)[0]
+    state = getattr(update, 'wizard_state', None)
+    if state is not None:
+        return f'step:{state[0]}'
+    command = util.extract_command(getattr(update, 'text', None))
+    if command:
+        return '/' + command.split('@', 1)[0]
+    return name
+
+
+def _wrap(function):
+    name = function.__name__
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def wrapper(update, *args, **kwargs):
+            label = handler_label(name, update)
+            token = current_handler.set(label)
+            started = time.perf_counter()
+            try:
+                return await function(update, *args, **kwargs)
+            except Exception:
+                handler_exceptions_total.inc(handler=label)
+                raise
+            finally:
+                handler_seconds.observe(time.perf_counter() - started, handler=label)
+                handler_calls_total.inc(handler=label)
+                current_handler.reset(token)
+    else:
+        @functools.wraps(function)
+        def wrapper(update, *args, **kwargs):
+            label = handler_label(name, update)
+            token = current_handler.set(label)
+            started = time.perf_counter()
+            try:
+                return function(update, *args, **kwargs)
+            except Exception:
+                handler_exceptions_total.inc(handler=label)
+                raise
+            finally:
+                handler_seconds.observe(time.perf_counter() - started, handler=label)
+                handler_calls_total.inc(handler=label)
+                current_handler.reset(token)
+
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument_handlers(bot):
+    """Обертка всех зарегистрированных обработчиков бота (TeleBot или AsyncTeleBot) метриками.
+
+    Вызывается после регистрации обработчиков; повторный вызов оборачивает только новые.
+    """
+    wrapped = 0
+    for attribute in HANDLER_LISTS:
+        for handler in getattr(bot, attribute, ()):
+            if not getattr(handler['function'], 'instrumented', False):
+                handler['function'] = _wrap(handler['function'])
+                wrapped += 1
+    return wrapped
+
+
+def instrument_api():
+    """Учет времени всех запросов к Bot API (синхронных и асинхронных); повторный вызов ничего не делает"""
+    make_request = apihelper._make_request
+    if getattr(make_request, 'instrumented', False):
+        return
+
+    @functools.wraps(make_request)
+    def timed_make_request(token, method_name, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return make_request(token, method_name, *args, **kwargs)
+        except Exception:
+            telegram_api_errors_total.inc(method=method_name)
+            raise
+        finally:
+            telegram_api_seconds.observe(time.perf_counter() - started, method=method_name)
+
+    timed_make_request.instrumented = True
+    apihelper._make_request = timed_make_request
+
+    try:
+        from telebot import asyncio_helper  # требует aiohttp
+    except ImportError:
+        return
+    process_request = asyncio_helper._process_request
+
+    @functools.wraps(process_request)
+    async def timed_process_request(token, url, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await process_request(token, url, *args, **kwargs)
+        except Exception:
+            telegram_api_errors_total.inc(method=url)
+            raise
+        finally:
+            telegram_api_seconds.observe(time.perf_counter() - started, method=url)
+
+    asyncio_helper._process_request = timed_process_request
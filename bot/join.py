@@ -0,0 +1,297 @@
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import select, update, bindparam
+from cache import TTLCache
+from db import session_scope, dialect_insert
+from metrics import counter, gauge, histogram, SIZE_BUCKETS
+from models import User, Giveaway, GiveawayParticipant
+from users import user_ids as cached_user_ids, remember
+from utils import log_error
+
+JOIN_CALLBACK_PREFIX = 'join:'
+JOIN_REJECTED = 'rejected'  # результат add: заявка отклонена проверкой на накрутку
+
+joins_total = counter('giveaway_joins_total', 'Принятые заявки на участие')
+joins_duplicate_total = counter('giveaway_joins_duplicate_total', 'Повторные нажатия кнопки участия')
+join_buffer_size = gauge('giveaway_join_buffer_size', 'Заявки, ожидающие записи в базу')
+join_flush_seconds = histogram('giveaway_join_flush_seconds', 'Длительность записи пачки участников')
+join_flush_batch_size = histogram('giveaway_join_flush_batch_size', 'Размер пачки участников', SIZE_BUCKETS)
+join_flush_errors_total = counter('giveaway_join_flush_errors_total', 'Ошибки записи пачки участников')
+
+
+class JoinFlushError(Exception):
+    """Часть заявок не записана в базу; они остались в буфере до следующей записи"""
+
+
+def parse_join_callback(data):
+    """ID розыгрыша из callback_data кнопки участия или None"""
+    if not data or not data.startswith(JOIN_CALLBACK_PREFIX):
+        return None
+    giveaway_id = data[len(JOIN_CALLBACK_PREFIX):]
+    return int(giveaway_id) if giveaway_id.isdigit() else None
+
+
+class OpenGiveaways:
+    """Идущие розыгрыши ботов процесса: giveaway_id -> bot_id, без запросов к базе на каждое нажатие.
+
+    Загружаются при запуске (load) и периодически обновляются (refresh) — так появляются розыгрыши,
+    созданные другой репликой, и исчезают завершенные ею. Созданные в процессе добавляются сразу (add),
+    проводимые снимаются (discard). Изменения во время обновления не теряются.
+    """
+
+    def __init__(self):
+        self.bot_ids = []
+        self._open = {}
+        self._changes = None  # giveaway_id -> bot_id или None, пока идет обновление
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._open)
+
+    def get(self, giveaway_id):
+        """bot_id идущего розыгрыша или None"""
+        return self._open.get(giveaway_id)
+
+    def add(self, giveaway_id, bot_id):
+        with self._lock:
+            self._open[giveaway_id] = bot_id
+            if self._changes is not None:
+                self._changes[giveaway_id] = bot_id
+
+    def discard(self, giveaway_id):
+        """Снятие розыгрыша; возвращает его bot_id или None"""
+        with self._lock:
+            if self._changes is not None:
+                self._changes[giveaway_id] = None
+            return self._open.pop(giveaway_id, None)
+
+    def load(self, session, bot_ids):
+        """Загрузка незавершенных и не проводимых сейчас розыгрышей ботов bot_ids"""
+        self.bot_ids = list(bot_ids)
+        with self._lock:
+            self._changes = {}
+        try:
+            loaded = dict(session.execute(
+                select(Giveaway.id, Giveaway.bot_id)
+                .where(Giveaway.finished_at.is_(None), Giveaway.draw_started_at.is_(None), Giveaway.bot_id.in_(self.bot_ids))
+            ).all())
+        finally:
+            with self._lock:
+                changes, self._changes = self._changes, None
+        for giveaway_id, bot_id in changes.items():
+            if bot_id is None:
+                loaded.pop(giveaway_id, None)
+            else:
+                loaded[giveaway_id] = bot_id
+        with self._lock:
+            self._open = loaded
+        return len(loaded)
+
+    def refresh(self):
+        with session_scope('open_giveaways') as session:
+            return self.load(session, self.bot_ids)
+
+
+class JoinBuffer:
+    """Буфер заявок на участие с дедупликацией в памяти и пакетной записью в базу.
+
+    Обработчик нажатия кнопки только добавляет заявку в буфер, фоновый поток
+    записывает накопленное одним многострочным INSERT ... ON CONFLICT DO NOTHING
+    по размеру пачки или по таймеру. Новые заявки перед записью проходят screen (FraudScreen).
+    Для дедупликации в памяти помнятся только недавние нажатия: повторное нажатие после
+    вытеснения снова попадает в пачку и отбрасывается ON CONFLICT.
+    Заявки принимаются только в идущие розыгрыши бота, получившего нажатие (open); буфер может быть общим
+    для ботов процесса.
+    """
+
+    def __init__(self, logger, flush_size=None, flush_interval=None, max_statement_rows=1000, screen=None,
+                 seen_size=None, seen_ttl=None, refresh_interval=None):
+        self.logger = logger
+        self.screen = screen
+        self.flush_size = flush_size or int(os.getenv('JOIN_FLUSH_SIZE', '500'))
+        self.flush_interval = flush_interval or float(os.getenv('JOIN_FLUSH_INTERVAL', '1.0'))
+        self.max_statement_rows = max_statement_rows
+        # (giveaway_id, telegram_id) недавних заявок; память не зависит от числа участников розыгрышей
+        self._seen = TTLCache(
+            maxsize=seen_size or int(os.getenv('JOIN_SEEN_SIZE', '200000')),
+            ttl=seen_ttl or float(os.getenv('JOIN_SEEN_TTL', '600')),
+            name='join_seen',
+        )
+        self.open = OpenGiveaways()
+        self.refresh_interval = refresh_interval or float(os.getenv('JOIN_OPEN_REFRESH', '60'))
+        self.listeners = []  # функции({giveaway_id: добавлено участников}), вызываются после записи
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, giveaway_id, tg_user, bot_id):
+        """Регистрация заявки, пришедшей боту bot_id; False, если пользователь уже участвует,
+        None, если розыгрыш завершен или не найден, JOIN_REJECTED, если заявка отклонена проверкой на накрутку"""
+        if self.open.get(giveaway_id) != bot_id:
+            # Неизвестный, чужой (callback_data можно подделать) или завершенный розыгрыш
+            return None
+        with self._lock:
+            key = (giveaway_id, tg_user.id)
+            if self._seen.get(key):
+                joins_duplicate_total.inc()
+                return False
+            if self.screen is not None and not self.screen.check(giveaway_id, tg_user):
+                return JOIN_REJECTED
+            self._seen.set(key, True)
+            self._rows.append((giveaway_id, bot_id, str(tg_user.id), tg_user.username, datetime.utcnow()))
+            buffered = len(self._rows)
+        joins_total.inc()
+        join_buffer_size.set(buffered)
+        if buffered >= self.flush_size:
+            self._wakeup.set()
+        return True
+
+    def close(self, giveaway_id):
+        """Прием заявок в завершенный розыгрыш прекращается; возвращает bot_id розыгрыша или None"""
+        bot_id = self.open.discard(giveaway_id)
+        if self.screen is not None:
+            self.screen.close(giveaway_id)
+        return bot_id
+
+    def reopen(self, giveaway_id, bot_id):
+        """Возобновление приема заявок, если розыгрыш не удалось провести"""
+        if bot_id is not None:
+            self.open.add(giveaway_id, bot_id)
+
+    def start(self):
+        """Запуск фонового потока записи"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='join-buffer', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановка фонового потока с записью оставшихся заявок"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        except JoinFlushError:
+            pass  # ошибка уже записана в лог
+
+    def _run(self):
+        refreshed = time.monotonic()
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except JoinFlushError:
+                pass  # заявки остались в буфере, ошибка уже записана в лог
+            if self.open.bot_ids and time.monotonic() - refreshed >= self.refresh_interval:
+                refreshed = time.monotonic()
+                try:
+                    self.open.refresh()
+                except Exception as e:
+                    log_error(self.logger, e, "обновление списка идущих розыгрышей")
+
+    def flush(self):
+        """Запись накопленных заявок в базу; возвращает число записанных заявок.
+
+        При сбое незаписанные заявки возвращаются в буфер и выбрасывается JoinFlushError.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            started = time.perf_counter()
+            inserted = Counter()
+            written = 0
+            error = None
+            try:
+                while written < len(rows):
+                    chunk = rows[written:written + self.max_statement_rows]
+                    inserted.update(self._write(chunk))
+                    written += len(chunk)
+            except Exception as e:
+                join_flush_errors_total.inc()
+                log_error(self.logger, e, f"запись {len(rows) - written} участников розыгрышей")
+                with self._lock:
+                    self._rows[:0] = rows[written:]
+                error = JoinFlushError(f"не записано {len(rows) - written} из {len(rows)} заявок")
+            else:
+                join_flush_seconds.observe(time.perf_counter() - started)
+                join_flush_batch_size.observe(len(rows))
+            with self._lock:
+                join_buffer_size.set(len(self._rows))
+        if inserted:
+            for listener in self.listeners:
+                try:
+                    listener(inserted)
+                except Exception as e:
+                    log_error(self.logger, e, "обработка новых участников розыгрышей")
+        if error is not None:
+            raise error
+        return written
+
+    def pending(self, giveaway_id):
+        """Есть ли в буфере незаписанные заявки в розыгрыш"""
+        with self._lock:
+            return any(row[0] == giveaway_id for row in self._rows)
+
+    def _write(self, rows):
+        """Запись пачки; возвращает число действительно добавленных участников по розыгрышам"""
+        with session_scope('join_flush') as session:
+            user_ids = {}
+            users = {}  # пользователи, которых нет в кэше
+            for _, _, telegram_id, username, _ in rows:
+                if telegram_id not in user_ids and telegram_id not in users:
+                    user_id = cached_user_ids.get(telegram_id)
+                    if user_id is None:
+                        users[telegram_id] = username
+                    else:
+                        user_ids[telegram_id] = user_id
+            if users:
+                session.execute(
+                    dialect_insert(User.__table__)
+                    .values([{'telegram_id': t, 'username': u, 'created_at': datetime.utcnow()} for t, u in users.items()])
+                    .on_conflict_do_nothing(index_elements=['telegram_id'])
+                )
+                resolved = dict(session.execute(
+                    select(User.telegram_id, User.id).where(User.telegram_id.in_(list(users)))
+                ).all())
+                remember(session, resolved)
+                user_ids.update(resolved)
+            giveaway_ids = {giveaway_id for giveaway_id, _, _, _, _ in rows}
+            # Розыгрыш чужого бота не принимает заявки (callback_data можно подделать), как и проводимый сейчас
+            active = set(session.execute(
+                select(Giveaway.id, Giveaway.bot_id)
+                .where(Giveaway.id.in_(giveaway_ids), Giveaway.finished_at.is_(None), Giveaway.draw_started_at.is_(None))
+            ).all())
+            values = [
+                {'giveaway_id': giveaway_id, 'user_id': user_ids[telegram_id], 'joined_at': joined_at}
+                for giveaway_id, bot_id, telegram_id, _, joined_at in rows
+                if (giveaway_id, bot_id) in active
+            ]
+            inserted = Counter()
+            if values:
+                inserted.update(session.scalars(
+                    dialect_insert(GiveawayParticipant.__table__)
+                    .values(values)
+                    .on_conflict_do_nothing(index_elements=['giveaway_id', 'user_id'])
+                    .returning(GiveawayParticipant.giveaway_id)
+                ))
+            if inserted:
+                # Счетчик участников меняется в той же транзакции, что и вставка
+                session.execute(
+                    update(Giveaway.__table__)
+                    .where(Giveaway.__table__.c.id == bindparam('b_giveaway_id'))
+                    .values(participants_count=Giveaway.__table__.c.participants_count + bindparam('b_added')),
+                    [{'b_giveaway_id': giveaway_id, 'b_added': added} for giveaway_id, added in inserted.items()],
+                )
+            return inserted
@@ -0,0 +1,133 @@
+import os
+import random
+import signal
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import select
+from db import dialect_insert, session_scope
+from models import BotOffset
+from tenants import bot_id
+from utils import log_error, log_info
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """Пауза перед повторной попыткой: экспоненциальный рост с полным джиттером"""
+    base = base or float(os.getenv('RESTART_BACKOFF_BASE', '1'))
+    cap = cap or float(os.getenv('RESTART_BACKOFF_MAX', '60'))
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def load_offset(token):
+    """Последний обработанный update_id бота или None"""
+    with session_scope('load_offset') as session:
+        return session.scalar(select(BotOffset.last_update_id).where(BotOffset.bot_id == bot_id(token)))
+
+
+def save_offset(token, update_id):
+    """Сохранение последнего обработанного update_id: следующий запуск продолжит с него"""
+    with session_scope('save_offset') as session:
+        stmt = dialect_insert(BotOffset.__table__, session.get_bind()).values(
+            bot_id=bot_id(token), last_update_id=update_id, updated_at=datetime.utcnow(),
+        )
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=['bot_id'],
+            set_={'last_update_id': stmt.excluded.last_update_id, 'updated_at': stmt.excluded.updated_at},
+        ))
+
+
+def drain_worker_pool(pool, timeout):
+    """Ожидание обработки апдейтов, уже переданных пулу потоков TeleBot; False по истечении timeout.
+
+    Каждому потоку ставится задача-барьер: когда все потоки дошли до барьера, задачи перед ним выполнены.
+    """
+    barrier = threading.Barrier(len(pool.workers) + 1)
+
+    def wait_barrier():
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+
+    for _ in pool.workers:
+        pool.put(wait_barrier)
+    try:
+        barrier.wait(timeout)
+        return True
+    except threading.BrokenBarrierError:
+        return False
+
+
+class Lifecycle:
+    """Остановка бота по SIGTERM/SIGINT.
+
+    Сигнал прекращает прием апдейтов (stop_intake), после чего drain выполняет шаги остановки
+    (обработка принятых апдейтов, запись буферов, отправка очереди) в пределах общего дедлайна.
+    """
+
+    def __init__(self, logger, timeout=None):
+        self.logger = logger
+        self.timeout = timeout or float(os.getenv('SHUTDOWN_TIMEOUT', '25'))
+        self.stopping = threading.Event()
+        self._stop_intake = None
+        self._deadline = None
+
+    def install(self, stop_intake):
+        """Обработчики SIGTERM и SIGINT (вызывается из главного потока)"""
+        self._stop_intake = stop_intake
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: self.request_stop(signal.Signals(signum).name))
+        return self
+
+    def install_async(self, loop, stop_intake):
+        """Обработчики SIGTERM и SIGINT в event loop асинхронного режима"""
+        self._stop_intake = stop_intake
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.request_stop, signum.name)
+        return self
+
+    def request_stop(self, reason):
+        if self.stopping.is_set():
+            return
+        self._deadline = time.monotonic() + self.timeout
+        self.stopping.set()
+        log_info(self.logger, f"Получен {reason}: прием апдейтов остановлен, завершение работы (не дольше {self.timeout:.0f} с)")
+        if self._stop_intake is not None:
+            self._stop_intake()
+
+    def remaining(self):
+        """Сколько секунд осталось до дедлайна остановки"""
+        if self._deadline is None:
+            return self.timeout
+        return max(0.0, self._deadline - time.monotonic())
+
+    def wait_backoff(self, attempt):
+        """Пауза перед перезапуском; False, если за это время пришел сигнал остановки"""
+        delay = backoff_delay(attempt)
+        log_info(self.logger, f"Повторный запуск через {delay:.1f} с")
+        return not self.stopping.wait(delay)
+
+    def drain(self, steps):
+        """Последовательное выполнение шагов остановки [(название, функция(оставшееся время))]"""
+        started = time.monotonic()
+        for name, step in steps:
+            try:
+                step(self.remaining())
+            except Exception as e:
+                log_error(self.logger, e, f"остановка: {name}")
+        log_info(self.logger, f"Остановка завершена за {time.monotonic() - started:.1f} с")
+
+
+def background_steps(bot):
+    """Шаги остановки фоновых компонентов бота (или общих компонентов ботов процесса):
+    сначала те, что пишут в очередь отправки, затем она сама"""
+    steps = [
+        ('выгрузки', lambda timeout: bot.exporter.shutdown()),
+        ('запись участников', lambda timeout: bot.join_buffer.stop()),
+        ('обновление постов', lambda timeout: bot.post_updater.stop()),
+        ('планировщик', lambda timeout: bot.scheduler.stop()),
+        ('очередь отправки', lambda timeout: bot.outbox.stop(timeout=timeout)),
+    ]
+    if getattr(bot, 'monitoring', None) is not None:
+        steps.append(('сервер метрик', lambda timeout: bot.monitoring.stop()))
+    return steps
@@ -1,84 +1,178 @@
 import os
 import sys
+import threading
 import time
 from dotenv import load_dotenv
-from telebot import TeleBot
-from telebot.apihelper import ApiException
-from handlers import register_handlers
-from db import test_database_connection
-from utils import *
+from monitoring import health, run_startup_checks, start_monitoring
+from tenants import load_tokens
+from utils import setup_logging, log_bot_stop, log_command, log_error, log_info
 
 # Настройка логирования
 logger = setup_logging()
 
 load_dotenv()
-TOKEN = os.getenv('TELEGRAM_TOKEN')
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()  # polling | async | webhook
+POLLING_TIMEOUT = int(os.getenv('POLLING_TIMEOUT', '10'))  # long polling; остановка ждет его завершения
+STABLE_RUN_SECONDS = 60  # после такой работы без ошибок пауза перед перезапуском снова минимальна
 
-if not TOKEN:
-    log_error(logger, "TELEGRAM_TOKEN не найден в переменных окружения", "конфигурация")
+try:
+    TOKENS = load_tokens()
+except (OSError, ValueError) as e:
+    log_error(logger, e, "конфигурация: токены ботов")
+    sys.exit(1)
+if not TOKENS:
+    log_error(logger, "TELEGRAM_TOKEN (или TELEGRAM_TOKENS) не найден в переменных окружения", "конфигурация")
     sys.exit(1)
+TOKEN = TOKENS[0]
 
-try:
-    bot = TeleBot(TOKEN)
-    bot.logger = logger  # Добавляем logger к объекту бота
-    
-    # Получаем информацию о боте для логирования
+
+def create_bot():
+    """Создание синхронного бота и регистрация обработчиков"""
+    from telebot import TeleBot
     try:
-        bot_info = bot.get_me()
-        bot_username = bot_info.username
-        log_bot_start(logger, token_status=True, bot_username=bot_username)
+        # В режиме webhook апдейты обрабатываются потоками WebhookServer, собственный пул TeleBot не нужен
+        bot = TeleBot(TOKEN, threaded=BOT_MODE != 'webhook')
+        bot.logger = logger  # Добавляем logger к объекту бота
     except Exception as e:
-        log_error(logger, e, "получение информации о боте")
-        log_bot_start(logger, token_status=True)  # Запускаем без username
-        
-except Exception as e:
-    log_error(logger, e, "инициализация бота")
-    sys.exit(1)
+        log_error(logger, e, "инициализация бота")
+        sys.exit(1)
+    bot.monitoring = start_monitoring(logger)
 
-# Проверка подключения к базе данных
-log_info(logger, "Проверка подключения к базе данных...")
-if not test_database_connection(logger):
-    log_error(logger, "Не удалось подключиться к базе данных", "запуск")
-    log_info(logger, "Бот будет работать без базы данных")
+    # Bot API и база проверяются в фоне, пока импортируются модули обработчиков (результат — в /readyz)
+    run_startup_checks([bot], logger)
+    health.expect('updates')
 
-register_handlers(bot)
+    from channels import ChannelResolver
+    from archive import start_archiver
+    from export import Exporter
+    from fraud import create_fraud_screen
+    from handlers import register_handlers
+    from instrumentation import instrument_api, instrument_handlers
+    from join import JoinBuffer
+    from membership import MembershipChecker
+    from outbox import Outbox, log_dropped
+    from posts import start_post_updater
+    from scheduler import start_scheduler
+    from services import START_TEXT
+    from state import create_state_store, start_state_purger
+    from tenants import bot_id, claim_legacy_rows
 
-@bot.message_handler(commands=['start'])
-def start_handler(message):
+    bot.bot_id = bot_id(TOKEN)
+    bot.join_buffer = JoinBuffer(logger, screen=create_fraud_screen(logger)).start()
+    bot.outbox = Outbox(bot, logger).start()
+    bot.membership = MembershipChecker(bot, logger)
+    bot.channel_resolver = ChannelResolver(bot, logger)
+    bot.exporter = Exporter(bot.outbox, logger)
     try:
-        log_command(logger, message.from_user.id, message.from_user.username, 'start')
-        bot.send_message(message.chat.id, 'Привет! Я бот-рандомайзер для розыгрышей.')
+        claim_legacy_rows(bot.bot_id, logger)
     except Exception as e:
-        log_error(logger, e, f"обработка команды /start от пользователя {message.from_user.id}")
-
-def run_bot():
-    """Запуск бота с обработкой ошибок"""
-    max_retries = 5
-    retry_delay = 10
-    
-    for attempt in range(max_retries):
+        log_error(logger, e, "закрепление записей за ботом")
+    bots = {bot.bot_id: bot}
+    bot.scheduler = start_scheduler(bots, logger, bot.join_buffer)
+    bot.post_updater = start_post_updater(bots, logger, bot.join_buffer)
+    state_store = create_state_store()
+    bot.state_store = state_store.scoped(bot.bot_id)
+    start_state_purger(state_store, logger)
+    start_archiver(logger)
+
+    @bot.message_handler(commands=['start'])
+    def start_handler(message):
         try:
-            log_info(logger, f"Попытка запуска бота #{attempt + 1}")
-            bot.polling(none_stop=True, timeout=60)
-        except ApiException as e:
-            log_error(logger, e, f"API Telegram (попытка {attempt + 1})")
-            if attempt < max_retries - 1:
-                log_info(logger, f"Повторная попытка через {retry_delay} секунд...")
-                time.sleep(retry_delay)
-            else:
-                log_error(logger, "Превышено максимальное количество попыток подключения", "критическая ошибка")
-                break
-        except KeyboardInterrupt:
-            log_bot_stop(logger)
-            break
+            log_command(logger, message.from_user.id, message.from_user.username, 'start')
+            if not bot.outbox.send_message(message.chat.id, START_TEXT):
+                log_dropped(logger, message.chat.id, 'start')
+        except Exception as e:
+            log_error(logger, e, f"обработка команды /start от пользователя {message.from_user.id}")
+
+    register_handlers(bot)
+    instrument_handlers(bot)
+    instrument_api()
+    return bot
+
+
+def run_bot(bot):
+    """Запуск бота в режиме polling: перезапуск после ошибок с нарастающей паузой, остановка по SIGTERM"""
+    from lifecycle import Lifecycle, background_steps, drain_worker_pool, load_offset, save_offset
+    lifecycle = Lifecycle(logger).install(bot.stop_polling)
+    try:
+        last_update_id = load_offset(TOKEN)
+    except Exception as e:
+        log_error(logger, e, "загрузка offset getUpdates")
+        last_update_id = None
+    if last_update_id:
+        # Апдейты до last_update_id обработаны предыдущим запуском: первый getUpdates подтвердит их
+        bot.last_update_id = last_update_id
+        log_info(logger, f"Продолжение с апдейта {last_update_id + 1}")
+
+    attempt = 0
+    while not lifecycle.stopping.is_set():
+        log_info(logger, f"Попытка запуска бота #{attempt + 1}")
+        started = time.monotonic()
+        health.set('updates', True)
+        try:
+            # Без non_stop ошибка API завершает polling, повтор — здесь, с джиттером
+            bot.polling(timeout=60, long_polling_timeout=POLLING_TIMEOUT)
         except Exception as e:
-            log_error(logger, e, f"неожиданная ошибка (попытка {attempt + 1})")
-            if attempt < max_retries - 1:
-                log_info(logger, f"Повторная попытка через {retry_delay} секунд...")
-                time.sleep(retry_delay)
-            else:
-                log_error(logger, "Превышено максимальное количество попыток", "критическая ошибка")
-                break
+            log_error(logger, e, f"polling (попытка {attempt + 1})")
+        health.set('updates', False)
+        if lifecycle.stopping.is_set():
+            break
+        if time.monotonic() - started > STABLE_RUN_SECONDS:
+            attempt = 0
+        if not lifecycle.wait_backoff(attempt):
+            break
+        attempt += 1
+
+    def drain_updates(timeout):
+        if not drain_worker_pool(bot.worker_pool, timeout):
+            log_error(logger, "не все принятые апдейты обработаны, offset не сохранен", "остановка")
+            return
+        if bot.last_update_id:
+            save_offset(TOKEN, bot.last_update_id)
+
+    lifecycle.drain([('обработка принятых апдейтов', drain_updates)] + background_steps(bot))
+    log_bot_stop(logger)
+
+
+def run_webhook(bot):
+    """Запуск бота в режиме webhook"""
+    from lifecycle import Lifecycle, background_steps
+    from webhook import WebhookServer
+    url = os.getenv('WEBHOOK_URL')
+    if not url:
+        log_error(logger, "WEBHOOK_URL не найден в переменных окружения", "конфигурация")
+        sys.exit(1)
+    server = WebhookServer(bot, logger)
+    # shutdown ждет выхода из serve_forever, поэтому вызывается не из обработчика сигнала
+    lifecycle = Lifecycle(logger).install(lambda: threading.Thread(target=server.httpd.shutdown, daemon=True).start())
+    try:
+        server.register(url)
+        health.set('updates', True)
+        server.serve_forever()
+    finally:
+        health.set('updates', False)
+        lifecycle.drain([('обработка принятых апдейтов', server.shutdown)] + background_steps(bot))
+        log_bot_stop(logger)
+
+
+def run_async():
+    """Запуск ботов в асинхронном режиме (AsyncTeleBot + асинхронные сессии SQLAlchemy)"""
+    import asyncio
+    from async_main import run_async_bots
+    try:
+        asyncio.run(run_async_bots(TOKENS, logger))
+    except KeyboardInterrupt:
+        pass  # Остановка логируется в run_async_bots
+
 
 if __name__ == '__main__':
-    run_bot() 
\ No newline at end of file
+    if len(TOKENS) > 1 and BOT_MODE != 'async':
+        # Несколько ботов обслуживает один event loop
+        log_info(logger, f"Ботов: {len(TOKENS)}, BOT_MODE={BOT_MODE} не поддерживает несколько ботов — запуск в асинхронном режиме")
+        run_async()
+    elif BOT_MODE == 'async':
+        run_async()
+    elif BOT_MODE == 'webhook':
+        run_webhook(create_bot())
+    else:
+        run_bot(create_bot())
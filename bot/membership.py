@@ -0,0 +1,138 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select
+from telebot.apihelper import ApiTelegramException
+from cache import TTLCache
+from db import session_scope
+from metrics import counter, histogram
+from models import User, Channel, GiveawayChannel
+from ratelimit import TokenBucket, KeyedTokenBuckets, retry_after
+from utils import log_error, log_info
+
+MEMBER_STATUSES = ('creator', 'administrator', 'member')
+# Ответы 400, означающие «пользователя нет в чате»; остальные 400 (chat not found, member list is
+# inaccessible и т.п.) — сбой проверки, а не отказ
+NOT_MEMBER_ERRORS = ('user not found', 'member not found', 'participant_id_invalid')
+
+membership_checks_total = counter('membership_checks_total', 'Проверки подписки (result: hit, member, not_member, error)')
+membership_check_seconds = histogram('membership_check_seconds', 'Длительность запроса get_chat_member')
+
+
+class MembershipCheckError(Exception):
+    """Подписку проверить не удалось (сбой Bot API или сети) — результат неизвестен"""
+
+
+class MembershipChecker:
+    """Проверка подписки пользователей на обязательные каналы.
+
+    Результаты кэшируются (LRU + TTL) по ключу (telegram_id канала, telegram_id пользователя),
+    запросы get_chat_member выполняются пулом потоков с общим и поканальным ограничением частоты.
+    Экземпляры ботов одного процесса разделяют кэш и пул потоков (shared), лимиты у каждого бота свои.
+    """
+
+    def __init__(self, api, logger, workers=None, cache_size=None, cache_ttl=None, global_rate=None, chat_rate=None, shared=None):
+        self.api = api  # объект с методом get_chat_member (синхронный TeleBot)
+        self.logger = logger
+        if shared is not None:
+            self.cache, self.executor = shared.cache, shared.executor
+        else:
+            self.cache = TTLCache(
+                cache_size or int(os.getenv('MEMBERSHIP_CACHE_SIZE', '100000')),
+                cache_ttl or float(os.getenv('MEMBERSHIP_CACHE_TTL', '300')),
+                name='membership',
+            )
+            self.executor = ThreadPoolExecutor(
+                max_workers=workers or int(os.getenv('MEMBERSHIP_WORKERS', '8')),
+                thread_name_prefix='membership',
+            )
+        self.global_bucket = TokenBucket(global_rate or float(os.getenv('MEMBERSHIP_RATE', '25')))
+        self.chat_buckets = KeyedTokenBuckets(chat_rate or float(os.getenv('MEMBERSHIP_CHAT_RATE', '10')))
+
+    def is_member(self, channel_id, user_id, retries=3):
+        """Подписан ли пользователь на канал; None, если проверить не удалось"""
+        key = (str(channel_id), int(user_id))
+        cached = self.cache.get(key)
+        if cached is not None:
+            membership_checks_total.inc(result='hit')
+            return cached
+        for _ in range(retries):
+            self.chat_buckets.acquire(key[0])
+            self.global_bucket.acquire()
+            started = time.perf_counter()
+            try:
+                member = self.api.get_chat_member(channel_id, key[1])
+            except ApiTelegramException as e:
+                delay = retry_after(e)
+                if delay is not None:
+                    self.global_bucket.pause(delay)
+                    continue
+                if e.error_code == 400 and any(text in (e.description or '').lower() for text in NOT_MEMBER_ERRORS):
+                    self.cache.set(key, False)
+                    membership_checks_total.inc(result='not_member')
+                    return False
+                log_error(self.logger, e, f"проверка подписки {user_id} на канал {channel_id}")
+                break
+            except Exception as e:
+                log_error(self.logger, e, f"проверка подписки {user_id} на канал {channel_id}")
+                break
+            finally:
+                membership_check_seconds.observe(time.perf_counter() - started)
+            result = member.status in MEMBER_STATUSES or (member.status == 'restricted' and bool(member.is_member))
+            self.cache.set(key, result)
+            membership_checks_total.inc(result='member' if result else 'not_member')
+            return result
+        membership_checks_total.inc(result='error')
+        return None
+
+    def is_subscribed(self, channel_ids, user_id):
+        """Подписан ли пользователь на все каналы.
+
+        Отказ — только при точном ответе «не подписан» хотя бы по одному каналу; если по остальным
+        каналам проверка не удалась, выбрасывается MembershipCheckError.
+        """
+        failed = None
+        for channel_id in channel_ids:
+            result = self.is_member(channel_id, user_id)
+            if result is False:
+                return False
+            if result is None:
+                failed = channel_id
+        if failed is not None:
+            raise MembershipCheckError(f"подписка {user_id} на канал {failed} не проверена")
+        return True
+
+    def check_users(self, channel_ids, user_ids):
+        """Параллельная проверка подписки пользователей: {user_id: bool}; MembershipCheckError при сбое проверки"""
+        if not channel_ids:
+            return {user_id: True for user_id in user_ids}
+        results = self.executor.map(lambda user_id: self.is_subscribed(channel_ids, user_id), user_ids)
+        return dict(zip(user_ids, results))
+
+    def winner_verifier(self, giveaway_id):
+        """Функция проверки кандидатов в победители для draw.choose_winners.
+
+        База читается короткими сессиями: запросы к Bot API идут без открытой транзакции.
+        """
+        with session_scope('winner_channels') as session:
+            channel_ids = session.scalars(
+                select(Channel.telegram_id)
+                .join(GiveawayChannel, GiveawayChannel.channel_id == Channel.id)
+                .where(GiveawayChannel.giveaway_id == giveaway_id)
+            ).all()
+
+        def verify(user_ids):
+            with session_scope('winner_candidates') as session:
+                telegram_ids = dict(session.execute(
+                    select(User.id, User.telegram_id).where(User.id.in_(user_ids))
+                ).all())
+            checked = self.check_users(channel_ids, list(telegram_ids.values()))
+            accepted = [user_id for user_id in user_ids if checked.get(telegram_ids.get(user_id))]
+            if len(accepted) < len(user_ids):
+                log_info(self.logger, f"Розыгрыш {giveaway_id}: {len(user_ids) - len(accepted)} кандидатов не прошли проверку подписки")
+            return accepted
+
+        return verify
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
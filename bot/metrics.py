@@ -0,0 +1,135 @@
+import threading
+
+# Простые потокобезопасные метрики в стиле Prometheus (счетчики, gauge, гистограммы с метками)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, dict(key), value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._values = {}  # метки -> [счетчики по бакетам, сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(tuple(sorted(labels.items())))
+        return state[2] if state else 0
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, (bucket_counts, total, count) in self._values.items():
+                labels = dict(key)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    result.append((f'{self.name}_bucket', {**labels, 'le': repr(float(bound))}, cumulative))
+                result.append((f'{self.name}_bucket', {**labels, 'le': '+Inf'}, count))
+                result.append((f'{self.name}_sum', labels, total))
+                result.append((f'{self.name}_count', labels, count))
+        return result
+
+
+def _get_or_create(cls, name, description, *args):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, description, *args)
+        return metric
+
+
+def counter(name, description):
+    """Счетчик из общего реестра"""
+    return _get_or_create(Counter, name, description)
+
+
+def gauge(name, description):
+    """Gauge из общего реестра"""
+    return _get_or_create(Gauge, name, description)
+
+
+def histogram(name, description, buckets=DEFAULT_BUCKETS):
+    """Гистограмма из общего реестра"""
+    return _get_or_create(Histogram, name, description, buckets)
+
+
+def all_metrics():
+    """Все зарегистрированные метрики"""
+    with _registry_lock:
+        return list(_registry.values())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in sorted(all_metrics(), key=lambda m: m.name):
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
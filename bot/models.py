@@ -1,9 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text, Table
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Boolean, Text, Table, UniqueConstraint, Index, LargeBinary, PrimaryKeyConstraint, event, text
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
 Base = declarative_base()
 
+PARTICIPANT_PARTITIONS = 16  # секции giveaway_participants по хешу giveaway_id (PostgreSQL)
+
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
@@ -15,8 +17,15 @@ class User(Base):
 
 class Channel(Base):
     __tablename__ = 'channels'
+    __table_args__ = (
+        # Каналы владельца по убыванию id — постраничный вывод /my_channels
+        Index('ix_channels_owner_id_id', 'owner_id', 'id'),
+        # Один канал могут добавить в разные боты: проверка прав и публикация идут от имени бота
+        UniqueConstraint('bot_id', 'telegram_id', name='uq_channels_bot_telegram'),
+    )
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(String, unique=True, nullable=False)
+    bot_id = Column(BigInteger)  # бот, в котором добавлен канал (числовая часть токена)
+    telegram_id = Column(String, nullable=False)
     title = Column(String)
     owner_id = Column(Integer, ForeignKey('users.id'))
     owner = relationship('User', back_populates='channels')
@@ -24,7 +33,15 @@ class Channel(Base):
 
 class Giveaway(Base):
     __tablename__ = 'giveaways'
+    __table_args__ = (
+        # Незавершенные розыгрыши по времени окончания — для планировщика
+        Index('ix_giveaways_end_datetime_active', 'end_datetime',
+              postgresql_where=text('finished_at IS NULL'), sqlite_where=text('finished_at IS NULL')),
+        # Розыгрыши создателя по убыванию id — постраничный вывод /my_giveaways
+        Index('ix_giveaways_creator_id_id', 'creator_id', 'id'),
+    )
     id = Column(Integer, primary_key=True)
+    bot_id = Column(BigInteger)  # бот, в котором создан розыгрыш (числовая часть токена)
     creator_id = Column(Integer, ForeignKey('users.id'))
     creator = relationship('User', back_populates='giveaways')
     description = Column(Text)
@@ -37,28 +54,89 @@ class Giveaway(Base):
     participants_limit = Column(Integer, nullable=True)
     join_button_text = Column(String, default='Участвовать')
     created_at = Column(DateTime, default=datetime.utcnow)
+    draw_seed = Column(String, nullable=True)  # seed розыгрыша для воспроизведения выбора победителей
+    finished_at = Column(DateTime, nullable=True)
+    draw_started_at = Column(DateTime, nullable=True)  # розыгрыш проводится репликой с этого момента (см. scheduler.py)
+    participants_count = Column(Integer, nullable=False, default=0, server_default='0')  # обновляется при записи участников
     channels = relationship('GiveawayChannel', back_populates='giveaway')
     participants = relationship('GiveawayParticipant', back_populates='giveaway')
+    winners = relationship('GiveawayWinner', back_populates='giveaway', order_by='GiveawayWinner.position')
+    posts = relationship('GiveawayPost', back_populates='giveaway')
 
 class GiveawayChannel(Base):
     __tablename__ = 'giveaway_channels'
     id = Column(Integer, primary_key=True)
-    giveaway_id = Column(Integer, ForeignKey('giveaways.id'))
-    channel_id = Column(Integer, ForeignKey('channels.id'))
+    giveaway_id = Column(Integer, ForeignKey('giveaways.id'), index=True)
+    channel_id = Column(Integer, ForeignKey('channels.id'), index=True)
     giveaway = relationship('Giveaway', back_populates='channels')
     channel = relationship('Channel', back_populates='giveaways')
 
 class GiveawayParticipant(Base):
     __tablename__ = 'giveaway_participants'
-    id = Column(Integer, primary_key=True)
+    __table_args__ = (
+        # На PostgreSQL таблица секционирована по хешу giveaway_id: заявки и выборки одного розыгрыша
+        # затрагивают одну секцию, ключ секционирования входит в первичный ключ
+        PrimaryKeyConstraint('giveaway_id', 'user_id', name='giveaway_participants_pkey'),
+        {'postgresql_partition_by': 'HASH (giveaway_id)'},
+    )
     giveaway_id = Column(Integer, ForeignKey('giveaways.id'))
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     joined_at = Column(DateTime, default=datetime.utcnow)
     giveaway = relationship('Giveaway', back_populates='participants')
 
+@event.listens_for(GiveawayParticipant.__table__, 'after_create')
+def create_participant_partitions(table, connection, **kw):
+    """Секции giveaway_participants при создании таблиц через metadata.create_all"""
+    if connection.dialect.name == 'postgresql':
+        for remainder in range(PARTICIPANT_PARTITIONS):
+            connection.execute(text(
+                f'CREATE TABLE {table.name}_p{remainder} PARTITION OF {table.name} '
+                f'FOR VALUES WITH (MODULUS {PARTICIPANT_PARTITIONS}, REMAINDER {remainder})'
+            ))
+
+class GiveawayParticipantArchive(Base):
+    __tablename__ = 'giveaway_participant_archives'
+    giveaway_id = Column(Integer, ForeignKey('giveaways.id'), primary_key=True, autoincrement=False)
+    participants = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)  # сжатые пары (user_id, joined_at), формат — в archive.py
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+class GiveawayWinner(Base):
+    __tablename__ = 'giveaway_winners'
+    id = Column(Integer, primary_key=True)
+    giveaway_id = Column(Integer, ForeignKey('giveaways.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    position = Column(Integer, nullable=False)
+    giveaway = relationship('Giveaway', back_populates='winners')
+
+class GiveawayPost(Base):
+    __tablename__ = 'giveaway_posts'
+    __table_args__ = (UniqueConstraint('chat_id', 'message_id', name='uq_giveaway_posts_chat_message'),)
+    id = Column(Integer, primary_key=True)
+    giveaway_id = Column(Integer, ForeignKey('giveaways.id'), nullable=False, index=True)
+    chat_id = Column(BigInteger, nullable=False)  # канал или группа, где опубликован пост
+    message_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    giveaway = relationship('Giveaway', back_populates='posts')
+
 class SupportRequest(Base):
     __tablename__ = 'support_requests'
     id = Column(Integer, primary_key=True)
+    bot_id = Column(BigInteger)
     user_id = Column(Integer, ForeignKey('users.id'))
     message = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow) 
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow) 
+
+class ConversationState(Base):
+    __tablename__ = 'conversation_states'
+    bot_id = Column(BigInteger, primary_key=True, autoincrement=False)  # у каждого бота свои диалоги с чатом
+    chat_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    step = Column(String, nullable=False)
+    data = Column(Text)  # JSON с данными диалога
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class BotOffset(Base):
+    __tablename__ = 'bot_offsets'
+    bot_id = Column(BigInteger, primary_key=True, autoincrement=False)  # числовая часть токена
+    last_update_id = Column(BigInteger, nullable=False)  # последний обработанный апдейт getUpdates
+    updated_at = Column(DateTime, default=datetime.utcnow)
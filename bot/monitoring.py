@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from metrics import render
+from profiler import SamplingProfiler
+from utils import log_bot_start, log_error, log_info
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+TEXT_CONTENT_TYPE = 'text/plain; charset=utf-8'
+
+
+class Health:
+    """Проверки готовности бота для /readyz: название -> пройдена ли"""
+
+    def __init__(self):
+        self._checks = {}
+        self._lock = threading.Lock()
+
+    def expect(self, *names):
+        """Регистрация проверок, которые должны пройти, прежде чем бот готов"""
+        with self._lock:
+            for name in names:
+                self._checks.setdefault(name, False)
+
+    def set(self, name, ok):
+        with self._lock:
+            self._checks[name] = ok
+
+    def status(self):
+        """(готов ли бот, {проверка: результат})"""
+        with self._lock:
+            checks = dict(self._checks)
+        return bool(checks) and all(checks.values()), checks
+
+
+health = Health()
+
+
+def readiness(params):
+    ready, checks = health.status()
+    body = ''.join(f"{name} {'ok' if ok else 'fail'}\n" for name, ok in sorted(checks.items()))
+    return (200 if ready else 503), TEXT_CONTENT_TYPE, body
+
+
+def run_startup_checks(apis, logger):
+    """Проверка Bot API (get_me каждого бота процесса) и базы данных в фоновых потоках, с повторами до успеха.
+
+    Прием апдейтов не ждет проверок; их результат виден в /readyz. До ответа getMe у клиентов
+    заглушка TeleBot.user (id из токена), иначе polling запросил бы getMe перед первым getUpdates.
+    """
+    from telebot.types import User
+    unchecked = list(apis)
+    for api in unchecked:
+        if api._user is None:
+            api._user = User(id=int(api.token.split(':', 1)[0]), is_bot=True, first_name='')
+
+    def check(name, probe):
+        attempt = 0
+        while not probe():
+            from lifecycle import backoff_delay  # импортирует SQLAlchemy, нужен только при повторе
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+        health.set(name, True)
+
+    def probe_telegram():
+        # Повтор — только для ботов, которых проверить не удалось
+        for api in list(unchecked):
+            try:
+                me = api.get_me()
+            except Exception as e:
+                log_error(logger, e, f"получение информации о боте {api.token.split(':', 1)[0]}")
+                continue
+            api._user = me
+            unchecked.remove(api)
+            log_bot_start(logger, token_status=True, bot_username=me.username)
+        return not unchecked
+
+    def probe_database():
+        from db import test_database_connection
+        return test_database_connection(logger)
+
+    health.expect('telegram', 'database')
+    for name, probe in (('telegram', probe_telegram), ('database', probe_database)):
+        threading.Thread(target=check, args=(name, probe), name=f'startup-check-{name}', daemon=True).start()
+
+
+class MonitoringServer:
+    """Служебный HTTP-сервер: метрики Prometheus, проверки живости и готовности, управление профилировщиком.
+
+    Маршруты хранятся в routes (путь -> функция(параметры запроса) -> (статус, тип, тело)),
+    другие модули могут добавлять свои. Сервер слушает localhost, если не задано иное.
+    """
+
+    def __init__(self, logger, host=None, port=None):
+        self.logger = logger
+        self.host = host or os.getenv('METRICS_HOST', '127.0.0.1')
+        self.port = int(os.getenv('METRICS_PORT', '9464')) if port is None else port
+        self.profiler = SamplingProfiler()
+        self.routes = {
+            '/metrics': lambda params: (200, METRICS_CONTENT_TYPE, render()),
+            '/healthz': lambda params: (200, TEXT_CONTENT_TYPE, 'ok\n'),
+            '/readyz': readiness,
+            '/debug/profile/start': self.start_profile,
+            '/debug/profile/stop': self.stop_profile,
+        }
+        self.httpd = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='monitoring', daemon=True)
+        self._thread.start()
+        log_info(self.logger, f"Метрики доступны на http://{self.host}:{self.httpd.server_address[1]}/metrics")
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread = None
+        self.httpd.server_close()
+        self.profiler.stop()
+
+    def start_profile(self, params):
+        if 'interval' in params:
+            self.profiler.interval = float(params['interval'])
+        if not self.profiler.start():
+            return 409, TEXT_CONTENT_TYPE, 'профилировщик уже запущен\n'
+        log_info(self.logger, f"Профилировщик запущен (интервал {self.profiler.interval} с)")
+        return 200, TEXT_CONTENT_TYPE, 'ok\n'
+
+    def stop_profile(self, params):
+        if not self.profiler.running:
+            return 409, TEXT_CONTENT_TYPE, 'профилировщик не запущен\n'
+        stacks = self.profiler.stop()
+        log_info(self.logger, "Профилировщик остановлен")
+        return 200, TEXT_CONTENT_TYPE, stacks
+
+    def _handler(self):
+        server = self
+
+        class MonitoringHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                route = server.routes.get(url.path)
+                if route is None:
+                    status, content_type, body = 404, TEXT_CONTENT_TYPE, 'not found\n'
+                else:
+                    try:
+                        status, content_type, body = route(dict(parse_qsl(url.query)))
+                    except Exception as e:
+                        log_error(server.logger, e, f"служебный запрос {url.path}")
+                        status, content_type, body = 500, TEXT_CONTENT_TYPE, 'error\n'
+                body = body.encode()
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return MonitoringHandler
+
+
+def start_monitoring(logger):
+    """Запуск служебного сервера; None, если METRICS_PORT=0 или порт занят"""
+    if int(os.getenv('METRICS_PORT', '9464')) == 0:
+        return None
+    try:
+        return MonitoringServer(logger).start()
+    except OSError as e:
+        log_error(logger, e, "запуск сервера метрик")
+        return None
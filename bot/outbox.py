@@ -0,0 +1,248 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from metrics import counter, gauge, histogram
+from ratelimit import KeyedTokenBuckets, retry_after
+from utils import log_error, log_info
+
+MAX_MESSAGE_LENGTH = 4096
+COALESCE_SEPARATOR = '\n\n'
+EDIT_METHODS = ('edit_message_text', 'edit_message_caption', 'edit_message_reply_markup')
+
+outbox_messages_total = counter('outbox_messages_total', 'Исходящие сообщения (result: sent, coalesced, retried, failed, dropped)')
+outbox_queue_size = gauge('outbox_queue_size', 'Сообщения в очереди отправки')
+outbox_send_seconds = histogram('outbox_send_seconds', 'Время запроса отправки к Bot API (method)')
+outbox_replies_dropped_total = counter('outbox_replies_dropped_total', 'Ответы, не поставленные в переполненную очередь (context)')
+
+
+def log_dropped(logger, chat_id, context):
+    """Учет ответа, который не удалось поставить в очередь отправки (call вернул False)"""
+    outbox_replies_dropped_total.inc(context=context)
+    log_info(logger, f"Очередь отправки переполнена: ответ ({context}) в чат {chat_id} не отправлен")
+
+
+class OutgoingMessage:
+    """Запрос к Bot API в очереди отправки"""
+
+    __slots__ = ('api', 'method', 'chat_id', 'args', 'kwargs', 'callback', 'attempts')
+
+    def __init__(self, api, method, chat_id, args, kwargs, callback=None):
+        self.api = api  # синхронный TeleBot бота, от имени которого отправляется запрос
+        self.method = method
+        self.chat_id = chat_id
+        self.args = args
+        self.kwargs = kwargs
+        self.callback = callback  # функция(результат), вызывается после отправки
+        self.attempts = 0
+
+    def merge(self, other):
+        """Объединение со следующим запросом того же чата; False, если нельзя.
+
+        Подряд идущие тексты склеиваются, из однотипных правок одного сообщения остается последняя.
+        """
+        if self.method in EDIT_METHODS and other.method == self.method:
+            if self.callback or other.callback or self.kwargs.get('message_id') != other.kwargs.get('message_id'):
+                return False
+            self.kwargs = other.kwargs
+            return True
+        if self.method != 'send_message' or other.method != 'send_message':
+            return False
+        if self.callback or other.callback or self.kwargs != other.kwargs or 'reply_markup' in self.kwargs:
+            return False
+        text = self.args[0] + COALESCE_SEPARATOR + other.args[0]
+        if len(text) > MAX_MESSAGE_LENGTH:
+            return False
+        self.args = (text,) + self.args[1:]
+        return True
+
+
+class Outbox:
+    """Очередь исходящих сообщений с учетом ограничений Telegram.
+
+    Обработчики ставят сообщения в очередь и не ждут сети. Фоновые потоки отправляют их,
+    соблюдая общий лимит бота и лимиты на чат (для групп строже), сохраняя порядок внутри чата.
+    Подряд идущие текстовые сообщения одному чату объединяются, ответы 429 повторяются
+    после паузы retry_after; повторный 429 за время паузы приостанавливает и общий лимит бота. Одна очередь может обслуживать несколько ботов (BotOutbox):
+    очереди и лимиты ведутся по паре (бот, чат), общий лимит — по боту.
+    """
+
+    def __init__(self, api, logger, workers=None, global_rate=None, chat_rate=None, group_rate=None, max_size=None, max_retries=None):
+        self.api = api  # синхронный TeleBot бота по умолчанию
+        self.logger = logger
+        self.max_size = max_size or int(os.getenv('OUTBOX_MAX_SIZE', '100000'))
+        self.max_retries = max_retries or int(os.getenv('OUTBOX_MAX_RETRIES', '5'))
+        self._bots = KeyedTokenBuckets(global_rate or float(os.getenv('OUTBOX_RATE', '25')))
+        self._private = KeyedTokenBuckets(chat_rate or float(os.getenv('OUTBOX_CHAT_RATE', '1')))
+        self._groups = KeyedTokenBuckets(group_rate or float(os.getenv('OUTBOX_GROUP_RATE', str(20 / 60))))
+        self._queues = {}  # (api, chat_id) -> deque сообщений; чат без очереди отправляется или пуст
+        self._ready = []  # куча (не раньше, номер, (api, chat_id)) чатов, готовых к отправке
+        self._seq = itertools.count()
+        self._throttled = {}  # api -> время окончания паузы по последнему ответу 429
+        self._size = 0
+        self._busy = 0  # сообщения, отправляемые прямо сейчас
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f'outbox-{i}', daemon=True)
+            for i in range(workers or int(os.getenv('OUTBOX_WORKERS', '4')))
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def send_message(self, chat_id, text, **kwargs):
+        """Постановка текстового сообщения в очередь"""
+        return self.call('send_message', chat_id, text, **kwargs)
+
+    def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        """Постановка в очередь правки текста сообщения"""
+        return self.call('edit_message_text', chat_id, text=text, message_id=message_id, **kwargs)
+
+    def call(self, method, chat_id, *args, callback=None, api=None, **kwargs):
+        """Постановка в очередь вызова метода TeleBot; False, если очередь переполнена.
+
+        chat_id передается первым аргументом, а если других позиционных аргументов нет — по имени.
+        api — клиент бота, от имени которого отправляется запрос (по умолчанию self.api).
+        """
+        message = OutgoingMessage(api or self.api, method, chat_id, args, kwargs, callback)
+        key = (message.api, chat_id)
+        with self._cond:
+            queue = self._queues.get(key)
+            if queue and queue[-1].merge(message):
+                outbox_messages_total.inc(result='coalesced')
+                return True
+            if self._size >= self.max_size:
+                outbox_messages_total.inc(result='dropped')
+                return False
+            if queue is None:
+                queue = self._queues[key] = deque()
+                heapq.heappush(self._ready, (time.monotonic(), next(self._seq), key))
+                self._cond.notify()
+            queue.append(message)
+            self._size += 1
+            outbox_queue_size.set(self._size)
+        return True
+
+    def stop(self, timeout=None):
+        """Остановка после отправки очереди (не дольше timeout секунд)"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self._size + self._busy and (deadline is None or time.monotonic() < deadline):
+                self._cond.wait(0.1 if deadline is None else max(0.0, min(0.1, deadline - time.monotonic())))
+            self._stopped = True
+            self._cond.notify_all()
+            unsent = self._size
+        for thread in self._threads:
+            thread.join()
+        if unsent:
+            log_info(self.logger, f"Не отправлено сообщений при остановке: {unsent}")
+
+    def _bucket(self, key):
+        # Отрицательные id у групп и каналов
+        chat_id = key[1]
+        return (self._groups if isinstance(chat_id, int) and chat_id < 0 else self._private).get(key)
+
+    def _reschedule(self, key, delay=0.0):
+        """Возврат чата в кучу готовых (вызывается под блокировкой)"""
+        if self._queues.get(key):
+            heapq.heappush(self._ready, (time.monotonic() + delay, next(self._seq), key))
+            self._cond.notify()
+        else:
+            self._queues.pop(key, None)
+
+    def _take(self):
+        """Следующее сообщение, которое можно отправить; None при остановке"""
+        with self._cond:
+            while not self._stopped:
+                if not self._ready:
+                    self._cond.wait()
+                    continue
+                not_before, _, key = self._ready[0]
+                delay = not_before - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._ready)
+                # Общий лимит бота проверяется без ожидания: занятый бот не задерживает воркеры других ботов
+                chat_bucket, bot_bucket = self._bucket(key), self._bots.get(key[0])
+                delay = max(chat_bucket.wait_time(), bot_bucket.wait_time())
+                if delay > 0:
+                    heapq.heappush(self._ready, (time.monotonic() + delay, next(self._seq), key))
+                    continue
+                chat_bucket.try_acquire()
+                bot_bucket.try_acquire()
+                message = self._queues[key].popleft()
+                self._size -= 1
+                self._busy += 1
+                outbox_queue_size.set(self._size)
+                return message
+        return None
+
+    def _run(self):
+        while True:
+            message = self._take()
+            if message is None:
+                return
+            key = (message.api, message.chat_id)
+            delay = 0.0
+            started = time.perf_counter()
+            try:
+                method = getattr(message.api, message.method)
+                if message.args:
+                    result = method(message.chat_id, *message.args, **message.kwargs)
+                else:
+                    result = method(chat_id=message.chat_id, **message.kwargs)
+            except Exception as e:
+                pause = retry_after(e)
+                message.attempts += 1
+                if pause is not None and message.attempts <= self.max_retries:
+                    outbox_messages_total.inc(result='retried')
+                    self._bucket(key).pause(pause)
+                    delay = pause
+                    with self._cond:
+                        # Telegram не сообщает, какой лимит превышен: 429 на повторе или во время паузы
+                        # по предыдущему 429 значит, что превышен общий лимит бота, а не лимит чата
+                        now = time.monotonic()
+                        if message.attempts > 1 or self._throttled.get(message.api, 0) > now:
+                            self._bots.get(message.api).pause(pause)
+                        self._throttled[message.api] = max(self._throttled.get(message.api, 0), now + pause)
+                        self._queues.setdefault(key, deque()).appendleft(message)
+                        self._size += 1
+                else:
+                    outbox_messages_total.inc(result='failed')
+                    log_error(self.logger, e, f"отправка сообщения в чат {message.chat_id}")
+            else:
+                outbox_send_seconds.observe(time.perf_counter() - started, method=message.method)
+                outbox_messages_total.inc(result='sent')
+                if message.callback is not None:
+                    try:
+                        message.callback(result)
+                    except Exception as e:
+                        log_error(self.logger, e, f"обработка отправленного сообщения в чат {message.chat_id}")
+            with self._cond:
+                self._busy -= 1
+                outbox_queue_size.set(self._size)
+                self._reschedule(key, delay)
+                self._cond.notify_all()
+
+
+class BotOutbox:
+    """Очередь отправки одного бота в общей очереди процесса (несколько ботов в одном процессе)"""
+
+    def __init__(self, outbox, api):
+        self.outbox = outbox
+        self.api = api  # синхронный TeleBot бота
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self.call('send_message', chat_id, text, **kwargs)
+
+    def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        return self.call('edit_message_text', chat_id, text=text, message_id=message_id, **kwargs)
+
+    def call(self, method, chat_id, *args, **kwargs):
+        return self.outbox.call(method, chat_id, *args, api=self.api, **kwargs)
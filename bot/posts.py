@@ -0,0 +1,124 @@
+import functools
+import os
+import threading
+from sqlalchemy import select
+from db import dialect_insert, session_scope
+from metrics import counter
+from models import Giveaway, GiveawayPost
+from services import join_markup, post_text
+from utils import log_error, log_info
+
+MAX_CAPTION_LENGTH = 1024
+# Тип медиа розыгрыша -> метод TeleBot, принимающий file_id
+MEDIA_METHODS = {'photo': 'send_photo', 'video': 'send_video', 'gif': 'send_animation', 'document': 'send_document'}
+
+post_updates_total = counter('giveaway_post_updates_total', 'Правки постов розыгрышей с числом участников')
+posts_published_total = counter('giveaway_posts_published_total', 'Посты розыгрышей, поставленные в очередь (kind: media, text)')
+
+
+def record_post(giveaway_id, message):
+    """Сохранение опубликованного поста (callback очереди отправки)"""
+    with session_scope('record_post') as session:
+        stmt = dialect_insert(GiveawayPost.__table__, session.get_bind()).values(
+            giveaway_id=giveaway_id, chat_id=message.chat.id, message_id=message.message_id,
+        )
+        session.execute(stmt.on_conflict_do_nothing(index_elements=['chat_id', 'message_id']))
+
+
+def publish_giveaway(outbox, logger, giveaway, chat_ids):
+    """Публикация поста розыгрыша в каналы через очередь отправки.
+
+    Медиа отправляется по сохраненному file_id, поэтому файл не загружается ни в один канал;
+    каналы обслуживаются воркерами очереди параллельно. Пост с кнопкой участия записывается
+    в giveaway_posts после отправки. Возвращает число каналов, куда пост поставлен в очередь.
+    """
+    text = post_text(giveaway)
+    markup = join_markup(giveaway.id, giveaway.join_button_text)
+    method = MEDIA_METHODS.get(giveaway.media_type) if giveaway.media_file_id else None
+    callback = functools.partial(record_post, giveaway.id)
+    queued = 0
+    for telegram_id in chat_ids:
+        chat_id = int(telegram_id) if telegram_id.lstrip('-').isdigit() else telegram_id
+        if method and len(text) <= MAX_CAPTION_LENGTH:
+            ok = outbox.call(method, chat_id, giveaway.media_file_id, caption=text, reply_markup=markup, callback=callback)
+        else:
+            # Длинное описание не помещается в подпись: медиа и текст с кнопкой отдельными сообщениями
+            if method:
+                outbox.call(method, chat_id, giveaway.media_file_id)
+            ok = outbox.call('send_message', chat_id, text, reply_markup=markup, callback=callback)
+        if ok:
+            queued += 1
+            posts_published_total.inc(kind='media' if method else 'text')
+    log_info(logger, f"Розыгрыш {giveaway.id}: пост поставлен в очередь для {queued} из {len(chat_ids)} каналов")
+    return queued
+
+
+class PostUpdater:
+    """Обновление числа участников на кнопке постов розыгрышей.
+
+    Розыгрыши с новыми участниками копятся в множестве, раз в interval секунд для каждого из них
+    читается giveaways.participants_count и правится клавиатура его постов — не чаще одного раза
+    за интервал на розыгрыш, сколько бы заявок ни пришло. Посты правит бот, опубликовавший их.
+    """
+
+    def __init__(self, bots, logger, interval=None):
+        self.bots = bots  # bot_id -> бот процесса с outbox
+        self.logger = logger
+        self.interval = interval or float(os.getenv('POST_UPDATE_INTERVAL', '5'))
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def on_participants_added(self, counts):
+        """Слушатель JoinBuffer: {giveaway_id: добавлено}"""
+        with self._lock:
+            self._dirty.update(counts)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='post-updater', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.update()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.update()
+            except Exception as e:
+                log_error(self.logger, e, "обновление постов розыгрышей")
+
+    def update(self):
+        """Правка постов накопившихся розыгрышей; возвращает число поставленных в очередь правок"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return 0
+        with session_scope('post_update') as session:
+            posts = session.execute(
+                select(Giveaway.id, Giveaway.bot_id, Giveaway.join_button_text, Giveaway.participants_count,
+                       GiveawayPost.chat_id, GiveawayPost.message_id)
+                .join(GiveawayPost, GiveawayPost.giveaway_id == Giveaway.id)
+                .where(Giveaway.id.in_(dirty), Giveaway.bot_id.in_(list(self.bots)))
+            ).all()
+        for giveaway_id, bot_id, button_text, participants, chat_id, message_id in posts:
+            self.bots[bot_id].outbox.call(
+                'edit_message_reply_markup', chat_id,
+                message_id=message_id, reply_markup=join_markup(giveaway_id, button_text, participants),
+            )
+        post_updates_total.inc(len(posts))
+        return len(posts)
+
+
+def start_post_updater(bots, logger, join_buffer):
+    """Создание и запуск общего для ботов bots ({bot_id: бот}) обновления постов по новым участникам"""
+    updater = PostUpdater(bots, logger)
+    join_buffer.listeners.append(updater.on_participants_added)
+    return updater.start()
@@ -0,0 +1,66 @@
+import os
+import sys
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    """Статистический профилировщик всех потоков процесса.
+
+    Раз в interval секунд снимает стеки потоков (sys._current_frames) и считает одинаковые.
+    Результат — свернутые стеки «поток;функция;...;функция N», как у py-spy record -f raw:
+    его понимают flamegraph.pl и speedscope. Включается и выключается во время работы бота.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or float(os.getenv('PROFILER_INTERVAL', '0.01'))
+        self._stacks = Counter()
+        self._samples = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Начало записи; False, если профилировщик уже работает"""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._stacks.clear()
+            self._samples = 0
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Окончание записи; возвращает свернутые стеки (пустая строка, если профилировщик не работал)"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return ''
+        self._stopped.set()
+        thread.join()
+        return self.collapsed()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self._stacks.most_common())
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._stacks[';'.join(reversed(stack))] += 1
+            self._samples += 1
@@ -0,0 +1,86 @@
+import threading
+import time
+from cache import TTLCache
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        """Резервирование токена; возвращает, сколько секунд нужно подождать перед действием"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def try_acquire(self):
+        """Взятие токена без ожидания; False, если токенов нет"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def wait_time(self):
+        """Через сколько секунд появится токен (без взятия)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Взятие токена с ожиданием"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Запрет действий на seconds секунд (например, по retry_after от Telegram)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+
+class KeyedTokenBuckets:
+    """Отдельный token bucket на каждый ключ (например, чат) с ограничением числа ключей"""
+
+    def __init__(self, rate, capacity=None, max_keys=100000, bucket_ttl=3600):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = TTLCache(max_keys, bucket_ttl)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = TokenBucket(self.rate, self.capacity)
+                    self._buckets.set(key, bucket)
+        return bucket
+
+    def acquire(self, key):
+        self.get(key).acquire()
+
+
+def retry_after(error):
+    """Пауза из ответа Telegram 429 (retry_after) или None"""
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    parameters = (getattr(error, 'result_json', None) or {}).get('parameters') or {}
+    return parameters.get('retry_after', 1)
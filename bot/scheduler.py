@@ -0,0 +1,331 @@
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import or_, select, update
+from db import session_scope
+from draw import choose_winners, load_participant_ids, new_seed, save_winners
+from join import JoinFlushError
+from metrics import counter, gauge
+from models import User, Giveaway
+from outbox import log_dropped
+from utils import log_error, log_info
+
+giveaways_finished_total = counter('giveaways_finished_total', 'Завершенные розыгрыши (reason: time, participants)')
+giveaways_scheduled = gauge('giveaways_scheduled', 'Розыгрыши, ожидающие завершения')
+giveaway_draw_retries_total = counter('giveaway_draw_retries_total', 'Отложенные проведения розыгрышей (reason: error, busy)')
+
+MAX_WAIT = 60  # секунды; ограничение ожидания на случай перевода системных часов
+
+
+class DrawInProgress(Exception):
+    """Розыгрыш проводит другая реплика (или проводила и остановилась: тогда он освободится по истечении аренды)"""
+
+
+class GiveawayScheduler:
+    """Завершение розыгрышей по времени окончания и по числу участников.
+
+    Сроки хранятся в min-куче в памяти, которая при запуске заполняется одним
+    упорядоченным чтением незавершенных розыгрышей (частичный индекс по end_datetime).
+    Число участников для розыгрышей с лимитом берется из giveaways.participants_count
+    и обновляется по мере записи заявок (JoinBuffer.listeners), без COUNT(*). Заявки пишут
+    и другие реплики, поэтому счетчики периодически сверяются с базой (sync_limits).
+    """
+
+    def __init__(self, logger, finish, workers=None, retry_interval=None, limits_sync_interval=None):
+        self.logger = logger
+        self.finish = finish  # функция(giveaway_id), проводит розыгрыш
+        self.retry_interval = retry_interval or float(os.getenv('DRAW_RETRY_INTERVAL', '60'))
+        self.limits_sync_interval = limits_sync_interval or float(os.getenv('SCHEDULER_LIMITS_SYNC', '5'))
+        self._limits_syncing = False
+        self._heap = []  # (end_datetime, giveaway_id)
+        self._deadlines = {}  # giveaway_id -> end_datetime (записи кучи с другим сроком устарели)
+        self._limits = {}  # giveaway_id -> [лимит, участников]
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or int(os.getenv('SCHEDULER_WORKERS', '2')),
+            thread_name_prefix='giveaway-finish',
+        )
+
+    def rehydrate(self, session, bot_ids):
+        """Загрузка незавершенных розыгрышей ботов bot_ids из базы"""
+        deadlines = session.execute(
+            select(Giveaway.id, Giveaway.end_datetime)
+            .where(Giveaway.finished_at.is_(None), Giveaway.end_datetime.isnot(None), Giveaway.bot_id.in_(bot_ids))
+            .order_by(Giveaway.end_datetime)
+        ).all()
+        limits = {
+            giveaway_id: (limit, count)
+            for giveaway_id, limit, count in session.execute(
+                select(Giveaway.id, Giveaway.participants_limit, Giveaway.participants_count)
+                .where(Giveaway.finished_at.is_(None), Giveaway.end_by_participants.is_(True), Giveaway.participants_limit.isnot(None),
+                       Giveaway.bot_id.in_(bot_ids))
+            )
+        }
+        with self._cond:
+            # Результат уже упорядочен по end_datetime, то есть является корректной кучей
+            self._heap = [(end_datetime, giveaway_id) for giveaway_id, end_datetime in deadlines]
+            self._deadlines = {giveaway_id: end_datetime for giveaway_id, end_datetime in deadlines}
+            self._limits = {giveaway_id: [limit, count] for giveaway_id, (limit, count) in limits.items()}
+            self._update_gauge()
+            self._cond.notify()
+        for giveaway_id, (limit, count) in list(self._limits.items()):
+            if count >= limit:
+                self._due(giveaway_id, 'participants')
+        log_info(self.logger, f"Планировщик: {len(deadlines)} розыгрышей по времени, {len(limits)} по числу участников")
+
+    def schedule(self, giveaway_id, end_datetime=None, participants_limit=None, participants=0):
+        """Постановка розыгрыша в расписание"""
+        with self._cond:
+            if end_datetime is not None:
+                self._deadlines[giveaway_id] = end_datetime
+                heapq.heappush(self._heap, (end_datetime, giveaway_id))
+                self._cond.notify()
+            if participants_limit:
+                self._limits[giveaway_id] = [participants_limit, participants]
+            self._update_gauge()
+
+    def on_participants_added(self, counts):
+        """Учет новых участников: {giveaway_id: добавлено}"""
+        reached = []
+        with self._cond:
+            for giveaway_id, added in counts.items():
+                state = self._limits.get(giveaway_id)
+                if state is None:
+                    continue
+                state[1] += added
+                if state[1] >= state[0]:
+                    reached.append(giveaway_id)
+        for giveaway_id in reached:
+            self._due(giveaway_id, 'participants')
+
+    def sync_limits(self):
+        """Сверка числа участников розыгрышей с лимитом с giveaways.participants_count"""
+        with self._cond:
+            giveaway_ids = list(self._limits)
+        if not giveaway_ids:
+            return
+        with session_scope('scheduler_limits') as session:
+            rows = session.execute(
+                select(Giveaway.id, Giveaway.participants_count, Giveaway.finished_at).where(Giveaway.id.in_(giveaway_ids))
+            ).all()
+        reached, finished = [], []
+        with self._cond:
+            for giveaway_id, count, finished_at in rows:
+                state = self._limits.get(giveaway_id)
+                if state is None:
+                    continue
+                if finished_at is not None:
+                    finished.append(giveaway_id)  # проведен другой репликой
+                    continue
+                # Счетчик в базе уже включает заявки, записанные этим процессом
+                state[1] = max(state[1], count or 0)
+                if state[1] >= state[0]:
+                    reached.append(giveaway_id)
+        for giveaway_id in finished:
+            self._claim(giveaway_id)
+        for giveaway_id in reached:
+            self._due(giveaway_id, 'participants')
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='giveaway-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._executor.shutdown(wait=wait)
+
+    def _update_gauge(self):
+        giveaways_scheduled.set(len(self._deadlines.keys() | self._limits.keys()))
+
+    def _run(self):
+        synced = time.monotonic()
+        with self._cond:
+            while not self._stopped:
+                now = datetime.utcnow()
+                while self._heap and self._heap[0][0] <= now:
+                    end_datetime, giveaway_id = heapq.heappop(self._heap)
+                    if self._deadlines.get(giveaway_id) == end_datetime:
+                        self._due(giveaway_id, 'time')
+                timeout = MAX_WAIT
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+                if self._limits:
+                    since_sync = time.monotonic() - synced
+                    if since_sync >= self.limits_sync_interval and not self._limits_syncing:
+                        synced = time.monotonic()
+                        self._limits_syncing = True
+                        self._executor.submit(self._sync_limits)
+                    timeout = min(timeout, max(self.limits_sync_interval - since_sync, 0.1))
+                self._cond.wait(timeout)
+
+    def _sync_limits(self):
+        try:
+            self.sync_limits()
+        except Exception as e:
+            log_error(self.logger, e, "сверка числа участников розыгрышей")
+        finally:
+            with self._cond:
+                self._limits_syncing = False
+
+    def _claim(self, giveaway_id):
+        """Снятие розыгрыша с расписания; False, если он уже завершается по другому условию"""
+        with self._cond:
+            by_time = self._deadlines.pop(giveaway_id, None) is not None
+            by_participants = self._limits.pop(giveaway_id, None) is not None
+            self._update_gauge()
+            return by_time or by_participants
+
+    def _due(self, giveaway_id, reason):
+        if self._claim(giveaway_id):
+            self._executor.submit(self._finish, giveaway_id, reason)
+
+    def _finish(self, giveaway_id, reason):
+        try:
+            if self.finish(giveaway_id):
+                giveaways_finished_total.inc(reason=reason)
+            return
+        except DrawInProgress as e:
+            giveaway_draw_retries_total.inc(reason='busy')
+            log_info(self.logger, f"Розыгрыш {giveaway_id} {e}, повторная попытка через {self.retry_interval:.0f} с")
+        except Exception as e:
+            giveaway_draw_retries_total.inc(reason='error')
+            log_error(self.logger, e, f"завершение розыгрыша {giveaway_id} (повтор через {self.retry_interval:.0f} с)")
+        # Розыгрыш остается незавершенным и проводится снова по сроку
+        self.schedule(giveaway_id, end_datetime=datetime.utcnow() + timedelta(seconds=self.retry_interval))
+
+
+class GiveawayFinisher:
+    """Проведение розыгрыша: запись буфера участников, выбор победителей с проверкой подписки, объявление.
+
+    Розыгрыш захватывается арендой (draw_started_at): при нескольких репликах его проводит одна,
+    и только реплика с его ботом. Подписка проверяется без открытой транзакции, итоги и finished_at
+    записываются одной транзакцией, пока аренда не истекла. При сбое аренда снимается, прием заявок
+    возобновляется, а планировщик повторяет попытку; после падения реплики розыгрыш проводится
+    заново по истечении аренды. Подписка проверяется и итоги объявляются от имени бота розыгрыша.
+    """
+
+    def __init__(self, bots, logger, join_buffer, lease=None):
+        self.bots = bots  # bot_id -> бот процесса с outbox и membership (необязательно)
+        self.logger = logger
+        self.join_buffer = join_buffer
+        self.lease = lease or timedelta(seconds=float(os.getenv('DRAW_LEASE', '600')))
+
+    def __call__(self, giveaway_id):
+        bot_id = self.join_buffer.close(giveaway_id)
+        try:
+            return self._draw(giveaway_id)
+        except DrawInProgress:
+            raise  # заявки не принимаются, пока розыгрыш проводит другая реплика
+        except Exception:
+            self.join_buffer.reopen(giveaway_id, bot_id)
+            raise
+
+    def _draw(self, giveaway_id):
+        # Розыгрыш проводится только после записи всех принятых заявок: при сбое записи
+        # JoinFlushError прерывает попытку, и планировщик повторяет ее позже
+        self.join_buffer.flush()
+        if self.join_buffer.pending(giveaway_id):
+            raise JoinFlushError(f"заявки в розыгрыш {giveaway_id} еще не записаны")
+        started = datetime.utcnow()
+        with session_scope('giveaway_claim') as session:
+            claimed = session.execute(
+                update(Giveaway)
+                .where(Giveaway.id == giveaway_id, Giveaway.finished_at.is_(None), Giveaway.bot_id.in_(list(self.bots)),
+                       or_(Giveaway.draw_started_at.is_(None), Giveaway.draw_started_at < started - self.lease))
+                .values(draw_started_at=started)
+            ).rowcount
+            if not claimed:
+                drawing_since = session.scalar(
+                    select(Giveaway.draw_started_at)
+                    .where(Giveaway.id == giveaway_id, Giveaway.finished_at.is_(None), Giveaway.bot_id.in_(list(self.bots)))
+                )
+                if drawing_since is not None:
+                    raise DrawInProgress(f"проводится другой репликой с {drawing_since:%H:%M:%S}")
+                return False
+        try:
+            with session_scope('giveaway_participants') as session:
+                bot_id, winners_count = session.execute(
+                    select(Giveaway.bot_id, Giveaway.winners_count).where(Giveaway.id == giveaway_id)
+                ).one()
+                ids = load_participant_ids(session, giveaway_id)
+            bot = self.bots[bot_id]
+            membership = getattr(bot, 'membership', None)
+            seed = new_seed()
+            verify = membership.winner_verifier(giveaway_id) if membership else None
+            winner_ids = choose_winners(ids, winners_count or 1, seed, verify)
+            with session_scope('giveaway_finish') as session:
+                finished = session.execute(
+                    update(Giveaway)
+                    .where(Giveaway.id == giveaway_id, Giveaway.finished_at.is_(None), Giveaway.draw_started_at == started)
+                    .values(finished_at=datetime.utcnow(), draw_seed=seed)
+                ).rowcount
+                if finished:
+                    save_winners(session, giveaway_id, winner_ids)
+        except Exception:
+            self._release(giveaway_id, started)
+            raise
+        if not finished:
+            # Аренда истекла, и розыгрыш перехватила другая реплика
+            log_info(self.logger, f"Розыгрыш {giveaway_id}: итоги не записаны, его проводит другая реплика")
+            return False
+        log_info(self.logger, f"Розыгрыш {giveaway_id} проведен: {len(ids)} участников, победители {winner_ids}, seed {seed}")
+        try:
+            with session_scope('giveaway_announce') as session:
+                self.announce(session, bot.outbox, giveaway_id, winner_ids)
+        except Exception as e:
+            log_error(self.logger, e, f"объявление итогов розыгрыша {giveaway_id}")
+        return True
+
+    def _release(self, giveaway_id, started):
+        """Снятие аренды после сбоя, чтобы повторная попытка не ждала ее истечения"""
+        try:
+            with session_scope('giveaway_release') as session:
+                session.execute(
+                    update(Giveaway)
+                    .where(Giveaway.id == giveaway_id, Giveaway.finished_at.is_(None), Giveaway.draw_started_at == started)
+                    .values(draw_started_at=None)
+                )
+        except Exception as e:
+            log_error(self.logger, e, f"снятие аренды розыгрыша {giveaway_id}")
+
+    def announce(self, session, sender, giveaway_id, winner_ids):
+        """Сообщение создателю розыгрыша о победителях (sender — очередь отправки бота или синхронный TeleBot)"""
+        giveaway = session.get(Giveaway, giveaway_id)
+        creator = session.get(User, giveaway.creator_id) if giveaway.creator_id else None
+        if creator is None:
+            return
+        winners = {user.id: user for user in session.scalars(select(User).where(User.id.in_(winner_ids)))}
+        lines = [
+            f"{position}. " + (f"@{winners[user_id].username}" if winners[user_id].username else f"ID {winners[user_id].telegram_id}")
+            for position, user_id in enumerate(winner_ids, start=1)
+        ]
+        text = f"🎉 Розыгрыш #{giveaway_id} завершен!\n" + ("Победители:\n" + '\n'.join(lines) if lines else "Участников, выполнивших условия, нет.")
+        if not sender.send_message(creator.telegram_id, text):
+            log_dropped(self.logger, creator.telegram_id, 'announce')
+
+
+def start_scheduler(bots, logger, join_buffer):
+    """Создание общего для ботов bots ({bot_id: бот}) планировщика, загрузка расписания из базы и запуск"""
+    scheduler = GiveawayScheduler(logger, GiveawayFinisher(bots, logger, join_buffer))
+    join_buffer.listeners.append(scheduler.on_participants_added)
+    # Если база пока недоступна, список идущих розыгрышей загрузит периодическое обновление
+    join_buffer.open.bot_ids = list(bots)
+    try:
+        with session_scope('scheduler_rehydrate') as session:
+            scheduler.rehydrate(session, list(bots))
+            join_buffer.open.load(session, list(bots))
+    except Exception as e:
+        log_error(logger, e, "загрузка расписания розыгрышей")
+    return scheduler.start()
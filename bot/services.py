@@ -0,0 +1,289 @@
+from datetime import datetime
+import pytz
+from sqlalchemy import select, func
+from telebot import types
+from db import dialect_insert
+from join import JOIN_REJECTED
+from models import Channel, Giveaway, GiveawayChannel, SupportRequest
+from users import resolve_user_id, find_user_id
+from utils import log_info
+
+# Общая бизнес-логика для синхронного (TeleBot) и асинхронного (AsyncTeleBot) режимов.
+# Функции принимают синхронную сессию: в async-режиме они вызываются через AsyncSession.run_sync.
+
+HELP_TEXT = (
+    'Доступные команды:\n'
+    '/new_giveaway — создать розыгрыш\n'
+    '/my_giveaways — мои розыгрыши\n'
+    '/export — выгрузка участников розыгрыша\n'
+    '/add_channel — добавить канал\n'
+    '/my_channels — мои каналы\n'
+    '/support — написать в поддержку'
+)
+START_TEXT = 'Привет! Я бот-рандомайзер для розыгрышей.'
+DEFAULT_BUTTON_TEXT = 'Участвовать'
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+END_DATETIME_FORMATS = ('%Y-%m-%d %H:%M', '%d.%m.%Y %H:%M')
+JOINED_TEXT = 'Вы участвуете в розыгрыше!'
+ALREADY_JOINED_TEXT = 'Вы уже участвуете в этом розыгрыше'
+GIVEAWAY_FINISHED_TEXT = 'Розыгрыш уже завершен'
+JOIN_REJECTED_TEXT = 'Заявка не принята: слишком много заявок, попробуйте позже'
+PAGE_SIZE = 10
+PAGE_CALLBACK_PREFIX = 'page:'
+DESCRIPTION_PREVIEW_LENGTH = 100
+SUMMARY_PROBLEMS_LIMIT = 50
+
+
+def extract_media(message):
+    """Тип и file_id медиа из сообщения мастера создания розыгрыша.
+
+    Сохраняется только file_id: при публикации файл не загружается заново ни в один канал.
+    """
+    if message.photo:
+        # Из размеров фото берется самый большой, порядок списка не гарантирован
+        largest = max(message.photo, key=lambda size: (size.width * size.height, size.file_size or 0))
+        return {'media_type': 'photo', 'media_file_id': largest.file_id}
+    if message.animation:
+        return {'media_type': 'gif', 'media_file_id': message.animation.file_id}
+    if message.video:
+        return {'media_type': 'video', 'media_file_id': message.video.file_id}
+    if message.document:
+        return {'media_type': 'document', 'media_file_id': message.document.file_id}
+    return {}
+
+
+def parse_winners_count(text):
+    """Количество победителей или None, если введено не число"""
+    if not text or not text.isdigit():
+        return None
+    return int(text)
+
+
+def parse_end_datetime(text):
+    """Время окончания, введенное по Москве, в UTC (без tzinfo) или None"""
+    for fmt in END_DATETIME_FORMATS:
+        try:
+            local = datetime.strptime((text or '').strip(), fmt)
+        except ValueError:
+            continue
+        return MOSCOW_TZ.localize(local).astimezone(pytz.utc).replace(tzinfo=None)
+    return None
+
+
+def parse_channel_ids(text):
+    """Номера каналов из /my_channels через запятую или пробел; [] для 'нет', None при ошибке ввода"""
+    text = (text or '').strip()
+    if text.lower() == 'нет':
+        return []
+    parts = [part for part in text.replace(',', ' ').split() if part]
+    if not parts or not all(part.isdigit() for part in parts):
+        return None
+    return list(dict.fromkeys(int(part) for part in parts))
+
+
+def parse_button_text(text):
+    """Текст кнопки участия с учетом варианта 'по умолчанию'"""
+    return text if text.lower() != 'по умолчанию' else DEFAULT_BUTTON_TEXT
+
+
+def join_reply(joined):
+    """Ответ на нажатие кнопки участия по результату JoinBuffer.add"""
+    if joined is None:
+        return GIVEAWAY_FINISHED_TEXT
+    if joined == JOIN_REJECTED:
+        return JOIN_REJECTED_TEXT
+    return JOINED_TEXT if joined else ALREADY_JOINED_TEXT
+
+
+def join_markup(giveaway_id, button_text=None, participants=0):
+    """Клавиатура поста розыгрыша с кнопкой участия и числом участников"""
+    text = button_text or DEFAULT_BUTTON_TEXT
+    if participants:
+        text = f'{text} ({participants})'
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton(text, callback_data=f'join:{giveaway_id}'))
+    return markup
+
+
+def post_text(giveaway):
+    """Текст поста розыгрыша в канале: описание и условие завершения"""
+    if giveaway.end_datetime:
+        end = pytz.utc.localize(giveaway.end_datetime).astimezone(MOSCOW_TZ).strftime('%d.%m.%Y %H:%M')
+        return f"{giveaway.description}\n\nИтоги: {end} (МСК)"
+    if giveaway.participants_limit:
+        return f"{giveaway.description}\n\nИтоги — когда наберется {giveaway.participants_limit} участников"
+    return giveaway.description
+
+
+def create_giveaway(session, bot_id, tg_user, state, logger):
+    """Создание розыгрыша в боте bot_id по данным мастера; возвращает (розыгрыш, telegram_id его каналов).
+
+    Привязываются только каналы пользователя в этом боте: в них публикуется пост и на них нужна подписка.
+    """
+    creator_id = resolve_user_id(session, tg_user)
+    channels = []
+    if state.get('channel_ids'):
+        channels = session.execute(
+            select(Channel.id, Channel.telegram_id)
+            .where(Channel.id.in_(state['channel_ids']), Channel.owner_id == creator_id, Channel.bot_id == bot_id)
+        ).all()
+    giveaway = Giveaway(
+        bot_id=bot_id,
+        creator_id=creator_id,
+        description=state['description'],
+        prize=state['description'],
+        winners_count=state['winners_count'],
+        end_datetime=datetime.fromisoformat(state['end_datetime']) if state.get('end_datetime') else None,
+        end_by_participants=bool(state.get('participants_limit')),
+        participants_limit=state.get('participants_limit'),
+        join_button_text=state['button_text'],
+        media_type=state.get('media_type'),
+        media_file_id=state.get('media_file_id'),
+        channels=[GiveawayChannel(channel_id=channel_id) for channel_id, _ in channels],
+    )
+    session.add(giveaway)
+    session.commit()
+    log_info(logger, f"Создан новый розыгрыш пользователем {tg_user.username} (ID: {tg_user.id})")
+    return giveaway, [telegram_id for _, telegram_id in channels]
+
+
+def keyset_page(session, query, id_column, direction=None, cursor=None, size=PAGE_SIZE):
+    """Страница записей по убыванию id без OFFSET; возвращает (строки, есть предыдущая, есть следующая).
+
+    direction='next' — записи с id меньше cursor, 'prev' — больше cursor, None — первая страница.
+    """
+    if direction == 'prev':
+        rows = session.execute(query.where(id_column > cursor).order_by(id_column.asc()).limit(size + 1)).all()
+        return rows[:size][::-1], len(rows) > size, True
+    if direction == 'next':
+        query = query.where(id_column < cursor)
+    rows = session.execute(query.order_by(id_column.desc()).limit(size + 1)).all()
+    return rows[:size], direction == 'next', len(rows) > size
+
+
+def page_markup(kind, rows, has_prev, has_next):
+    """Кнопки перехода между страницами списка или None, если страница одна"""
+    buttons = []
+    if has_prev:
+        buttons.append(types.InlineKeyboardButton('◀️ Назад', callback_data=f'{PAGE_CALLBACK_PREFIX}{kind}:prev:{rows[0][0]}'))
+    if has_next:
+        buttons.append(types.InlineKeyboardButton('Далее ▶️', callback_data=f'{PAGE_CALLBACK_PREFIX}{kind}:next:{rows[-1][0]}'))
+    if not buttons:
+        return None
+    markup = types.InlineKeyboardMarkup()
+    markup.row(*buttons)
+    return markup
+
+
+def parse_page_callback(data):
+    """(список, направление, id) из callback_data кнопки страницы или None"""
+    if not data or not data.startswith(PAGE_CALLBACK_PREFIX):
+        return None
+    parts = data[len(PAGE_CALLBACK_PREFIX):].split(':')
+    if len(parts) != 3 or parts[0] not in LIST_PAGES or parts[1] not in ('prev', 'next') or not parts[2].isdigit():
+        return None
+    return parts[0], parts[1], int(parts[2])
+
+
+def preview(text, length=DESCRIPTION_PREVIEW_LENGTH):
+    """Начало текста для списка; обрезанный текст заканчивается многоточием"""
+    if text and len(text) > length:
+        return text[:length].rstrip() + '…'
+    return text
+
+
+def list_giveaways_page(session, bot_id, tg_user, direction=None, cursor=None):
+    """Страница списка розыгрышей пользователя в боте bot_id: (текст, клавиатура)"""
+    user_id = find_user_id(session, tg_user)
+    rows = []
+    if user_id:
+        query = (
+            select(Giveaway.id, func.substr(Giveaway.description, 1, DESCRIPTION_PREVIEW_LENGTH + 1))
+            .where(Giveaway.creator_id == user_id, Giveaway.bot_id == bot_id)
+        )
+        rows, has_prev, has_next = keyset_page(session, query, Giveaway.id, direction, cursor)
+    if not rows:
+        return 'У вас нет созданных розыгрышей.', None
+    text = '\n'.join([f"{giveaway_id}: {preview(description) or 'Без описания'}" for giveaway_id, description in rows])
+    return f'Ваши розыгрыши:\n{text}', page_markup('giveaways', rows, has_prev, has_next)
+
+
+def add_channels(session, bot_id, tg_user, channels, logger):
+    """Пакетное добавление проверенных каналов в бот bot_id одним INSERT ... ON CONFLICT по (bot_id, telegram_id).
+
+    Название уже добавленного канала обновляется, если канал принадлежит тому же пользователю.
+    Возвращает (добавлено, обновлено, принадлежит другому пользователю) — списки ResolvedChannel.
+    """
+    if not channels:
+        return [], [], []
+    owner_id = resolve_user_id(session, tg_user)
+    by_id = {str(channel.chat_id): channel for channel in channels}
+    existing = set(session.scalars(
+        select(Channel.telegram_id).where(Channel.bot_id == bot_id, Channel.telegram_id.in_(by_id))
+    ).all())
+    stmt = dialect_insert(Channel.__table__, session.get_bind()).values([
+        {'bot_id': bot_id, 'telegram_id': telegram_id, 'title': channel.title, 'owner_id': owner_id}
+        for telegram_id, channel in by_id.items()
+    ])
+    saved = set(session.scalars(
+        stmt.on_conflict_do_update(
+            index_elements=['bot_id', 'telegram_id'],
+            set_={'title': stmt.excluded.title},
+            where=Channel.__table__.c.owner_id == stmt.excluded.owner_id,
+        ).returning(Channel.telegram_id)
+    ).all())
+    session.commit()
+    added = [channel for telegram_id, channel in by_id.items() if telegram_id in saved and telegram_id not in existing]
+    updated = [channel for telegram_id, channel in by_id.items() if telegram_id in saved and telegram_id in existing]
+    foreign = [channel for telegram_id, channel in by_id.items() if telegram_id not in saved]
+    log_info(logger, f"Пользователь {tg_user.username} (ID: {tg_user.id}) добавил каналов: {len(added)}, обновил: {len(updated)}")
+    return added, updated, foreign
+
+
+def channels_summary(added, updated, foreign, rejected, invalid):
+    """Итоговое сообщение пакетного добавления каналов"""
+    lines = [f"Добавлено каналов: {len(added)}"]
+    if updated:
+        lines.append(f"Уже были добавлены: {len(updated)}")
+    problems = (
+        [f"{channel.source} — добавлен другим пользователем" for channel in foreign]
+        + [f"{channel.source} — {channel.error}" for channel in rejected]
+        + [f"{source} — {reason}" for source, reason in invalid]
+    )
+    if problems:
+        lines.append(f"Не добавлены ({len(problems)}):")
+        lines.extend(problems[:SUMMARY_PROBLEMS_LIMIT])
+        if len(problems) > SUMMARY_PROBLEMS_LIMIT:
+            lines.append(f"…и еще {len(problems) - SUMMARY_PROBLEMS_LIMIT}")
+    return '\n'.join(lines)
+
+
+def list_channels_page(session, bot_id, tg_user, direction=None, cursor=None):
+    """Страница списка каналов пользователя в боте bot_id: (текст, клавиатура)"""
+    user_id = find_user_id(session, tg_user)
+    rows = []
+    if user_id:
+        query = (
+            select(Channel.id, func.coalesce(Channel.title, Channel.telegram_id))
+            .where(Channel.owner_id == user_id, Channel.bot_id == bot_id)
+        )
+        rows, has_prev, has_next = keyset_page(session, query, Channel.id, direction, cursor)
+    if not rows:
+        return 'У вас нет добавленных каналов.', None
+    text = '\n'.join([f"{channel_id}: {title}" for channel_id, title in rows])
+    return f'Ваши каналы:\n{text}', page_markup('channels', rows, has_prev, has_next)
+
+
+# Список -> функция страницы (для кнопок перехода между страницами)
+LIST_PAGES = {
+    'giveaways': list_giveaways_page,
+    'channels': list_channels_page,
+}
+
+
+def create_support_request(session, bot_id, tg_user, text, logger):
+    """Сохранение обращения в поддержку бота bot_id"""
+    support = SupportRequest(bot_id=bot_id, user_id=resolve_user_id(session, tg_user), message=text)
+    session.add(support)
+    session.commit()
+    log_info(logger, f"Отправлено сообщение в поддержку от пользователя {tg_user.username} (ID: {tg_user.id})")
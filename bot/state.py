@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import sessionmaker
+import db
+from cache import TTLCache
+from metrics import counter, gauge
+from models import ConversationState
+from utils import log_error, log_info
+
+# Хранилище состояния диалогов (шаг мастера и накопленные данные) по (bot_id, chat_id):
+# у каждого бота процесса свои диалоги с чатом. Обработчики бота работают с ScopedStateStore
+# по chat_id. Данные диалога должны сериализоваться в JSON.
+
+state_evictions_total = counter('conversation_state_evictions_total', 'Удаленные незавершенные диалоги (reason: size, ttl)')
+state_size = gauge('conversation_states', 'Незавершенные диалоги в хранилище')
+
+
+class StateStore:
+    """Интерфейс хранилища состояния диалогов"""
+
+    def get(self, bot_id, chat_id):
+        """(шаг, данные) или None, если диалога нет"""
+        raise NotImplementedError
+
+    def set(self, bot_id, chat_id, step, data):
+        raise NotImplementedError
+
+    def delete(self, bot_id, chat_id):
+        raise NotImplementedError
+
+    def purge_expired(self):
+        """Удаление брошенных диалогов; возвращает их количество"""
+        return 0
+
+    def scoped(self, bot_id):
+        """Диалоги одного бота (хранилище для его обработчиков)"""
+        return ScopedStateStore(self, bot_id)
+
+
+class ScopedStateStore:
+    """Диалоги бота bot_id в общем хранилище: get/set/delete по chat_id"""
+
+    def __init__(self, store, bot_id):
+        self.store = store
+        self.bot_id = bot_id
+
+    def get(self, chat_id):
+        return self.store.get(self.bot_id, chat_id)
+
+    def set(self, chat_id, step, data):
+        self.store.set(self.bot_id, chat_id, step, data)
+
+    def delete(self, chat_id):
+        self.store.delete(self.bot_id, chat_id)
+
+
+class MemoryStateStore(StateStore):
+    """Хранилище в памяти процесса: LRU с ограничением размера и TTL"""
+
+    def __init__(self, maxsize=100000, ttl=86400):
+        self._cache = TTLCache(maxsize, ttl)
+        self._evictions = 0
+        self._expirations = 0
+        self._lock = threading.Lock()
+
+    def _record_evictions(self):
+        cache = self._cache
+        with self._lock:
+            if cache.evictions != self._evictions:
+                state_evictions_total.inc(cache.evictions - self._evictions, reason='size')
+                self._evictions = cache.evictions
+            if cache.expirations != self._expirations:
+                state_evictions_total.inc(cache.expirations - self._expirations, reason='ttl')
+                self._expirations = cache.expirations
+        state_size.set(len(cache))
+
+    def get(self, bot_id, chat_id):
+        item = self._cache.get((bot_id, chat_id))
+        if item is None:
+            self._record_evictions()
+            return None
+        step, data = item
+        return step, json.loads(data)
+
+    def set(self, bot_id, chat_id, step, data):
+        self._cache.set((bot_id, chat_id), (step, json.dumps(data, ensure_ascii=False)))
+        self._record_evictions()
+
+    def delete(self, bot_id, chat_id):
+        self._cache.pop((bot_id, chat_id))
+        state_size.set(len(self._cache))
+
+    def purge_expired(self):
+        purged = self._cache.purge_expired()
+        self._record_evictions()
+        return purged
+
+
+class SQLStateStore(StateStore):
+    """Хранилище в таблице conversation_states (PostgreSQL или SQLite), общее для нескольких реплик бота"""
+
+    def __init__(self, bind, ttl=86400):
+        self.bind = bind
+        self.ttl = timedelta(seconds=ttl)
+        self._sessions = sessionmaker(bind=bind, autoflush=False, info={'handler': 'state_store'})
+
+    def get(self, bot_id, chat_id):
+        with self._sessions() as session:
+            row = session.get(ConversationState, (bot_id, chat_id))
+            if row is None or row.updated_at < datetime.utcnow() - self.ttl:
+                return None
+            return row.step, json.loads(row.data or '{}')
+
+    def set(self, bot_id, chat_id, step, data):
+        values = {'bot_id': bot_id, 'chat_id': chat_id, 'step': step, 'data': json.dumps(data, ensure_ascii=False), 'updated_at': datetime.utcnow()}
+        stmt = db.dialect_insert(ConversationState.__table__, self.bind).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['bot_id', 'chat_id'],
+            set_={'step': stmt.excluded.step, 'data': stmt.excluded.data, 'updated_at': stmt.excluded.updated_at},
+        )
+        with self._sessions() as session:
+            session.execute(stmt)
+            session.commit()
+
+    def delete(self, bot_id, chat_id):
+        with self._sessions() as session:
+            session.execute(delete(ConversationState).where(ConversationState.bot_id == bot_id, ConversationState.chat_id == chat_id))
+            session.commit()
+
+    def purge_expired(self):
+        with self._sessions() as session:
+            result = session.execute(
+                delete(ConversationState).where(ConversationState.updated_at < datetime.utcnow() - self.ttl)
+            )
+            session.commit()
+        if result.rowcount:
+            state_evictions_total.inc(result.rowcount, reason='ttl')
+        return result.rowcount
+
+
+def create_state_store():
+    """Хранилище по настройкам окружения: STATE_STORE=memory|sql"""
+    backend = os.getenv('STATE_STORE', 'memory').lower()
+    ttl = int(os.getenv('STATE_TTL', '86400'))
+    if backend == 'sql':
+        url = os.getenv('STATE_DATABASE_URL')
+        if url:
+            bind = db.instrument_engine(create_engine(url, **db.engine_options(url)))
+            ConversationState.__table__.create(bind, checkfirst=True)
+        else:
+            bind = db.get_engine()
+        return SQLStateStore(bind, ttl=ttl)
+    return MemoryStateStore(maxsize=int(os.getenv('STATE_MAX_SIZE', '100000')), ttl=ttl)
+
+
+def start_state_purger(store, logger, interval=None):
+    """Фоновое удаление брошенных диалогов"""
+    interval = interval or float(os.getenv('STATE_PURGE_INTERVAL', '600'))
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval):
+            try:
+                purged = store.purge_expired()
+                if purged:
+                    log_info(logger, f"Удалено брошенных диалогов: {purged}")
+            except Exception as e:
+                log_error(logger, e, "очистка состояний диалогов")
+
+    threading.Thread(target=run, name='state-purger', daemon=True).start()
+    return stopped
@@ -0,0 +1,49 @@
+import os
+import re
+from utils import log_info
+
+# Несколько ботов в одном процессе: данные каждого бота (розыгрыши, каналы, обращения,
+# диалоги) отмечены bot_id — числовой частью его токена. Пользователи Telegram общие.
+
+
+def bot_id(token):
+    """Числовой id бота из токена"""
+    return int(token.split(':', 1)[0])
+
+
+def load_tokens():
+    """Токены ботов процесса без повторов.
+
+    TELEGRAM_TOKENS — через запятую, пробел или с новой строки, TELEGRAM_TOKENS_FILE — файл
+    с токенами (по одному в строке, # — комментарий), иначе один TELEGRAM_TOKEN.
+    Первый токен — основной бот (см. claim_legacy_rows).
+    """
+    text = os.getenv('TELEGRAM_TOKENS', '')
+    path = os.getenv('TELEGRAM_TOKENS_FILE')
+    if path:
+        with open(path, encoding='utf-8') as f:
+            text += '\n' + '\n'.join(line.split('#', 1)[0] for line in f)
+    tokens = [token for token in re.split(r'[\s,]+', text) if token]
+    if not tokens and os.getenv('TELEGRAM_TOKEN'):
+        tokens = [os.getenv('TELEGRAM_TOKEN')]
+    invalid = [token for token in tokens if not re.fullmatch(r'\d+:\S+', token)]
+    if invalid:
+        raise ValueError(f"токенов неверного формата: {len(invalid)}")
+    return list(dict.fromkeys(tokens))
+
+
+def claim_legacy_rows(main_bot_id, logger):
+    """Записи без bot_id (созданные до разделения данных по ботам) закрепляются за основным ботом"""
+    # SQLAlchemy импортируется здесь: load_tokens нужен при запуске до загрузки базы
+    from sqlalchemy import update
+    from db import session_scope
+    from models import Channel, Giveaway, SupportRequest
+    claimed = 0
+    with session_scope('claim_legacy_rows') as session:
+        for model in (Giveaway, Channel, SupportRequest):
+            claimed += session.execute(
+                update(model).where(model.bot_id.is_(None)).values(bot_id=main_bot_id)
+            ).rowcount
+    if claimed:
+        log_info(logger, f"За ботом {main_bot_id} закреплено записей, созданных до разделения по ботам: {claimed}")
+    return claimed
@@ -0,0 +1,66 @@
+import os
+from datetime import datetime
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from cache import TTLCache
+from db import dialect_insert
+from models import User
+
+# Кэш соответствия telegram_id -> users.id, общий для всех обработчиков.
+# Идентификатор пользователя не меняется, поэтому записи вытесняются только по размеру и TTL.
+user_ids = TTLCache(
+    maxsize=int(os.getenv('USER_CACHE_SIZE', '100000')),
+    ttl=int(os.getenv('USER_CACHE_TTL', '3600')),
+    name='users',
+)
+
+_PENDING = 'resolved_user_ids'
+
+
+def remember(session, ids):
+    """Добавление {telegram_id: users.id} в кэш после фиксации транзакции сессии"""
+    session.info.setdefault(_PENDING, {}).update(ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _cache_committed(session):
+    for telegram_id, user_id in session.info.pop(_PENDING, {}).items():
+        user_ids.set(telegram_id, user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    # Пользователь мог быть создан в отмененной транзакции
+    session.info.pop(_PENDING, None)
+
+
+def resolve_user_id(session, tg_user):
+    """users.id пользователя Telegram; пользователь создается при первом обращении.
+
+    Промах кэша обходится одним запросом INSERT ... ON CONFLICT DO UPDATE ... RETURNING id,
+    без гонки между проверкой и вставкой. Фиксирует транзакцию вызывающий код.
+    """
+    telegram_id = str(tg_user.id)
+    user_id = user_ids.get(telegram_id)
+    if user_id is not None:
+        return user_id
+    stmt = dialect_insert(User.__table__, session.get_bind()).values(
+        telegram_id=telegram_id, username=tg_user.username, created_at=datetime.utcnow(),
+    )
+    user_id = session.scalar(
+        stmt.on_conflict_do_update(index_elements=['telegram_id'], set_={'username': stmt.excluded.username})
+        .returning(User.id)
+    )
+    remember(session, {telegram_id: user_id})
+    return user_id
+
+
+def find_user_id(session, tg_user):
+    """users.id пользователя Telegram или None, если он еще не обращался к боту"""
+    telegram_id = str(tg_user.id)
+    user_id = user_ids.get(telegram_id)
+    if user_id is None:
+        user_id = session.scalar(select(User.id).where(User.telegram_id == telegram_id))
+        if user_id is not None:
+            user_ids.set(telegram_id, user_id)  # запись уже зафиксирована
+    return user_id
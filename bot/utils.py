@@ -1,10 +1,87 @@
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
 from datetime import datetime
 import pytz
+from metrics import counter
+
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_DATEFMT = '%Y-%m-%d %H:%M:%S'
+
+# Доля логируемых команд пользователей (1 — все), задается в setup_logging
+_command_sample_rate = 1.0
+_listener = None
+
+# Обработчик, в котором выполняется код (задается instrumentation.instrument_handlers)
+current_handler = contextvars.ContextVar('current_handler', default=None)
+errors_total = counter('errors_total', 'Ошибки, записанные в лог (handler; background — вне обработчиков)')
+
+class MoscowTimeFormatter(logging.Formatter):
+    """Форматирование с московским временем; строка времени кэшируется на секунду"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cached_second = None
+        self._cached_time = None
+
+    def formatTime(self, record, datefmt=None):
+        datefmt = datefmt or LOG_DATEFMT
+        second = int(record.created)
+        if second != self._cached_second or datefmt != LOG_DATEFMT:
+            formatted = datetime.fromtimestamp(second, MOSCOW_TZ).strftime(datefmt)
+            if datefmt != LOG_DATEFMT:
+                return formatted
+            self._cached_second, self._cached_time = second, formatted
+        return self._cached_time
+
+class JsonFormatter(MoscowTimeFormatter):
+    """Запись лога одной строкой JSON; поля из extra={'fields': {...}} добавляются как есть"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def _stop_listener():
+    """Запись оставшихся в очереди сообщений и остановка потока логирования"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(_stop_listener)
+
+def _file_handler(log_file):
+    """Файловый обработчик с ротацией: LOG_ROTATION=size|time|none"""
+    rotation = os.getenv('LOG_ROTATION', 'size').lower()
+    backup_count = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    if rotation == 'size':
+        return logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+            backupCount=backup_count, encoding='utf-8',
+        )
+    if rotation == 'time':
+        return logging.handlers.TimedRotatingFileHandler(
+            log_file, when=os.getenv('LOG_ROTATE_WHEN', 'midnight'), backupCount=backup_count, encoding='utf-8',
+        )
+    return logging.FileHandler(log_file, encoding='utf-8')
 
 def setup_logging():
     """Настройка логирования для бота"""
+    global _command_sample_rate, _listener
     # Создаем директорию для логов если её нет
     log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
     os.makedirs(log_dir, exist_ok=True)
@@ -12,20 +89,11 @@ def setup_logging():
     # Путь к файлу логов
     log_file = os.path.join(log_dir, 'logs.txt')
     
-    # Настройка форматирования с московским временем
-    class MoscowTimeFormatter(logging.Formatter):
-        def formatTime(self, record, datefmt=None):
-            moscow_tz = pytz.timezone('Europe/Moscow')
-            dt = datetime.fromtimestamp(record.created, moscow_tz)
-            if datefmt:
-                return dt.strftime(datefmt)
-            else:
-                return dt.strftime('%Y-%m-%d %H:%M:%S')
-    
-    formatter = MoscowTimeFormatter(
-        '%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    # Форматирование с московским временем, при LOG_FORMAT=json — строки JSON
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = MoscowTimeFormatter(LOG_FORMAT, datefmt=LOG_DATEFMT)
     
     # Настройка логгера
     logger = logging.getLogger('RandomLuckBot')
@@ -33,9 +101,10 @@ def setup_logging():
     
     # Очищаем существующие обработчики
     logger.handlers.clear()
+    _stop_listener()
     
-    # Обработчик для файла
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    # Обработчик для файла (с ротацией)
+    file_handler = _file_handler(log_file)
     file_handler.setLevel(logging.INFO)
     file_handler.setFormatter(formatter)
     
@@ -44,9 +113,17 @@ def setup_logging():
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
     
-    # Добавляем обработчики к логгеру
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    _command_sample_rate = float(os.getenv('LOG_COMMAND_SAMPLE_RATE', '1'))
+    
+    if os.getenv('LOG_QUEUE', '1') == '1':
+        # Форматирование и запись выполняются в отдельном потоке, обработчики бота только кладут запись в очередь
+        _listener = logging.handlers.QueueListener(queue.SimpleQueue(), file_handler, console_handler, respect_handler_level=True)
+        logger.addHandler(logging.handlers.QueueHandler(_listener.queue))
+        _listener.start()
+    else:
+        # Добавляем обработчики к логгеру
+        logger.addHandler(file_handler)
+        logger.addHandler(console_handler)
     
     return logger
 
@@ -73,13 +150,22 @@ def log_bot_stop(logger):
     logger.info("🛑 Бот остановлен")
 
 def log_command(logger, user_id, username, command):
-    """Логирование команд пользователей"""
-    logger.info(f"👤 Пользователь {username} (ID: {user_id}) выполнил команду: /{command}")
+    """Логирование команд пользователей (с выборкой LOG_COMMAND_SAMPLE_RATE)"""
+    if _command_sample_rate < 1 and random.random() >= _command_sample_rate:
+        return
+    logger.info(f"👤 Пользователь {username} (ID: {user_id}) выполнил команду: /{command}",
+                extra={'fields': {'event': 'command', 'user_id': user_id, 'username': username, 'command': command}})
 
 def log_error(logger, error, context=""):
     """Логирование ошибок"""
+    errors_total.inc(handler=current_handler.get() or 'background')
     logger.error(f"❌ Ошибка {context}: {str(error)}")
 
+def log_slow_query(logger, seconds, statement, context=""):
+    """Логирование медленных запросов к базе данных"""
+    statement = ' '.join(statement.split())
+    logger.warning(f"🐢 Медленный запрос ({context}, {seconds * 1000:.0f} мс): {statement[:500]}")
+
 def log_info(logger, message):
     """Логирование информационных сообщений"""
     logger.info(f"ℹ️ {message}") 
\ No newline at end of file
@@ -0,0 +1,166 @@
+import hmac
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot import types
+from dispatcher import update_chat_key
+from metrics import counter, gauge
+from utils import log_error, log_info
+
+MAX_BODY_SIZE = 1024 * 1024
+
+webhook_updates_total = counter('webhook_updates_total', 'Апдейты, полученные через webhook (result: accepted, rejected, shed, invalid)')
+webhook_queue_size = gauge('webhook_queue_size', 'Апдейты в очередях обработчиков webhook')
+
+
+class UpdateWorkers:
+    """Пул потоков обработки апдейтов с ограниченными очередями.
+
+    Апдейты распределяются по потокам по ключу чата, поэтому апдейты одного чата
+    обрабатываются по порядку, а разных чатов — параллельно.
+    """
+
+    def __init__(self, process, logger, workers=8, queue_size=10000):
+        self.process = process  # функция(update)
+        self.logger = logger
+        per_worker = max(1, queue_size // workers)
+        self._queues = [queue.Queue(maxsize=per_worker) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), name=f'update-worker-{i}', daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def submit(self, update):
+        """Постановка апдейта в очередь без ожидания; False, если очередь переполнена"""
+        q = self._queues[hash(update_chat_key(update)) % len(self._queues)]
+        try:
+            q.put_nowait(update)
+        except queue.Full:
+            return False
+        webhook_queue_size.inc()
+        return True
+
+    def pending(self):
+        return sum(q.qsize() for q in self._queues)
+
+    def stop(self, timeout=None):
+        """Остановка после обработки уже принятых апдейтов (не дольше timeout секунд)"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for q in self._queues:
+            q.put(None)
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def _run(self, q):
+        while True:
+            update = q.get()
+            if update is None:
+                return
+            webhook_queue_size.dec()
+            try:
+                self.process(update)
+            except Exception as e:
+                log_error(self.logger, e, f"обработка апдейта {update.update_id}")
+
+
+def make_handler(path, secret_token, workers, overload):
+    """Класс обработчика HTTP-запросов Telegram"""
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass  # запросы не логируются: на каждый апдейт был бы отдельный вывод
+
+        def _respond(self, status, headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_POST(self):
+            if self.path != path:
+                self._respond(404)
+                return
+            if secret_token and not hmac.compare_digest(self.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), secret_token):
+                self._respond(403)
+                return
+            length = int(self.headers.get('Content-Length') or 0)
+            if length <= 0 or length > MAX_BODY_SIZE:
+                webhook_updates_total.inc(result='invalid')
+                self._respond(400)
+                return
+            try:
+                body = json.loads(self.rfile.read(length))
+                if not isinstance(body, dict):
+                    raise ValueError('апдейт должен быть JSON-объектом')
+                update = types.Update.de_json(body)
+            except (ValueError, TypeError, KeyError, AttributeError):
+                # Некорректный JSON или объект не в формате Update
+                webhook_updates_total.inc(result='invalid')
+                self._respond(400)
+                return
+            if workers.submit(update):
+                webhook_updates_total.inc(result='accepted')
+                self._respond(200)
+            elif overload == 'shed':
+                # Апдейт отбрасывается, Telegram не будет его повторять
+                webhook_updates_total.inc(result='shed')
+                self._respond(200)
+            else:
+                # Telegram повторит доставку позже
+                webhook_updates_total.inc(result='rejected')
+                self._respond(429, {'Retry-After': '1'})
+
+    return WebhookHandler
+
+
+class WebhookServer:
+    """Прием апдейтов через webhook: HTTP-сервер на стандартной библиотеке и пул обработчиков"""
+
+    def __init__(self, bot, logger, host=None, port=None, path=None, secret_token=None, workers=None, queue_size=None, overload=None):
+        self.bot = bot
+        self.logger = logger
+        self.host = host or os.getenv('WEBHOOK_HOST', '0.0.0.0')
+        self.port = port or int(os.getenv('WEBHOOK_PORT', '8443'))
+        self.path = path or os.getenv('WEBHOOK_PATH', '/webhook')
+        self.secret_token = secret_token or os.getenv('WEBHOOK_SECRET')
+        self.overload = (overload or os.getenv('WEBHOOK_OVERLOAD', 'reject')).lower()  # reject | shed
+        self.workers = UpdateWorkers(
+            lambda update: bot.process_new_updates([update]), logger,
+            workers=workers or int(os.getenv('WEBHOOK_WORKERS', '8')),
+            queue_size=queue_size or int(os.getenv('WEBHOOK_QUEUE_SIZE', '10000')),
+        )
+        self.httpd = ThreadingHTTPServer((self.host, self.port), make_handler(self.path, self.secret_token, self.workers, self.overload))
+        self.httpd.daemon_threads = True
+        self._started = False
+
+    def register(self, url):
+        """Регистрация webhook в Telegram"""
+        self.bot.remove_webhook()
+        self.bot.set_webhook(
+            url=url.rstrip('/') + self.path,
+            secret_token=self.secret_token,
+            max_connections=int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40')),
+        )
+
+    def serve_forever(self):
+        self._started = True
+        self.workers.start()
+        log_info(self.logger, f"Прием апдейтов через webhook на {self.host}:{self.port}{self.path}")
+        self.httpd.serve_forever()
+
+    def shutdown(self, timeout=None):
+        """Прекращение приема и обработка уже принятых апдейтов"""
+        if self._started:
+            self.httpd.shutdown()  # ожидает выхода из serve_forever
+        self.httpd.server_close()
+        if self._started:
+            self.workers.stop(timeout)
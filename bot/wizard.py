@@ -0,0 +1,164 @@
+from collections import namedtuple
+from datetime import datetime
+from channels import INVITE_LINK_TEXT, parse_channel_links
+from posts import publish_giveaway
+from services import (
+    extract_media, parse_channel_ids, parse_winners_count, parse_end_datetime, parse_button_text,
+    create_giveaway, add_channels, channels_summary, create_support_request,
+)
+
+# Мастера диалогов как конечный автомат: состояние (шаг и данные) хранится в StateStore,
+# обработчик шага получает сообщение и данные и возвращает переход.
+# Логика общая для синхронного и асинхронного режимов.
+
+# step — следующий шаг (None — диалог завершен), reply — ответ пользователю,
+# action(session, tg_user, data, bot) -> ответ — завершающее действие с базой данных,
+# prepare(tg_user, data, bot) — запросы к Bot API перед action, выполняются вне сессии и event loop
+Transition = namedtuple('Transition', 'step reply action prepare', defaults=(None, None, None, None))
+
+STEP_CONTENT_TYPES = ['text', 'photo', 'video', 'document', 'animation']
+
+CHANNELS_PROMPT = ("Укажите каналы для публикации розыгрыша (на них же нужна подписка): "
+                   "номера из /my_channels через запятую или 'нет'")
+
+# Команда -> (первый шаг, приглашение)
+WIZARD_COMMANDS = {
+    'new_giveaway': ('giveaway_media', "Пришлите медиа для розыгрыша (фото, видео или GIF)"),
+    'add_channel': ('add_channel', "Пришлите ссылки на каналы или группы, где вы и бот — администраторы "
+                                   "(можно несколько через пробел, запятую или с новой строки):"),
+    'support': ('support_message', "Опишите вашу проблему или вопрос:"),
+}
+
+
+def finish_giveaway(session, tg_user, data, bot):
+    giveaway, chat_ids = create_giveaway(session, bot.bot_id, tg_user, data, bot.logger)
+    scheduler = getattr(bot, 'scheduler', None)
+    if scheduler is not None:
+        scheduler.schedule(giveaway.id, giveaway.end_datetime, giveaway.participants_limit)
+    join_buffer = getattr(bot, 'join_buffer', None)
+    if join_buffer is not None:
+        join_buffer.open.add(giveaway.id, bot.bot_id)
+    if not chat_ids:
+        return "Розыгрыш успешно создан!"
+    published = publish_giveaway(bot.outbox, bot.logger, giveaway, chat_ids)
+    return f"Розыгрыш успешно создан и отправлен в каналы: {published}"
+
+
+def resolve_channels(tg_user, data, bot):
+    data['resolved'] = bot.channel_resolver.resolve(data['refs'], tg_user.id)
+
+
+def finish_add_channel(session, tg_user, data, bot):
+    accepted = [channel for channel in data['resolved'] if channel.chat_id is not None]
+    rejected = [channel for channel in data['resolved'] if channel.chat_id is None]
+    added, updated, foreign = add_channels(session, bot.bot_id, tg_user, accepted, bot.logger)
+    return channels_summary(added, updated, foreign, rejected, data['invalid'])
+
+
+def finish_support(session, tg_user, data, bot):
+    create_support_request(session, bot.bot_id, tg_user, data['text'], bot.logger)
+    return "Ваше сообщение отправлено в поддержку!"
+
+
+# === Создание розыгрыша ===
+def giveaway_media_step(message, data):
+    data.update(extract_media(message))
+    return Transition('giveaway_description', "Введите описание розыгрыша и приз")
+
+
+def giveaway_description_step(message, data):
+    data['description'] = message.text
+    return Transition('giveaway_channels', CHANNELS_PROMPT)
+
+
+def giveaway_channels_step(message, data):
+    channel_ids = parse_channel_ids(message.text)
+    if channel_ids is None:
+        return Transition('giveaway_channels', "Введите номера каналов из /my_channels через запятую или 'нет':")
+    data['channel_ids'] = channel_ids
+    return Transition('giveaway_winners', "Сколько будет победителей?")
+
+
+def giveaway_winners_step(message, data):
+    winners_count = parse_winners_count(message.text)
+    if winners_count is None:
+        return Transition('giveaway_winners', "Введите число победителей:")
+    data['winners_count'] = winners_count
+    return Transition('giveaway_endtime', "Укажите дату и время окончания по Москве (например, 2024-08-01 18:00) или число участников, при котором розыгрыш завершится")
+
+
+def giveaway_endtime_step(message, data):
+    text = (message.text or '').strip()
+    if text.isdigit() and int(text) > 0:
+        data['participants_limit'] = int(text)
+    else:
+        end_datetime = parse_end_datetime(text)
+        if end_datetime is None or end_datetime <= datetime.utcnow():
+            return Transition('giveaway_endtime', "Укажите будущие дату и время в формате 2024-08-01 18:00 или число участников:")
+        data['end_datetime'] = end_datetime.isoformat()
+    return Transition('giveaway_button', "Введите текст кнопки участия (по умолчанию 'Участвовать') или напишите 'по умолчанию'")
+
+
+def giveaway_button_step(message, data):
+    data['button_text'] = parse_button_text(message.text)
+    return Transition(action=finish_giveaway)
+
+
+# === Добавление канала ===
+def add_channel_step(message, data):
+    refs, invalid = parse_channel_links(message.text)
+    if not refs:
+        if any(reason == INVITE_LINK_TEXT for _, reason in invalid):
+            return Transition('add_channel', "Ссылки-приглашения не подходят: по ним бот не может найти канал. "
+                                             "Пришлите @username, числовой id канала или ссылку на пост в нем:")
+        return Transition('add_channel', "Не нашел ссылок на каналы. Пришлите ссылки вида https://t.me/channel или @channel:")
+    data['refs'], data['invalid'] = refs, invalid
+    return Transition(action=finish_add_channel, prepare=resolve_channels)
+
+
+# === Поддержка ===
+def support_message_step(message, data):
+    data['text'] = message.text
+    return Transition(action=finish_support)
+
+
+STEPS = {
+    'giveaway_media': giveaway_media_step,
+    'giveaway_description': giveaway_description_step,
+    'giveaway_channels': giveaway_channels_step,
+    'giveaway_winners': giveaway_winners_step,
+    'giveaway_endtime': giveaway_endtime_step,
+    'giveaway_button': giveaway_button_step,
+    'add_channel': add_channel_step,
+    'support_message': support_message_step,
+}
+
+
+def begin(store, chat_id, command):
+    """Начало диалога по команде; возвращает приглашение к первому шагу"""
+    step, prompt = WIZARD_COMMANDS[command]
+    store.set(chat_id, step, {})
+    return prompt
+
+
+def load_state(store, message):
+    """Фильтр обработчика шагов: есть ли у чата незавершенный диалог.
+
+    Состояние сохраняется в сообщении, чтобы обработчик не читал хранилище повторно.
+    """
+    message.wizard_state = store.get(message.chat.id)
+    return message.wizard_state is not None
+
+
+def advance(store, message):
+    """Выполнение шага диалога и сохранение следующего состояния; возвращает (шаг, переход, данные)"""
+    step, data = message.wizard_state
+    if step not in STEPS:  # шаг из старой версии бота
+        store.delete(message.chat.id)
+        return step, Transition(), data
+    transition = STEPS[step](message, data)
+    if transition.step:
+        store.set(message.chat.id, transition.step, data)
+    else:
+        store.delete(message.chat.id)
+    return step, transition, data
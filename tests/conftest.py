@@ -0,0 +1,55 @@
+import logging
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+# Модули бота импортируются плоско, как при запуске python bot/main.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bot'))
+# База выбирается при импорте db, поэтому URL задается до импорта модулей бота
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='randomluckbot-tests-'), 'test.db')
+
+import db  # noqa: E402
+from models import Base, Giveaway, GiveawayParticipant, User  # noqa: E402
+from users import user_ids as cached_user_ids  # noqa: E402
+
+BOT_ID = 1
+
+
+@pytest.fixture
+def logger():
+    return logging.getLogger('tests')
+
+
+@pytest.fixture
+def database():
+    """Пустая схема SQLite на каждый тест"""
+    engine = db.get_engine()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    cached_user_ids.clear()
+    yield engine
+
+
+def tg_user(user_id, username=None, is_bot=False):
+    """Пользователь Telegram в том виде, в каком его передают обработчики"""
+    return SimpleNamespace(id=user_id, username=username, is_bot=is_bot)
+
+
+def create_giveaway(participants=0, **fields):
+    """Розыгрыш бота BOT_ID с participants участниками; возвращает его id"""
+    with db.session_scope('tests') as session:
+        creator = User(telegram_id='100', username='creator')
+        session.add(creator)
+        session.flush()
+        giveaway = Giveaway(bot_id=BOT_ID, creator_id=creator.id, description='d', prize='p', winners_count=1, **fields)
+        session.add(giveaway)
+        session.flush()
+        users = [User(telegram_id=str(1000 + i)) for i in range(participants)]
+        session.add_all(users)
+        session.flush()
+        session.add_all([GiveawayParticipant(giveaway_id=giveaway.id, user_id=user.id) for user in users])
+        giveaway.participants_count = participants
+        return giveaway.id
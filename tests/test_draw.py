@@ -0,0 +1,27 @@
+from draw import choose_winners, pick_winners
+
+IDS = list(range(1, 1001))
+
+
+def test_same_seed_same_winners():
+    assert choose_winners(IDS, 5, 'seed') == choose_winners(list(IDS), 5, 'seed')
+    assert choose_winners(IDS, 5, 'seed') != choose_winners(IDS, 5, 'other seed')
+
+
+def test_prefix_does_not_depend_on_count():
+    assert pick_winners(IDS, 10, 'seed')[:3] == pick_winners(IDS, 3, 'seed')
+
+
+def test_rejected_candidates_replaced_in_seed_order():
+    order = pick_winners(IDS, 20, 'seed')
+    rejected = set(order[:4:2])
+
+    winners = choose_winners(IDS, 5, 'seed', verify=lambda user_ids: [i for i in user_ids if i not in rejected])
+
+    assert winners == [i for i in order if i not in rejected][:5]
+    assert winners == choose_winners(IDS, 5, 'seed', verify=lambda user_ids: [i for i in user_ids if i not in rejected])
+
+
+def test_fewer_participants_than_winners():
+    assert sorted(choose_winners([3, 1, 2], 5, 'seed')) == [1, 2, 3]
+    assert choose_winners([], 1, 'seed') == []
@@ -0,0 +1,65 @@
+from conftest import tg_user
+from fraud import FraudScreen
+
+
+def screen(logger, **options):
+    options = {'action': 'reject', 'window': 60, 'user_limit': 3, 'age_bucket': 1000,
+               'burst_min': 10, 'burst_share': 0.8, 'expected_joins': 1000, **options}
+    return FraudScreen(logger, **options)
+
+
+def test_bot_accounts_rejected(logger):
+    fs = screen(logger)
+    assert fs.reason(1, tg_user(5, is_bot=True)) == 'bot'
+    assert not fs.check(1, tg_user(5, is_bot=True))
+
+
+def test_user_rejected_after_limit_across_giveaways(logger):
+    fs = screen(logger)
+    results = [fs.check(giveaway_id, tg_user(7)) for giveaway_id in range(1, 9)]
+    # Точно считаются заявки с момента, когда оценка sketch превысила половину лимита
+    assert all(results[:fs.user_limit])
+    assert not any(results[fs.user_limit + fs.user_limit // 2 + 1:])
+    assert fs.reason(100, tg_user(7)) == 'user_rate'
+    assert fs.check(100, tg_user(8))
+
+
+def test_repeat_clicks_not_counted(logger):
+    fs = screen(logger)
+    for _ in range(10):
+        assert fs.check(1, tg_user(7))
+    assert fs.unique_joiners(1) == 1
+
+
+def test_burst_from_one_id_range(logger):
+    fs = screen(logger)
+    results = [fs.check(1, tg_user(5000 + i)) for i in range(20)]
+    assert all(results[:9])
+    assert not any(results[9:])
+    # Заявки из других диапазонов принимаются
+    assert fs.check(1, tg_user(10**6))
+
+
+def test_flag_mode_accepts_suspicious_joins(logger):
+    fs = screen(logger, action='flag')
+    assert all(fs.check(1, tg_user(5000 + i)) for i in range(20))
+    assert fs._giveaways.get(1).flagged == 11
+    assert fs._giveaways.get(1).rejected == 0
+
+
+def test_distinct_users_not_taken_for_repeats(logger):
+    fs = screen(logger, user_limit=10, burst_min=10**6, bloom_capacity=1000)
+    for user_id in range(20000):
+        fs.check(1, tg_user(user_id * 7919))
+    stats = fs._giveaways.get(1)
+    assert len(stats.seen.filters) > 1
+    assert 19000 < stats.unique.count() < 21000
+
+
+def test_screened_giveaways_capped(logger):
+    fs = screen(logger, max_giveaways=10)
+    for giveaway_id in range(100):
+        fs.check(giveaway_id, tg_user(giveaway_id * 10**6))
+    assert len(fs._giveaways) == 10
+    fs.close(99)
+    assert fs.unique_joiners(99) == 0
@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import func, select
+
+import db
+from conftest import BOT_ID, create_giveaway, tg_user
+from join import JoinBuffer, JoinFlushError
+from models import Giveaway, GiveawayParticipant
+
+
+def participants(giveaway_id):
+    with db.session_scope('tests') as session:
+        count = session.scalar(select(func.count()).where(GiveawayParticipant.giveaway_id == giveaway_id))
+        return count, session.get(Giveaway, giveaway_id).participants_count
+
+
+def test_add_only_to_open_giveaways(database, logger):
+    giveaway_id = create_giveaway()
+    buffer = JoinBuffer(logger)
+    buffer.open.add(giveaway_id, BOT_ID)
+
+    assert buffer.add(giveaway_id, tg_user(1), BOT_ID) is True
+    assert buffer.add(giveaway_id, tg_user(1), BOT_ID) is False
+    assert buffer.add(giveaway_id, tg_user(2), BOT_ID + 1) is None  # чужой бот
+    assert buffer.add(giveaway_id + 1, tg_user(2), BOT_ID) is None  # неизвестный розыгрыш
+    assert buffer.close(giveaway_id) == BOT_ID
+    assert buffer.add(giveaway_id, tg_user(3), BOT_ID) is None
+
+
+def test_flush_partial_failure_keeps_unwritten_rows(database, logger, monkeypatch):
+    giveaway_id = create_giveaway()
+    buffer = JoinBuffer(logger, max_statement_rows=2)
+    buffer.open.add(giveaway_id, BOT_ID)
+    added = []
+    buffer.listeners.append(added.append)
+    for user_id in range(5):
+        buffer.add(giveaway_id, tg_user(user_id), BOT_ID)
+
+    write = buffer._write
+    calls = []
+
+    def failing_write(rows):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            raise RuntimeError('база недоступна')
+        return write(rows)
+
+    monkeypatch.setattr(buffer, '_write', failing_write)
+    with pytest.raises(JoinFlushError):
+        buffer.flush()
+
+    assert participants(giveaway_id) == (2, 2)
+    assert added == [{giveaway_id: 2}]  # записанная часть передается слушателям
+    assert buffer.pending(giveaway_id)
+
+    assert buffer.flush() == 3
+    assert participants(giveaway_id) == (5, 5)
+    assert not buffer.pending(giveaway_id)
+
+
+def test_flush_skips_finished_giveaways(database, logger):
+    giveaway_id = create_giveaway()
+    buffer = JoinBuffer(logger)
+    buffer.open.add(giveaway_id, BOT_ID)
+    buffer.add(giveaway_id, tg_user(1), BOT_ID)
+    with db.session_scope('tests') as session:
+        session.get(Giveaway, giveaway_id).finished_at = func.now()
+
+    assert buffer.flush() == 1
+    assert participants(giveaway_id) == (0, 0)
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+import db
+from conftest import BOT_ID, create_giveaway, tg_user
+from join import JoinBuffer, JoinFlushError
+from membership import MembershipCheckError
+from models import Giveaway, GiveawayWinner
+from scheduler import DrawInProgress, GiveawayFinisher, GiveawayScheduler
+
+
+class Outbox:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+        return True
+
+
+def finisher(logger, membership=None):
+    buffer = JoinBuffer(logger)
+    bot = SimpleNamespace(bot_id=BOT_ID, outbox=Outbox(), membership=membership)
+    return GiveawayFinisher({BOT_ID: bot}, logger, buffer, lease=timedelta(minutes=10)), buffer, bot
+
+
+def giveaway_state(giveaway_id):
+    with db.session_scope('tests') as session:
+        giveaway = session.get(Giveaway, giveaway_id)
+        winners = session.scalars(select(GiveawayWinner.user_id).where(GiveawayWinner.giveaway_id == giveaway_id)).all()
+        return giveaway.finished_at, giveaway.draw_started_at, giveaway.draw_seed, winners
+
+
+def test_draw_records_winners_and_announces(database, logger):
+    giveaway_id = create_giveaway(participants=10)
+    finish, buffer, bot = finisher(logger)
+    buffer.open.add(giveaway_id, BOT_ID)
+
+    assert finish(giveaway_id) is True
+
+    finished_at, _, seed, winners = giveaway_state(giveaway_id)
+    assert finished_at is not None and seed and len(winners) == 1
+    assert len(bot.outbox.sent) == 1
+    assert buffer.add(giveaway_id, tg_user(1), BOT_ID) is None
+    assert finish(giveaway_id) is False  # уже проведен
+
+
+def test_active_lease_defers_draw(database, logger):
+    giveaway_id = create_giveaway(participants=3, draw_started_at=datetime.utcnow())
+    finish, _, _ = finisher(logger)
+
+    with pytest.raises(DrawInProgress):
+        finish(giveaway_id)
+    assert giveaway_state(giveaway_id)[0] is None
+
+    # Реплика, захватившая розыгрыш, упала: аренда истекла
+    with db.session_scope('tests') as session:
+        session.get(Giveaway, giveaway_id).draw_started_at = datetime.utcnow() - timedelta(hours=1)
+    assert finish(giveaway_id) is True
+
+
+def test_membership_failure_releases_lease(database, logger):
+    giveaway_id = create_giveaway(participants=3)
+
+    def verifier(_):
+        def verify(user_ids):
+            raise MembershipCheckError('Bot API недоступен')
+        return verify
+
+    finish, buffer, _ = finisher(logger, membership=SimpleNamespace(winner_verifier=verifier))
+    buffer.open.add(giveaway_id, BOT_ID)
+
+    with pytest.raises(MembershipCheckError):
+        finish(giveaway_id)
+
+    finished_at, draw_started_at, _, winners = giveaway_state(giveaway_id)
+    assert (finished_at, draw_started_at, winners) == (None, None, [])
+    assert buffer.add(giveaway_id, tg_user(1), BOT_ID) is True  # прием заявок возобновлен
+
+
+def test_unwritten_joins_abort_claim(database, logger, monkeypatch):
+    giveaway_id = create_giveaway()
+    finish, buffer, _ = finisher(logger)
+    buffer.open.add(giveaway_id, BOT_ID)
+    buffer.add(giveaway_id, tg_user(1), BOT_ID)
+    write = buffer._write
+
+    def failing_write(rows):
+        raise RuntimeError('база недоступна')
+
+    monkeypatch.setattr(buffer, '_write', failing_write)
+
+    with pytest.raises(JoinFlushError):
+        finish(giveaway_id)
+    assert giveaway_state(giveaway_id)[:2] == (None, None)  # аренда не захвачена
+
+    monkeypatch.setattr(buffer, '_write', write)
+    assert finish(giveaway_id) is True
+    assert len(giveaway_state(giveaway_id)[3]) == 1
+
+
+def test_failed_draw_is_retried(logger):
+    calls = []
+
+    def finish(giveaway_id):
+        calls.append(giveaway_id)
+        raise RuntimeError('сбой')
+
+    scheduler = GiveawayScheduler(logger, finish, workers=1, retry_interval=30)
+    scheduler._finish(7, 'time')
+
+    assert calls == [7]
+    retry_at = scheduler._deadlines[7]
+    assert timedelta(seconds=25) < retry_at - datetime.utcnow() <= timedelta(seconds=30)
+    scheduler.stop()
+
+
+def test_participant_limit_synced_from_database(database, logger):
+    giveaway_id = create_giveaway(participants=5, end_by_participants=True, participants_limit=5)
+    due = []
+    scheduler = GiveawayScheduler(logger, due.append, workers=1)
+    scheduler.schedule(giveaway_id, participants_limit=5, participants=0)
+
+    scheduler.sync_limits()
+    scheduler.stop()
+
+    assert due == [giveaway_id]